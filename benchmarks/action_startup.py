@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark start up time of the action entry points.
+
+Each sample loads an entry point module in a fresh interpreter, the time
+until its ``main`` could run and the number of modules loaded is reported
+for the full ``actions.py`` runner and the read-only ``query_actions.py``
+runner.
+
+Run from the root of the repository in an environment with the unit test
+requirements installed:
+
+    python3 benchmarks/action_startup.py --samples 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Executed in a fresh interpreter for every sample.  charmhelpers and the
+# basic layer are mocked the same way as in the unit tests.
+CHILD = '''
+import importlib
+import json
+import sys
+import time
+from unittest import mock
+
+sys.path[:0] = [{src!r}, {lib!r}]
+import charms_openstack.test_mocks
+charms_openstack.test_mocks.mock_charmhelpers()
+sys.modules['charms.layer'] = mock.MagicMock()
+import charmhelpers.core as ch_core
+ch_core.hookenv.charm_dir.return_value = {src!r}
+modules = len(sys.modules)
+start = time.perf_counter()
+importlib.import_module({module!r})
+print(json.dumps([time.perf_counter() - start,
+                  len(sys.modules) - modules]))
+'''
+
+ENTRY_POINTS = (
+    ('actions.py (full bootstrap)', 'actions.actions'),
+    ('query_actions.py (read-only)', 'actions.query_actions'),
+)
+
+
+def sample(module):
+    output = subprocess.check_output(
+        [sys.executable, '-c', CHILD.format(
+            src=SRC_DIR, lib=os.path.join(SRC_DIR, 'lib'), module=module)],
+        cwd=SRC_DIR, universal_newlines=True)
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--samples', type=int, default=10)
+    args = parser.parse_args()
+
+    print('{:32} {:>12} {:>12} {:>10}'.format(
+        'entry point', 'median (ms)', 'min (ms)', 'modules'))
+    for name, module in ENTRY_POINTS:
+        samples = [sample(module) for _ in range(args.samples)]
+        durations = [duration for duration, _ in samples]
+        print('{:32} {:12.1f} {:12.1f} {:10d}'.format(
+            name,
+            statistics.median(durations) * 1000,
+            min(durations) * 1000,
+            samples[-1][1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark CPU time of the configure_pools hook before and after indexing.
+
+Before the pool index the hook collapsed broker requests with
+``CephBrokerRq.add_op``, scanned every op of every broker request to look up
+the mirroring mode of each pool and added forwarded pools one by one with
+``add_op_create_replicated_pool``, all of which are quadratic in the number
+of pools.  The previous implementation is patched in to compare CPU time of
+a steady state hook, that is one where every pool is already mirrored.
+
+The hook environment and charmhelpers are mocked the same way as in
+``run.py``.  Run from the root of the repository in an environment with the
+unit test requirements installed:
+
+    python3 benchmarks/broker_index.py --pools 10000 --manual-pools 1000
+"""
+
+import argparse
+import contextlib
+import time
+from unittest import mock
+
+import run
+
+import charm.openstack.ceph_rbd_mirror as ceph_rbd_mirror
+import reactive.ceph_rbd_mirror_handlers as handlers
+
+
+def legacy_collapse_and_filter_broker_requests(self, broker_requests,
+                                               allowed_ops, require_vp=None):
+    require_vp = require_vp or {}
+    new_rq = ceph_rbd_mirror.ch_ceph.CephBrokerRq()
+    for rq in broker_requests:
+        for op in rq['ops']:
+            if op['op'] in allowed_ops and all(
+                    op.get(k) == v for k, v in require_vp.items()):
+                new_rq.add_op(op)
+    if new_rq.ops:
+        return new_rq
+
+
+class LegacyPoolLookup(object):
+    """Pool lookups scanning the broker requests for every pool."""
+
+    def __init__(self, broker_requests):
+        self.requests = [rq for _, rq in broker_requests if rq]
+        self.names = set(op['name'] for rq in self.requests
+                         for op in rq.ops if op['op'] == 'create-pool')
+
+    def __contains__(self, pool):
+        return pool in self.names
+
+    def __getitem__(self, pool):
+        for rq in self.requests:
+            for op in rq.ops:
+                if op['op'] == 'create-pool' and op['name'] == pool:
+                    return {'mode': op.get('rbd-mirroring-mode', 'pool')}
+        raise KeyError(pool)
+
+
+def legacy_add_replicated_pool_ops(self, rq, pools):
+    if not rq:
+        rq = ceph_rbd_mirror.ch_ceph.CephBrokerRq()
+    for pool, attrs in sorted(pools.items()):
+        rq.add_op_create_replicated_pool(
+            pool, replica_count=int(attrs['parameters']['size']),
+            pg_num=int(attrs['parameters']['pg_num']), app_name='rbd',
+            max_bytes=None, max_objects=None)
+    return rq
+
+
+@contextlib.contextmanager
+def legacy():
+    charm_class = ceph_rbd_mirror.CephRBDMirrorCharm
+    with mock.patch.object(charm_class, 'collapse_and_filter_broker_requests',
+                           legacy_collapse_and_filter_broker_requests), \
+            mock.patch.object(charm_class, 'broker_request_pool_index',
+                              lambda self, rqs: LegacyPoolLookup(rqs)), \
+            mock.patch.object(charm_class, 'add_replicated_pool_ops',
+                              legacy_add_replicated_pool_ops):
+        yield
+
+
+def measure(env, samples):
+    """Get lowest CPU time of the hook and the ops it sent."""
+    best = None
+    for _ in range(samples):
+        start = time.process_time()
+        handlers.configure_pools()
+        cpu = time.process_time() - start
+        best = cpu if best is None else min(best, cpu)
+    ops = env.endpoints['ceph-remote'].sent_rq.ops
+    return best, sorted(op['name'] for op in ops)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pools', type=int, default=10000)
+    parser.add_argument('--manual-pools', type=int, default=1000,
+                        help='Pools without a broker request')
+    parser.add_argument('--samples', type=int, default=3)
+    args = parser.parse_args()
+
+    env = run.Environment(args.pools, 0, 0.0, args.manual_pools, 'pool')
+    try:
+        with env.patched():
+            # Record every pool as mirrored without querying the fake
+            # cluster, as a previous hook would have
+            with mock.patch.object(
+                    ceph_rbd_mirror.CephRBDMirrorCharm, 'mirror_pools_enable',
+                    lambda self, pools: ceph_rbd_mirror.ConcurrentResult(
+                        {pool: [] for pool in pools}, {}, [])):
+                handlers.configure_pools()
+            with legacy():
+                before, before_ops = measure(env, args.samples)
+            after, after_ops = measure(env, args.samples)
+            assert env.rbd_calls() == 0
+    finally:
+        env.cleanup()
+    assert before_ops == after_ops
+
+    print('pools: {}, manually created pools: {}'.format(
+        args.pools, args.manual_pools))
+    print('before (per-pool scan): {:8.3f}s CPU'.format(before))
+    print('after  (pool index):    {:8.3f}s CPU'.format(after))
+
+
+if __name__ == '__main__':
+    main()
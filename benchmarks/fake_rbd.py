@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fake ``rbd`` executable serving synthetic mirror data.
+
+Installed on PATH as ``rbd`` by the benchmark runner, and as ``ceph`` to
+serve the ``rbd mirror status`` admin socket command of the daemon.
+Behaviour is controlled through environment variables:
+
+FAKE_RBD_DATA     Path to JSON file with pool data, as generated by
+                  ``synthetic.rbd_data``.  Mutating commands write it back.
+FAKE_RBD_CALLS    Path to file each invocation appends one line to.
+FAKE_RBD_LATENCY  Seconds to sleep on every invocation, defaults to 0.
+"""
+
+import fcntl
+import json
+import os
+import sys
+import time
+
+
+# Options taking a value, they may appear anywhere on the command line
+OPTIONS_WITH_VALUE = ('--id', '--cluster', '--format', '-p', '--pool',
+                      '--admin-daemon')
+
+# Image replayer state reported through the admin socket, by image state
+DAEMON_IMAGE_STATES = {
+    'replaying': 'Replaying',
+    'stopped': 'Stopped',
+}
+
+
+def parse_args(argv):
+    options = {}
+    args = []
+    argv = list(argv)
+    while argv:
+        arg = argv.pop(0)
+        if arg in OPTIONS_WITH_VALUE:
+            options[arg] = argv.pop(0)
+        elif arg.startswith('--'):
+            options[arg] = True
+        else:
+            args.append(arg)
+    return options, args
+
+
+def image_status(name, state):
+    description = 'local image is primary'
+    if state.endswith('replaying'):
+        description = 'replaying, ' + json.dumps({
+            'bytes_per_second': 0.0,
+            'entries_behind_primary': sum(name.encode()) % 10,
+            'entries_per_second': 1.0,
+            'non_primary_position': {
+                'entry_tid': 1, 'object_number': 1, 'tag_tid': 1},
+            'primary_position': {
+                'entry_tid': 1, 'object_number': 1, 'tag_tid': 1},
+            'replay_state': 'idle',
+        }, separators=(',', ':'))
+    return {
+        'name': name,
+        'global_id': name,
+        'state': state,
+        'description': description,
+        'last_update': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def pool_status(pool, verbose):
+    states = {}
+    for state in pool['images'].values():
+        state = state.split('+')[-1]
+        states[state] = states.get(state, 0) + 1
+    health = 'OK'
+    if 'error' in states:
+        health = 'ERROR'
+    elif set(states) - set(('replaying', 'stopped')):
+        health = 'WARNING'
+    result = {'summary': {'health': health, 'states': states}}
+    if verbose:
+        result['images'] = [image_status(name, state)
+                            for name, state in pool['images'].items()]
+    return result
+
+
+def daemon_status(data):
+    return {'pool_replayers': [{
+        'pool': pool,
+        'instance_id': 'synthetic',
+        'leader_instance_id': 'synthetic',
+        'leader': True,
+        'instances': [],
+        'image_replayers': [
+            {'name': '{}/{}'.format(pool, name),
+             'state': DAEMON_IMAGE_STATES.get(state.split('+')[-1],
+                                              'Starting')}
+            for name, state in pool_data['images'].items()],
+    } for pool, pool_data in sorted(data.items())
+        if pool_data['mode'] != 'disabled']}
+
+
+def run(options, args, data):
+    """Execute command, return output and whether data was modified."""
+    if '--admin-daemon' in options and args == ['rbd', 'mirror', 'status']:
+        return json.dumps(daemon_status(data)), False
+    if args[:2] == ['mirror', 'pool']:
+        verb = args[2]
+        if verb == 'peer':
+            # mirror pool peer add <pool> <client>@<cluster>
+            args = args[:2] + ['peer'] + args[4:]
+        pool = args[3]
+        pool_data = data[pool]
+        if verb == 'info':
+            return json.dumps({'mode': pool_data['mode'],
+                               'peers': pool_data['peers']}), False
+        if verb == 'status':
+            return json.dumps(
+                pool_status(pool_data, '--verbose' in options)), False
+        if verb == 'enable':
+            pool_data['mode'] = args[4]
+            return '', True
+        if verb == 'peer':
+            client_name, cluster_name = args[4].split('@')
+            pool_data['peers'].append({'uuid': pool,
+                                       'cluster_name': cluster_name,
+                                       'client_name': client_name})
+            return '', True
+        if verb in ('promote', 'demote'):
+            return '{}d {} mirrored images'.format(
+                verb.capitalize(), len(pool_data['images'])), False
+    if args[:2] == ['mirror', 'image'] and args[2] == 'resync':
+        return 'Flagged image for resync from primary', False
+    if args == ['ls']:
+        return json.dumps(list(data[options['-p']]['images'])), False
+    if args[0] == 'info':
+        pool, image = args[1].split('/')
+        state = data[pool]['images'][image]
+        return json.dumps({'name': image, 'mirroring': {
+            'state': 'enabled' if state else 'disabled'}}), False
+    raise NotImplementedError(' '.join(args))
+
+
+def main(argv):
+    latency = float(os.environ.get('FAKE_RBD_LATENCY', 0))
+    if latency:
+        time.sleep(latency)
+    with open(os.environ['FAKE_RBD_CALLS'], 'a') as calls:
+        fcntl.flock(calls, fcntl.LOCK_EX)
+        calls.write(' '.join(argv) + '\n')
+    options, args = parse_args(argv)
+    mutating = (args[:2] == ['mirror', 'pool'] and
+                args[2] in ('enable', 'peer'))
+    with open(os.environ['FAKE_RBD_DATA'], 'r+') as data_file:
+        fcntl.flock(data_file,
+                    fcntl.LOCK_EX if mutating else fcntl.LOCK_SH)
+        data = json.load(data_file)
+        output, modified = run(options, args, data)
+        if modified:
+            data_file.seek(0)
+            data_file.truncate()
+            json.dump(data, data_file)
+    if output:
+        print(output)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Scale benchmarks for the charm handlers and actions.
+
+A fake ``rbd`` executable is put on PATH and serves synthetic data for the
+requested number of pools and images, the charm code runs unmodified with
+the hook environment mocked the same way as in the unit tests.
+
+For each scenario wall time, number of ``rbd`` invocations and peak memory
+allocated by Python in the charm process are reported.
+
+Run from the root of the repository in an environment with the unit test
+requirements installed:
+
+    python3 benchmarks/run.py --pools 1000 --images 100 --latency 0.01
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest import mock
+
+import yaml
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCHMARKS_DIR, '..', 'src')
+sys.path.append(SRC_DIR)
+sys.path.append(os.path.join(SRC_DIR, 'lib'))
+
+# Mock out charmhelpers and the basic layer the same way the unit tests do.
+import charms_openstack.test_mocks  # noqa: E402
+charms_openstack.test_mocks.mock_charmhelpers()
+sys.modules['charms.layer'] = mock.MagicMock()
+
+import charms.reactive as reactive  # noqa: E402
+import charmhelpers.core as ch_core  # noqa: E402
+
+import actions.actions as actions  # noqa: E402
+import charm.openstack.ceph_rbd_mirror as ceph_rbd_mirror  # noqa: E402
+import charm.openstack.ceph_rbd_mirror_actions as rbd_actions  # noqa: E402
+import reactive.ceph_rbd_mirror_handlers as handlers  # noqa: E402
+
+import synthetic  # noqa: E402
+
+
+class FakeCephBrokerRq(object):
+    """Broker request replacement as charmhelpers is mocked out."""
+
+    api_version = 1
+
+    def __init__(self):
+        self.ops = []
+
+    def set_ops(self, ops):
+        self.ops = ops
+
+    def add_op(self, op):
+        if op not in self.ops:
+            self.ops.append(op)
+
+    def add_op_create_replicated_pool(self, name, **kwargs):
+        self.add_op(dict(op='create-pool', name=name, **kwargs))
+
+
+class FakeKV(dict):
+    """In-memory unitdata replacement."""
+
+    def set(self, key, value):
+        self[key] = json.loads(json.dumps(value))
+
+    def unset(self, key):
+        self.pop(key, None)
+
+    def flush(self):
+        pass
+
+
+def charm_config():
+    with open(os.path.join(SRC_DIR, 'config.yaml')) as f:
+        options = yaml.safe_load(f)['options']
+    return {name: option.get('default') for name, option in options.items()}
+
+
+class Environment(object):
+    """Fake rbd executable, synthetic endpoints and mocked hook tools."""
+
+    def __init__(self, pools, images, latency, manual_pools, mode,
+                 units=1, image_states=synthetic.IMAGE_STATES):
+        self.tmpdir = tempfile.mkdtemp(prefix='rbd-mirror-bench-')
+        self.bin_dir = os.path.join(self.tmpdir, 'bin')
+        os.mkdir(self.bin_dir)
+        for name in ('rbd', 'ceph'):
+            os.symlink(os.path.join(BENCHMARKS_DIR, 'fake_rbd.py'),
+                       os.path.join(self.bin_dir, name))
+        # The fake ``ceph`` serves the admin socket of the daemon
+        self.admin_socket = os.path.join(self.tmpdir, 'rbd-mirror.asok')
+        open(self.admin_socket, 'w').close()
+        self.images = images
+        self.image_states = image_states
+        self.data_file = os.path.join(self.tmpdir, 'rbd-data.json')
+        self.calls_file = os.path.join(self.tmpdir, 'rbd-calls.log')
+        with open(self.data_file, 'w') as f:
+            json.dump(synthetic.rbd_data(pools, images, mode=mode,
+                                         states=image_states), f)
+        open(self.calls_file, 'w').close()
+        os.environ['PATH'] = '{}:{}'.format(self.bin_dir, os.environ['PATH'])
+        os.environ['FAKE_RBD_DATA'] = self.data_file
+        os.environ['FAKE_RBD_CALLS'] = self.calls_file
+        os.environ['FAKE_RBD_LATENCY'] = str(latency)
+        pool_map = synthetic.endpoint_pools(pools)
+        self.endpoints = {
+            'ceph-local': synthetic.Endpoint(
+                'ceph-local', pool_map,
+                synthetic.broker_requests(pools, manual=manual_pools)),
+            'ceph-remote': synthetic.Endpoint('ceph-remote', pool_map, []),
+        }
+        self.kv = FakeKV()
+        self.config = charm_config()
+        self.action_params = {}
+        # The benchmarked unit is the leader, pools are sharded across units
+        self.leader_settings = {}
+        if units > 1:
+            self.leader_settings['pool-shard-units'] = json.dumps(
+                ['ceph-rbd-mirror/{}'.format(i) for i in range(units)])
+
+    def add_pool(self):
+        """Add one pool to the endpoints and to the fake cluster."""
+        pools = self.endpoints['ceph-local'].pools
+        name = synthetic.pool_name(len(pools))
+        pools[name] = dict(synthetic.endpoint_pools(1)[synthetic.pool_name(0)])
+        with open(self.data_file) as f:
+            data = json.load(f)
+        data[name] = synthetic.rbd_data(
+            1, self.images,
+            states=self.image_states)[synthetic.pool_name(0)]
+        with open(self.data_file, 'w') as f:
+            json.dump(data, f)
+
+    def cleanup(self):
+        shutil.rmtree(self.tmpdir)
+
+    def rbd_calls(self):
+        with open(self.calls_file) as f:
+            return sum(1 for _ in f)
+
+    def reset_rbd_calls(self):
+        open(self.calls_file, 'w').close()
+
+    @contextlib.contextmanager
+    def provide_charm_instance(self):
+        # A new instance per hook, as in a real hook execution.
+        yield ceph_rbd_mirror.CephRBDMirrorCharm(config=self.config)
+
+    def endpoint_from_flag(self, flag):
+        return self.endpoints[flag.split('.')[0]]
+
+    def endpoint_from_name(self, name):
+        return self.endpoints[name]
+
+    @contextlib.contextmanager
+    def patched(self):
+        patches = [
+            mock.patch.object(reactive, 'endpoint_from_flag',
+                              self.endpoint_from_flag),
+            mock.patch.object(reactive, 'endpoint_from_name',
+                              self.endpoint_from_name),
+            mock.patch.object(reactive, 'is_flag_set',
+                              lambda flag: not flag.startswith(
+                                  'config.changed.')),
+            mock.patch.object(handlers.charm, 'provide_charm_instance',
+                              self.provide_charm_instance),
+            mock.patch.object(actions.charms_openstack.charm,
+                              'provide_charm_instance',
+                              self.provide_charm_instance),
+            mock.patch.object(ceph_rbd_mirror.ch_ceph, 'CephBrokerRq',
+                              FakeCephBrokerRq),
+            mock.patch.object(ch_core.unitdata, 'kv', lambda: self.kv),
+            mock.patch.object(ch_core.hookenv, 'action_get',
+                              self.action_params.get),
+            mock.patch.object(ch_core.hookenv, 'action_uuid',
+                              lambda: 'benchmark'),
+            mock.patch.object(ch_core.hookenv, 'leader_get',
+                              self.leader_settings.get),
+            mock.patch.object(ch_core.hookenv, 'leader_set',
+                              self.leader_settings.update),
+            mock.patch.object(ch_core.hookenv, 'is_leader', lambda: True),
+            mock.patch.object(ch_core.hookenv, 'local_unit',
+                              lambda: 'ceph-rbd-mirror/0'),
+            mock.patch.object(ch_core.hookenv, 'relation_ids',
+                              lambda relation: []),
+            mock.patch.object(rbd_actions, 'ACTION_RESULTS_DIR',
+                              os.path.join(self.tmpdir, 'action-results')),
+            mock.patch.object(ceph_rbd_mirror.backend, 'ADMIN_SOCKET',
+                              self.admin_socket),
+        ]
+        with contextlib.ExitStack() as stack:
+            for patch in patches:
+                stack.enter_context(patch)
+            yield
+
+
+def measure(env, name, func):
+    env.reset_rbd_calls()
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    wall = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return name, wall, env.rbd_calls(), peak
+
+
+def status_action(env):
+    env.action_params.clear()
+    env.action_params.update({'format': 'json', 'verbose': True})
+    # Pool names are recorded by hooks for the read-only action runner
+    charm = ceph_rbd_mirror.CephRBDMirrorCharm(config=env.config)
+    charm.record_eligible_pools(env.endpoints['ceph-local'].pools)
+    rbd_actions.status(['status'])
+
+
+def status_check_admin_socket(env):
+    env.config['status-source'] = 'admin-socket'
+    try:
+        charm = ceph_rbd_mirror.CephRBDMirrorCharm(config=env.config)
+        charm.invalidate_mirror_pools_summary()
+        charm.custom_assess_status_check()
+    finally:
+        env.config['status-source'] = 'cluster'
+
+
+def configure_new_pool(env):
+    env.add_pool()
+    handlers.configure_pools()
+
+
+def promote_action(env):
+    env.action_params.clear()
+    env.action_params.update({'concurrency': 8, 'timeout': 300})
+    actions.rbd_mirror_action(['promote'])
+
+
+def resync_action(env):
+    env.action_params.clear()
+    env.action_params.update({'i-really-mean-it': True, 'concurrency': 4})
+    actions.resync_pools(['resync-pools'])
+
+
+SCENARIOS = (
+    ('configure_pools (cold)', lambda env: handlers.configure_pools()),
+    ('configure_pools (steady)', lambda env: handlers.configure_pools()),
+    ('configure_pools (one new pool)', configure_new_pool),
+    ('custom_assess_status_check',
+     lambda env: ceph_rbd_mirror.CephRBDMirrorCharm(
+         config=env.config).custom_assess_status_check()),
+    ('custom_assess_status_check (cached)',
+     lambda env: ceph_rbd_mirror.CephRBDMirrorCharm(
+         config=env.config).custom_assess_status_check()),
+    ('custom_assess_status_check (admin socket)', status_check_admin_socket),
+    ('status action (verbose json)', status_action),
+    ('resync-pools action', resync_action),
+    ('promote action', promote_action),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pools', type=int, default=100)
+    parser.add_argument('--images', type=int, default=10,
+                        help='Images per pool')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds every rbd invocation takes')
+    parser.add_argument('--manual-pools', type=int, default=0,
+                        help='Pools without a broker request')
+    parser.add_argument('--mode', default='disabled',
+                        choices=('disabled', 'pool', 'image'),
+                        help='Initial mirroring mode of pools')
+    parser.add_argument('--units', type=int, default=1,
+                        help='Units pool work is sharded across')
+    parser.add_argument('--image-states',
+                        default=','.join(synthetic.IMAGE_STATES),
+                        help='Comma-separated image states to cycle through')
+    parser.add_argument('--scenario', action='append',
+                        help='Only run scenarios starting with this name')
+    args = parser.parse_args()
+
+    env = Environment(args.pools, args.images, args.latency,
+                      args.manual_pools, args.mode, args.units,
+                      args.image_states.split(','))
+    results = []
+    try:
+        with env.patched():
+            for name, func in SCENARIOS:
+                if args.scenario and not any(
+                        name.startswith(s) for s in args.scenario):
+                    continue
+                results.append(measure(env, name, lambda: func(env)))
+    finally:
+        env.cleanup()
+
+    print('pools: {}, images per pool: {}, rbd latency: {}s, units: {}'
+          .format(args.pools, args.images, args.latency, args.units))
+    print('{:40} {:>10} {:>10} {:>12}'.format(
+        'scenario', 'wall (s)', 'rbd calls', 'peak (KiB)'))
+    for name, wall, calls, peak in results:
+        print('{:40} {:10.3f} {:10d} {:12.1f}'.format(
+            name, wall, calls, peak / 1024))
+
+
+if __name__ == '__main__':
+    main()
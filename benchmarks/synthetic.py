@@ -0,0 +1,86 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Synthetic ``ceph-local``/``ceph-remote`` endpoint and ``rbd`` data."""
+
+# Image states cycled through when generating images
+IMAGE_STATES = ('up+replaying', 'up+stopped', 'up+replaying', 'up+syncing')
+
+
+def pool_name(n):
+    return 'pool-{:05d}'.format(n)
+
+
+def endpoint_pools(pools):
+    """Generate pools as published by ceph-mon over the relation."""
+    return {
+        pool_name(n): {
+            'applications': {'rbd': {}},
+            'parameters': {'pg_num': 32, 'size': 3},
+            'quota': {'max_bytes': None, 'max_objects': None},
+        }
+        for n in range(pools)
+    }
+
+
+def broker_requests(pools, manual=0):
+    """Generate broker requests creating all but ``manual`` pools."""
+    ops = [
+        {
+            'op': 'create-pool',
+            'name': pool_name(n),
+            'app-name': 'rbd',
+            'replicas': 3,
+            'pg_num': 32,
+        }
+        for n in range(manual, pools)
+    ]
+    return [{'api-version': 1, 'request-id': 'synthetic', 'ops': ops}]
+
+
+def rbd_data(pools, images, mode='disabled', states=IMAGE_STATES):
+    """Generate data served by the fake ``rbd`` executable."""
+    return {
+        pool_name(n): {
+            'mode': mode,
+            'peers': [] if mode == 'disabled' else [
+                {'uuid': 'synthetic', 'cluster_name': 'remote',
+                 'client_name': 'client.rbd-mirror.synthetic'}],
+            'images': {
+                'image-{:06d}'.format(i): states[i % len(states)]
+                for i in range(images)
+            },
+        }
+        for n in range(pools)
+    }
+
+
+class Endpoint(object):
+    """Stand-in for a ``ceph-rbd-mirror`` interface endpoint."""
+
+    def __init__(self, endpoint_name, pools, broker_requests):
+        self.endpoint_name = endpoint_name
+        self.pools = pools
+        self.broker_requests = broker_requests
+        self.key = 'synthetic-key'
+        self.sent_rq = None
+
+    def maybe_send_rq(self, rq):
+        self.sent_rq = rq
+
+    def refresh_pools(self):
+        pass
+
+    def request_key(self):
+        pass
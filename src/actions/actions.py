@@ -14,10 +14,12 @@
 # limitations under the License.
 
 import collections
-import json
 import os
-import subprocess
 import sys
+import time
+
+# Time of process start, to report time spent bootstrapping
+STARTED = time.time()
 
 # Load basic layer module from $CHARM_DIR/lib
 sys.path.append('lib')
@@ -31,6 +33,10 @@ import charmhelpers.core as ch_core
 import charms_openstack.bus
 import charms_openstack.charm
 
+import charm.openstack.ceph_rbd_mirror as ceph_rbd_mirror
+import charm.openstack.ceph_rbd_mirror_actions as rbd_actions
+import charm.openstack.ceph_rbd_mirror_backend as backend
+
 # load reactive interfaces
 reactive.bus.discover()
 # load Endpoint based interface data
@@ -40,48 +46,183 @@ ch_core.hookenv._run_atstart()
 charms_openstack.bus.discover()
 
 
-def get_pools():
-    """Get the list of pools given as parameter to perform the actions on."""
-    pools = ch_core.hookenv.action_get('pools')
-    if pools:
-        return [p.strip() for p in pools.split(',')]
-    return None
-
-
 def rbd_mirror_action(args):
-    """Perform RBD command on pools in local Ceph endpoint."""
+    """Promote or demote pools in local Ceph endpoint.
+
+    Pools are processed concurrently, a pool that fails or times out does not
+    abort the others.  Per-pool duration and total wall time are returned to
+    measure the recovery time of a failover.
+    """
     action_name = os.path.basename(args[0])
     with charms_openstack.charm.provide_charm_instance() as charm:
         ceph_local = reactive.endpoint_from_name('ceph-local')
-        pools = get_pools()
+        pools = rbd_actions.get_pools()
+        if not pools:
+            pools = charm.eligible_pools(ceph_local.pools)
+        pools = sorted(pools)
+        force = ch_core.hookenv.action_get('force')
+        concurrency = ch_core.hookenv.action_get('concurrency') or 1
+        timeout = ch_core.hookenv.action_get('timeout')
+        start = time.time()
+        with rbd_actions.ActionResults(action_name) as results:
+            def _record(pool, result, error):
+                if error:
+                    result = {'error': str(error)}
+                results.add(pool, result)
+
+            try:
+                outcome = charm.mirror_pools_role_change(
+                    action_name, pools, force=force, concurrency=concurrency,
+                    timeout=timeout, callback=_record)
+            finally:
+                ch_core.unitdata.kv().flush()
+            elapsed = time.time() - start
+            failed = sorted(
+                set(outcome.errors) |
+                set(pool for pool, result in outcome.results.items()
+                    if 'error' in result))
+            durations = sorted(result['duration']
+                               for result in outcome.results.values())
+            results.action_set({
+                'total': len(pools),
+                'failed': len(failed),
+                'elapsed': '{:.2f}'.format(elapsed),
+                'pool-duration-p50': '{:.2f}'.format(
+                    backend.percentile(durations, 0.5)),
+                'pool-duration-p95': '{:.2f}'.format(
+                    backend.percentile(durations, 0.95)),
+                'pool-duration-max': '{:.2f}'.format(
+                    durations[-1] if durations else 0),
+            }, as_json=True, sort=True)
+        if failed:
+            ch_core.hookenv.action_fail(
+                '{} failed for {} of {} pools: {}'.format(
+                    action_name.capitalize(), len(failed), len(pools),
+                    ', '.join(failed)))
+
+
+def _failed_pools(outcome):
+    """Get pools a promote or demote failed for.
+
+    :param outcome: Result of ``mirror_pools_role_change``
+    :type outcome: ceph_rbd_mirror.ConcurrentResult
+    :returns: Sorted pool names
+    :rtype: List[str]
+    """
+    return sorted(
+        set(outcome.errors) |
+        set(pool for pool, result in outcome.results.items()
+            if 'error' in result))
+
+
+def failover(args):
+    """Fail over pools from the local to the remote Ceph endpoint.
+
+    The remote cluster is checked for images that cannot get in sync,
+    primary images in the local cluster are demoted, the remote cluster is
+    polled until every image has replayed the demotion or the deadline
+    passes, and the images are promoted in the remote cluster.  Every phase
+    is timed.  A pool that does not complete a phase is left out of the
+    following ones, pools that were demoted but did not sync or could not
+    be promoted in the remote cluster are promoted in the local cluster
+    again so that they are not left without a primary.
+    """
+    if not ch_core.hookenv.action_get('i-really-mean-it'):
+        ch_core.hookenv.action_fail('Required parameter not set')
+        return
+    with charms_openstack.charm.provide_charm_instance() as charm:
+        ceph_local = reactive.endpoint_from_name('ceph-local')
+        pools = rbd_actions.get_pools()
         if not pools:
             pools = charm.eligible_pools(ceph_local.pools)
-        result = {}
-        cmd = ['rbd', '--id', charm.ceph_id, 'mirror', 'pool', action_name]
-        if ch_core.hookenv.action_get('force'):
-            cmd += ['--force']
-        if ch_core.hookenv.action_get('verbose'):
-            cmd += ['--verbose']
-        output_format = ch_core.hookenv.action_get('format')
-        if output_format:
-            cmd += ['--format', output_format]
-        for pool in pools:
-            output = subprocess.check_output(cmd + [pool],
-                                             stderr=subprocess.STDOUT,
-                                             universal_newlines=True)
-            if output_format == 'json':
-                result[pool] = json.loads(output)
-            else:
-                result[pool] = output.rstrip()
-        if output_format == 'json':
-            ch_core.hookenv.action_set({'output': json.dumps(result)})
-        else:
-            output_str = ''
-            for pool, output in result.items():
-                if output_str:
-                    output_str += '\n'
-                output_str += '{}: {}'.format(pool, output)
-            ch_core.hookenv.action_set({'output': output_str})
+        pools = sorted(pools)
+        concurrency = ch_core.hookenv.action_get('concurrency') or 1
+        timeout = ch_core.hookenv.action_get('timeout')
+        sync_timeout = ch_core.hookenv.action_get('sync-timeout') or None
+        report = collections.OrderedDict((pool, {}) for pool in pools)
+        durations = collections.OrderedDict()
+        sync = None
+        # Map of pool name to the phase it did not complete
+        stopped = {}
+        rollback = []
+        remaining = pools
+        start = time.time()
+        try:
+            for phase in 'check', 'demote', 'sync', 'promote':
+                if not remaining:
+                    break
+                phase_start = time.time()
+                if phase == 'check':
+                    outcome = charm.mirror_pools_check_sync(
+                        remaining, cluster='remote', concurrency=concurrency)
+                    for pool, images in outcome.results.items():
+                        if images:
+                            report[pool]['cannot-sync'] = images
+                    for pool, e in outcome.errors.items():
+                        report[pool]['check'] = {'error': str(e)}
+                    failed = sorted(
+                        set(outcome.errors) |
+                        set(pool for pool, images in outcome.results.items()
+                            if images))
+                elif phase == 'sync':
+                    sync = charm.mirror_pools_await_sync(
+                        remaining, cluster='remote', timeout=sync_timeout,
+                        concurrency=concurrency)
+                    for pool, seconds in sync['time_to_consistent'].items():
+                        report[pool]['time-to-consistent'] = seconds
+                    for pool, images in sync['held_up'].items():
+                        report[pool]['held-up-by'] = images
+                    for pool, images in sync['lagging'].items():
+                        report[pool]['lagging'] = images
+                    failed = sorted(sync['lagging'])
+                else:
+                    outcome = charm.mirror_pools_role_change(
+                        phase, remaining, concurrency=concurrency,
+                        timeout=timeout,
+                        cluster='remote' if phase == 'promote' else None)
+                    for pool, result in outcome.results.items():
+                        report[pool][phase] = result
+                    for pool, e in outcome.errors.items():
+                        report[pool][phase] = {'error': str(e)}
+                    failed = _failed_pools(outcome)
+                durations[phase] = time.time() - phase_start
+                for pool in failed:
+                    stopped[pool] = phase
+                if phase in ('sync', 'promote'):
+                    rollback.extend(failed)
+                remaining = [pool for pool in remaining if pool not in failed]
+            if rollback:
+                phase_start = time.time()
+                outcome = charm.mirror_pools_role_change(
+                    'promote', sorted(rollback), concurrency=concurrency,
+                    timeout=timeout, cluster=None)
+                for pool, result in outcome.results.items():
+                    report[pool]['rollback'] = result
+                for pool, e in outcome.errors.items():
+                    report[pool]['rollback'] = {'error': str(e)}
+                durations['rollback'] = time.time() - phase_start
+        finally:
+            ch_core.unitdata.kv().flush()
+        with rbd_actions.ActionResults('failover') as results:
+            for pool, pool_report in report.items():
+                results.add(pool, pool_report)
+            extra = {
+                'total': len(pools),
+                'elapsed': '{:.2f}'.format(time.time() - start),
+            }
+            for phase, seconds in durations.items():
+                extra['{}-duration'.format(phase)] = '{:.2f}'.format(seconds)
+            if sync:
+                extra['sync-rounds'] = sync['rounds']
+                extra['held-up-images'] = sum(
+                    len(images) for images in sync['held_up'].values())
+            results.action_set(extra, as_json=True)
+        if stopped:
+            ch_core.hookenv.action_fail(
+                'Failover did not complete for {} of {} pools: {}'.format(
+                    len(stopped), len(pools),
+                    ', '.join('{} ({})'.format(pool, phase)
+                              for pool, phase in sorted(stopped.items()))))
 
 
 def refresh_pools(args):
@@ -107,49 +248,63 @@ def refresh_pools(args):
 
 
 def resync_pools(args):
-    """Force image resync on pools in local Ceph endpoint."""
+    """Force image resync on pools in local Ceph endpoint.
+
+    Candidate images are discovered with one mirror status query per pool.
+    Resync calls are spread over a bounded pool of workers, a failure for one
+    image does not abort the resync of the others.
+    """
     if not ch_core.hookenv.action_get('i-really-mean-it'):
         ch_core.hookenv.action_fail('Required parameter not set')
         return
     with charms_openstack.charm.provide_charm_instance() as charm:
         ceph_local = reactive.endpoint_from_name('ceph-local')
-        pools = get_pools()
+        pools = rbd_actions.get_pools()
         if not pools:
-            pools = charm.eligible_pools(ceph_local.pools)
-        result = collections.defaultdict(dict)
-        for pool in pools:
-            # list images in pool
-            output = subprocess.check_output(
-                ['rbd', '--id', charm.ceph_id, '--format', 'json',
-                 '-p', pool, 'ls'], universal_newlines=True)
-            images = json.loads(output)
-            for image in images:
-                output = subprocess.check_output(
-                    ['rbd', '--id', charm.ceph_id, '--format', 'json', 'info',
-                     '{}/{}'.format(pool, image)], universal_newlines=True)
-                image_info = json.loads(output)
-                if image_info['mirroring']['state'] == 'disabled':
-                    continue
-                output = subprocess.check_output(
-                    ['rbd', '--id', charm.ceph_id, 'mirror', 'image', 'resync',
-                     '{}/{}'.format(pool, image)], universal_newlines=True)
-                result[pool][image] = output.rstrip()
-        output_str = ''
-        for pool in result:
-            for image in result[pool]:
-                if output_str:
-                    output_str += '\n'
-                output_str += '{}/{}: {}'.format(pool, image,
-                                                 result[pool][image])
-        ch_core.hookenv.action_set({'output': output_str})
+            pools = charm.pool_shard(charm.eligible_pools(ceph_local.pools))
+        concurrency = ch_core.hookenv.action_get('concurrency') or 1
+        states = ch_core.hookenv.action_get('states')
+        if states:
+            states = set(s.strip() for s in states.split(','))
+
+        def _resync(pool_image):
+            return charm.backend.image_resync(*pool_image)
+
+        start = time.time()
+        candidates, total = rbd_actions.get_page(
+            (pool, image)
+            for pool in pools
+            for image in charm.mirrored_images(pool, states=states))
+        with rbd_actions.ActionResults('resync-pools') as results:
+            def _record(pool_image, output, error):
+                if error:
+                    output = 'failed: {}'.format(error)
+                results.add('{}/{}'.format(*pool_image), output)
+
+            outcome = ceph_rbd_mirror.map_concurrently(
+                _resync, candidates, concurrency=concurrency,
+                callback=_record)
+            elapsed = time.time() - start
+            processed = len(outcome.results) + len(outcome.errors)
+            results.action_set({
+                'total': total,
+                'failed': len(outcome.errors),
+                'elapsed': '{:.2f}'.format(elapsed),
+                'images-per-second': '{:.2f}'.format(
+                    processed / elapsed if elapsed else processed),
+            }, sort=True)
+        if outcome.errors:
+            ch_core.hookenv.action_fail(
+                'Resync failed for {} of {} images'
+                .format(len(outcome.errors), processed))
 
 
 ACTIONS = {
     'demote': rbd_mirror_action,
+    'failover': failover,
     'promote': rbd_mirror_action,
     'refresh-pools': refresh_pools,
     'resync-pools': resync_pools,
-    'status': rbd_mirror_action,
 }
 
 
@@ -160,10 +315,17 @@ def main(args):
     except KeyError:
         return 'Action {} is undefined'.format(action_name)
 
+    ch_core.hookenv.log('Action "{}" started after {:.3f}s'
+                        .format(action_name, time.time() - STARTED),
+                        level=ch_core.hookenv.DEBUG)
     try:
         action(args)
     except Exception as e:
         ch_core.hookenv.action_fail(str(e))
+    finally:
+        # Actions are not run by the reactive framework, run registered
+        # exit callbacks such as the Ceph call statistics ourselves.
+        ch_core.hookenv._run_atexit()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Entry point for read-only actions.
+
+Unlike ``actions.py`` this does not discover reactive handlers, interfaces
+or the charm class; only the modules needed to query Ceph are loaded.
+"""
+
+import os
+import sys
+import time
+
+# Time of process start, to report time spent bootstrapping
+STARTED = time.time()
+
+# Load basic layer module from $CHARM_DIR/lib
+sys.path.append('lib')
+from charms.layer import basic
+
+# setup module loading from charm venv
+basic.bootstrap_charm_deps()
+
+import charmhelpers.core as ch_core
+
+import charm.openstack.ceph_rbd_mirror_actions as rbd_actions
+import charm.openstack.ceph_rbd_mirror_backend as backend
+
+
+def main(args):
+    action_name = os.path.basename(args[0])
+    try:
+        action = rbd_actions.QUERY_ACTIONS[action_name]
+    except KeyError:
+        return 'Action {} is undefined'.format(action_name)
+
+    ch_core.hookenv.log('Action "{}" started after {:.3f}s'
+                        .format(action_name, time.time() - STARTED),
+                        level=ch_core.hookenv.DEBUG)
+    try:
+        backend.runner.configure(ch_core.hookenv.config())
+        action(args)
+    except Exception as e:
+        ch_core.hookenv.action_fail(str(e))
+    finally:
+        ch_core.hookenv._run_atexit()
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Nagios check for Ceph RBD mirroring.
+
+Reads the status snapshot the ceph-rbd-mirror charm refreshes periodically,
+the check itself never queries the Ceph clusters.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+OK = 0
+WARNING = 1
+CRITICAL = 2
+UNKNOWN = 3
+
+STATUS_NAMES = ('OK', 'WARNING', 'CRITICAL', 'UNKNOWN')
+
+DEFAULT_SNAPSHOT = '/var/lib/charm/ceph-rbd-mirror/status-snapshot.json'
+
+
+def check_health(snapshot, args):
+    pools = snapshot['pools']
+    error = sorted(pool for pool, data in pools.items()
+                   if data['health'] == 'ERROR')
+    warning = sorted(pool for pool, data in pools.items()
+                     if data['health'] not in ('OK', 'ERROR'))
+    failed = snapshot.get('failed_pools', [])
+    if error:
+        return CRITICAL, 'pools in ERROR: {}'.format(', '.join(error))
+    if warning or failed:
+        msg = []
+        if warning:
+            msg.append('pools in WARNING: {}'.format(', '.join(warning)))
+        if failed:
+            msg.append('status unavailable for pools: {}'
+                       .format(', '.join(sorted(failed))))
+        return WARNING, '; '.join(msg)
+    return OK, '{} pools healthy'.format(len(pools))
+
+
+def check_errors(snapshot, args):
+    images = sorted(
+        '{}/{}'.format(pool, image)
+        for pool, data in snapshot['pools'].items()
+        for image in data['error_images'])
+    if len(images) >= args.critical:
+        status = CRITICAL
+    elif len(images) >= args.warning:
+        status = WARNING
+    else:
+        return OK, 'no images in error state'
+    return status, '{} images in error state: {}'.format(
+        len(images), ', '.join(images[:10]))
+
+
+def check_lag(snapshot, args):
+    worst_pool, worst = None, None
+    for pool, data in snapshot['pools'].items():
+        lag = data.get('max_entries_behind_primary')
+        if lag is not None and (worst is None or lag > worst['lag']):
+            worst_pool = pool
+            worst = {'lag': lag, 'image': data['max_lag_image']}
+    if worst is None:
+        return OK, 'no images replaying'
+    msg = 'image {}/{} is {} entries behind primary'.format(
+        worst_pool, worst['image'], worst['lag'])
+    if worst['lag'] >= args.critical:
+        return CRITICAL, msg
+    if worst['lag'] >= args.warning:
+        return WARNING, msg
+    return OK, msg
+
+
+CHECKS = {
+    'health': check_health,
+    'errors': check_errors,
+    'lag': check_lag,
+}
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('check', choices=sorted(CHECKS))
+    parser.add_argument('--snapshot', default=DEFAULT_SNAPSHOT)
+    parser.add_argument('--max-age', type=int, default=1800,
+                        help='Seconds after which the snapshot is stale')
+    parser.add_argument('-w', '--warning', type=int, default=1)
+    parser.add_argument('-c', '--critical', type=int, default=1)
+    args = parser.parse_args(argv)
+    try:
+        with open(args.snapshot) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError) as e:
+        status, msg = UNKNOWN, 'unable to read status snapshot: {}'.format(e)
+    else:
+        age = time.time() - snapshot['timestamp']
+        if age > args.max_age:
+            status, msg = UNKNOWN, 'status snapshot is {:.0f}s old'.format(
+                age)
+        else:
+            status, msg = CHECKS[args.check](snapshot, args)
+    print('{}: {}'.format(STATUS_NAMES[status], msg))
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
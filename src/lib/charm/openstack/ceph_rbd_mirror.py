@@ -13,9 +13,15 @@
 # limitations under the License.
 
 import collections
+import concurrent.futures
+import hashlib
 import json
+import os
+import re
 import socket
 import subprocess
+import threading
+import time
 
 import charms.reactive as reactive
 
@@ -24,8 +30,84 @@ import charms_openstack.adapters
 import charms_openstack.plugins
 
 import charmhelpers.core as ch_core
+import charmhelpers.contrib.charmsupport.nrpe as nrpe
 import charmhelpers.contrib.storage.linux.ceph as ch_ceph
 
+import charm.openstack.ceph_rbd_mirror_actions as rbd_actions
+import charm.openstack.ceph_rbd_mirror_backend as backend
+import charm.openstack.ceph_rbd_mirror_metrics as metrics
+import charm.openstack.ceph_rbd_mirror_sharding as sharding
+
+
+# Status snapshot read by the NRPE checks
+STATUS_SNAPSHOT_FILE = '/var/lib/charm/ceph-rbd-mirror/status-snapshot.json'
+# Directory the NRPE check scripts are installed to
+NAGIOS_PLUGINS = '/usr/local/lib/nagios/plugins'
+
+
+# Mirror snapshot schedule interval as accepted by ``rbd``, e.g. ``12h``
+SNAPSHOT_INTERVAL_RE = re.compile(r'^[1-9][0-9]*[dhm]$')
+
+
+# Daemon tuning options rendered into the client section of ``ceph.conf``,
+# charm option mapped to Ceph option.  Options left unset are not rendered
+# so that the Ceph defaults apply.
+RBD_MIRROR_TUNING_OPTIONS = collections.OrderedDict((
+    ('rbd-mirror-concurrent-image-syncs',
+     'rbd_mirror_concurrent_image_syncs'),
+    ('rbd-mirror-journal-max-fetch-bytes',
+     'rbd_mirror_journal_max_fetch_bytes'),
+    ('rbd-journal-max-payload-bytes', 'rbd_journal_max_payload_bytes'),
+    ('rbd-mirror-image-state-check-interval',
+     'rbd_mirror_image_state_check_interval'),
+    ('rbd-mirror-pool-replayers-refresh-interval',
+     'rbd_mirror_pool_replayers_refresh_interval'),
+    ('rbd-mirror-memory-target', 'rbd_mirror_memory_target'),
+    ('rbd-mirror-memory-cache-min', 'rbd_mirror_memory_cache_min'),
+))
+
+
+def file_outdated(path, interval):
+    """Check whether file is missing or older than interval.
+
+    :param path: Path to file
+    :type path: str
+    :param interval: Maximum age in seconds
+    :type interval: Optional[int]
+    :returns: True if the file needs refreshing
+    :rtype: bool
+    """
+    try:
+        age = time.time() - os.path.getmtime(path)
+    except OSError:
+        return True
+    return age >= (interval or 0)
+
+
+@charms_openstack.adapters.config_property
+def rbd_mirror_client(config):
+    """Name of the client section the rbd-mirror daemon reads.
+
+    :param config: Configuration adapter
+    :type config: charms_openstack.adapters.ConfigurationAdapter
+    :returns: Client name, e.g. ``client.rbd-mirror.hostname``
+    :rtype: str
+    """
+    return 'client.{}'.format(config.charm_instance.ceph_id)
+
+
+@charms_openstack.adapters.config_property
+def rbd_mirror_tuning(config):
+    """Daemon tuning settings to render.
+
+    :param config: Configuration adapter
+    :type config: charms_openstack.adapters.ConfigurationAdapter
+    :returns: Map of Ceph option to value
+    :rtype: collections.OrderedDict[str,int]
+    :raises: ValueError
+    """
+    return config.charm_instance.rbd_mirror_tuning()
+
 
 class CephRBDMirrorCharmRelationAdapters(
         charms_openstack.adapters.OpenStackRelationAdapters):
@@ -35,6 +117,123 @@ class CephRBDMirrorCharmRelationAdapters(
     }
 
 
+ConcurrentResult = collections.namedtuple(
+    'ConcurrentResult', ['results', 'errors', 'pending'])
+
+PoolsDelta = collections.namedtuple(
+    'PoolsDelta', ['added', 'removed', 'changed'])
+
+
+def map_concurrently(func, items, concurrency=1, timeout=None,
+                     callback=None):
+    """Call function for each item using a bounded pool of worker threads.
+
+    Exceptions raised by the function are collected per item instead of
+    aborting the remaining calls.  Ceph commands run by calls that are still
+    in progress at the deadline are killed, see ``backend.deadline``, such
+    calls are reported as pending rather than failed.
+
+    :param func: Function to call, takes an item as its only argument
+    :type func: Callable[[any], any]
+    :param items: Items to call function for
+    :type items: Iterable[any]
+    :param concurrency: Maximum number of concurrent calls
+    :type concurrency: int
+    :param timeout: Seconds to wait for all calls to complete, ``None`` to
+                    wait indefinitely
+    :type timeout: Optional[float]
+    :param callback: Function called from the calling thread with item,
+                     result and exception as each call completes
+    :type callback: Optional[Callable[[any, any, Optional[Exception]], None]]
+    :returns: Map of item to result, map of item to exception and list of
+              items that did not complete before the deadline
+    :rtype: ConcurrentResult
+    """
+    results = {}
+    errors = {}
+    if timeout:
+        deadline = time.time() + timeout
+
+        def _call(item):
+            with backend.deadline(deadline):
+                return func(item)
+    else:
+        _call = func
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=max(1, int(concurrency)))
+    try:
+        futures = {executor.submit(_call, item): item for item in items}
+        try:
+            for future in concurrent.futures.as_completed(futures,
+                                                          timeout=timeout):
+                item = futures[future]
+                try:
+                    results[item] = future.result()
+                except backend.DeadlineExceeded:
+                    continue
+                except Exception as e:
+                    errors[item] = e
+                if callback:
+                    callback(item, results.get(item), errors.get(item))
+        except concurrent.futures.TimeoutError:
+            pass
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return ConcurrentResult(results, errors,
+                            [item for item in futures.values()
+                             if item not in results and item not in errors])
+
+
+class MirrorQueryCache(object):
+    """Memoize Ceph RBD mirror query results.
+
+    The charm class is instantiated once per hook or action execution, an
+    instance of this class attached to it is thus scoped to a single hook.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, kind, pool, loader):
+        """Get cached result for query, call loader on cache miss.
+
+        :param kind: Type of query, e.g. ``info`` or ``status``
+        :type kind: str
+        :param pool: Pool name
+        :type pool: str
+        :param loader: Callable performing the actual query
+        :type loader: Callable[[], any]
+        :returns: Query result
+        :rtype: any
+        """
+        key = (kind, pool)
+        with self._lock:
+            if key in self._data:
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+        result = loader()
+        with self._lock:
+            self._data[key] = result
+        return result
+
+    def invalidate(self, pool=None):
+        """Drop cached results.
+
+        :param pool: Pool name, if not provided all results are dropped
+        :type pool: Optional[str]
+        """
+        with self._lock:
+            if pool is None:
+                self._data.clear()
+                return
+            for key in [key for key in self._data if key[1] == pool]:
+                del self._data[key]
+
+
 class CephRBDMirrorCharm(charms_openstack.plugins.CephCharm):
     # We require Ceph 12.2 Luminous or later for HA support in the Ceph
     # rbd-mirror daemon.  Luminous appears in UCA at pike.
@@ -46,6 +245,25 @@ class CephRBDMirrorCharm(charms_openstack.plugins.CephCharm):
     user = 'ceph'
     group = 'ceph'
     adapters_class = CephRBDMirrorCharmRelationAdapters
+    # mirroring mode used for pools without an explicit mode requested
+    default_mirroring_mode = 'pool'
+    # unitdata key for record of pools confirmed mirrored
+    mirrored_pools_key = 'ceph-rbd-mirror.mirrored-pools'
+    # unitdata key for mirror pools summary shared between hooks
+    pools_summary_key = 'ceph-rbd-mirror.pools-summary'
+    # unitdata key for pool state seen by the last configure_pools run
+    seen_pools_key = 'ceph-rbd-mirror.seen-pools'
+    # leader setting with manually created pools forwarded to the remote
+    # cluster, kept there so that a new leader keeps forwarding them
+    forwarded_pools_key = 'forwarded-pools'
+    # unitdata key for time all pools were last swept
+    pools_swept_key = 'ceph-rbd-mirror.pools-swept'
+    # peer relation units exchange their mirror pools summaries on
+    peer_relation = 'peers'
+    # peer relation key for the mirror pools summary of the unit's shard
+    peer_summary_key = 'mirror-pools-summary'
+    # unitdata key for the summary last published per peer relation
+    published_summary_key = 'ceph-rbd-mirror.published-pools-summary'
     ceph_service_name_override = 'rbd-mirror'
     ceph_key_per_unit_name = True
 
@@ -58,7 +276,36 @@ class CephRBDMirrorCharm(charms_openstack.plugins.CephCharm):
             '/etc/ceph/ceph.conf': self.services,
             '/etc/ceph/remote.conf': self.services,
         }
+        self.query_cache = MirrorQueryCache()
+        self._backend = None
         super().__init__(**kwargs)
+        backend.runner.configure(self.config)
+
+    @property
+    def all_packages(self):
+        """Packages to install, with the Python bindings for librados.
+
+        :returns: Package names
+        :rtype: List[str]
+        """
+        packages = list(self.packages)
+        if self.config.get('ceph-backend') == backend.LibradosBackend.name:
+            packages.extend(backend.LIBRADOS_PACKAGES)
+        return packages
+
+    @property
+    def backend(self):
+        """Backend used for communicating with Ceph.
+
+        Instantiated on first use and kept for the duration of the hook.
+
+        :returns: Backend instance
+        :rtype: backend.CephBackend
+        """
+        if self._backend is None:
+            self._backend = backend.get_backend(
+                self.ceph_id, self.config.get('ceph-backend'))
+        return self._backend
 
     def eligible_pools(self, pools):
         """Filter eligible pools.
@@ -74,19 +321,204 @@ class CephRBDMirrorCharm(charms_openstack.plugins.CephCharm):
         return {pool: attrs for pool, attrs in pools.items()
                 if 'rbd' in attrs['applications']}
 
+    def record_eligible_pools(self, pools):
+        """Record names of pools eligible for mirroring for query actions.
+
+        :param pools: Dictionary with detailed pool information as provided
+                      over the ``ceph-rbd-mirror`` interface
+        :type pools: dict
+        """
+        ch_core.unitdata.kv().set(rbd_actions.ELIGIBLE_POOLS_KEY,
+                                  sorted(self.eligible_pools(pools)))
+
+    def peer_units(self):
+        """Get units of the application, including the local unit.
+
+        :returns: Sorted unit names
+        :rtype: List[str]
+        """
+        units = set([ch_core.hookenv.local_unit()])
+        for rid in ch_core.hookenv.relation_ids(self.peer_relation):
+            units.update(ch_core.hookenv.related_units(rid))
+        return sorted(units)
+
+    def publish_shard_units(self):
+        """Publish the units pool work is sharded across to the other units.
+
+        Only the leader may call this.  Leader settings are only updated when
+        the units changed so that the other units are not woken up needlessly.
+
+        :returns: Whether the published units changed
+        :rtype: bool
+        """
+        units = self.peer_units()
+        if units == sharding.shard_units():
+            return False
+        ch_core.hookenv.leader_set(
+            {sharding.SHARD_UNITS_KEY: json.dumps(units)})
+        return True
+
+    def pool_shard(self, pools):
+        """Filter pools the local unit is responsible for.
+
+        :param pools: Dictionary with detailed pool information
+        :type pools: Dict[str,any]
+        :returns: Dictionary with detailed pool information for pools in the
+                  shard of the local unit
+        :rtype: Dict[str,any]
+        """
+        shard = set(sharding.local_shard(pools))
+        return {pool: attrs for pool, attrs in pools.items()
+                if pool in shard}
+
+    def share_mirror_pools_summary(self, stats):
+        """Share mirror pools summary of the local shard with the leader.
+
+        The summary is only written to relations it was not published on
+        already, as status is assessed in every hook.
+
+        :param stats: Mirror pools summary
+        :type stats: Dict[str,any]
+        """
+        summary = json.dumps(stats, sort_keys=True)
+        kv = ch_core.unitdata.kv()
+        published = kv.get(self.published_summary_key) or {}
+        current = {}
+        for rid in ch_core.hookenv.relation_ids(self.peer_relation):
+            if published.get(rid) != summary:
+                ch_core.hookenv.relation_set(
+                    relation_id=rid,
+                    relation_settings={self.peer_summary_key: summary})
+            current[rid] = summary
+        if current != published:
+            kv.set(self.published_summary_key, current)
+
+    def aggregate_mirror_pools_summaries(self, stats):
+        """Add mirror pools summaries shared by the other units.
+
+        While pools are reassigned between shards more than one unit may
+        report a pool, it is counted once with the status reported first,
+        the local unit's taking precedence.  Summaries without per-pool
+        status are added as they are.
+
+        :param stats: Mirror pools summary of the local shard
+        :type stats: Dict[str,any]
+        :returns: Mirror pools summary of all shards
+        :rtype: Dict[str,any]
+        """
+        total = {
+            'pool_health': collections.defaultdict(int),
+            'image_states': collections.defaultdict(int),
+            'pools_timed_out': [],
+        }
+        summaries = [stats]
+        for rid in ch_core.hookenv.relation_ids(self.peer_relation):
+            for unit in ch_core.hookenv.related_units(rid):
+                summary = ch_core.hookenv.relation_get(
+                    self.peer_summary_key, unit=unit, rid=rid)
+                if summary:
+                    summaries.append(json.loads(summary))
+        pools = {}
+        timed_out = set()
+        for summary in summaries:
+            if 'pools' in summary:
+                for pool, pool_summary in summary['pools'].items():
+                    pools.setdefault(pool, pool_summary)
+            else:
+                for key in 'pool_health', 'image_states':
+                    for name, count in summary[key].items():
+                        total[key][name] += count
+            timed_out.update(summary.get('pools_timed_out') or [])
+        for pool_summary in pools.values():
+            total['pool_health'][pool_summary['health']] += 1
+            for state, count in pool_summary['states'].items():
+                total['image_states'][state] += count
+        total['pools_timed_out'] = sorted(timed_out - set(pools))
+        return total
+
+    def snapshot_mirroring_pools(self):
+        """Get pools configured for snapshot based mirroring through config.
+
+        :returns: Pool names
+        :rtype: Set[str]
+        """
+        return set(
+            pool.strip() for pool in
+            (self.config.get('snapshot-mirroring-pools') or '').split(',')
+            if pool.strip())
+
+    def snapshot_schedule_intervals(self):
+        """Get mirror snapshot schedule intervals from config.
+
+        :returns: Sorted intervals, e.g. ``['1h']``
+        :rtype: List[str]
+        :raises: ValueError
+        """
+        intervals = (self.config.get('snapshot-schedule-interval') or ''
+                     ).replace(',', ' ').split()
+        invalid = [interval for interval in intervals
+                   if not SNAPSHOT_INTERVAL_RE.match(interval)]
+        if invalid:
+            raise ValueError('invalid snapshot-schedule-interval: {}'
+                             .format(', '.join(invalid)))
+        return sorted(set(intervals))
+
+    def rbd_mirror_tuning(self):
+        """Get validated rbd-mirror daemon tuning settings from config.
+
+        :returns: Map of Ceph option to value for the options that are set
+        :rtype: collections.OrderedDict[str,int]
+        :raises: ValueError
+        """
+        settings = collections.OrderedDict()
+        invalid = []
+        for option, ceph_option in RBD_MIRROR_TUNING_OPTIONS.items():
+            value = self.config.get(option)
+            if value is None:
+                continue
+            if value < 1:
+                invalid.append(option)
+                continue
+            settings[ceph_option] = value
+        if invalid:
+            raise ValueError('{} must be a positive integer'
+                             .format(', '.join(invalid)))
+        if (settings.get('rbd_mirror_memory_cache_min', 0) >
+                settings.get('rbd_mirror_memory_target', float('inf'))):
+            raise ValueError('rbd-mirror-memory-cache-min exceeds '
+                             'rbd-mirror-memory-target')
+        return settings
+
     def custom_assess_status_check(self):
         """Provide mirrored pool statistics through juju status."""
+        try:
+            self.rbd_mirror_tuning()
+            self.snapshot_schedule_intervals()
+            backend.parse_command_timeouts(
+                self.config.get('ceph-command-timeouts'))
+        except ValueError as e:
+            return 'blocked', 'Configuration error: {}'.format(e)
+        open_circuits = backend.runner.breaker.open_circuits()
+        if open_circuits:
+            return 'blocked', 'Ceph cluster unreachable, retrying {}'.format(
+                ', '.join('{} in {:.0f}s'.format(cluster, remaining)
+                          for cluster, remaining in sorted(
+                              open_circuits.items())))
         if (reactive.is_flag_set('config.rendered') and
                 reactive.is_flag_set('ceph-local.available') and
                 reactive.is_flag_set('ceph-remote.available')):
             endpoint = reactive.endpoint_from_flag('ceph-local.available')
+            pools = self.eligible_pools(endpoint.pools)
             try:
-                stats = self.mirror_pools_summary(
-                    self.eligible_pools(endpoint.pools))
-            except subprocess.CalledProcessError as e:
+                stats = self.cached_mirror_pools_summary(
+                    self.pool_shard(pools))
+            except backend.CEPH_ERRORS as e:
                 ch_core.hookenv.log('Unable to retrieve mirror pool status: '
                                     '"{}"'.format(e))
                 return None, None
+            self.share_mirror_pools_summary(stats)
+            if ch_core.hookenv.is_leader():
+                stats = self.aggregate_mirror_pools_summaries(stats)
             ch_core.hookenv.log('mirror_pools_summary = "{}"'
                                 .format(stats),
                                 level=ch_core.hookenv.DEBUG)
@@ -117,6 +549,11 @@ class CephRBDMirrorCharm(charms_openstack.plugins.CephCharm):
             if pool_msg:
                 msg = 'Unit is ready ({})'.format(
                     pool_msg + image_msg.rstrip())
+                if stats.get('pools_timed_out'):
+                    msg += ', status of {} pools timed out'.format(
+                        len(stats['pools_timed_out']))
+            elif pools:
+                msg = 'Unit is ready (no pools in shard)'
             else:
                 status = 'waiting'
                 msg = 'Waiting for pools to be created'
@@ -124,11 +561,8 @@ class CephRBDMirrorCharm(charms_openstack.plugins.CephCharm):
         return None, None
 
     def _mirror_pool_info(self, pool):
-        output = subprocess.check_output(['rbd', '--id', self.ceph_id,
-                                          'mirror', 'pool', 'info', '--format',
-                                          'json', pool],
-                                         universal_newlines=True)
-        return json.loads(output)
+        return self.query_cache.get(
+            'info', pool, lambda: self.backend.mirror_pool_info(pool))
 
     def mirror_pool_enabled(self, pool, mode='pool'):
         return self._mirror_pool_info(pool).get('mode', None) == mode
@@ -136,75 +570,697 @@ class CephRBDMirrorCharm(charms_openstack.plugins.CephCharm):
     def mirror_pool_has_peers(self, pool):
         return len(self._mirror_pool_info(pool).get('peers', [])) > 0
 
-    def mirror_pool_status(self, pool):
-        output = subprocess.check_output(['rbd', '--id', self.ceph_id,
-                                          'mirror', 'pool', 'status',
-                                          '--format', 'json', '--verbose',
-                                          pool],
-                                         universal_newlines=True)
-        return json.loads(output)
+    def mirror_pool_status(self, pool, verbose=False):
+        """Get mirror status of pool.
+
+        :param pool: Pool name
+        :type pool: str
+        :param verbose: Include per-image status, only request this when the
+                        image detail is needed as the output is proportional
+                        to the number of images in the pool
+        :type verbose: bool
+        :returns: Mirror pool status
+        :rtype: Dict[str,any]
+        """
+        return self.query_cache.get(
+            'status-verbose' if verbose else 'status', pool,
+            lambda: self.backend.mirror_pool_status(pool, verbose=verbose))
+
+    def mirrored_images(self, pool, states=None):
+        """Get mirror enabled images in pool from one bulk status query.
+
+        :param pool: Pool name
+        :type pool: str
+        :param states: Only include images in these states, e.g. ``error``
+        :type states: Optional[Set[str]]
+        :returns: Map of image name to mirror state
+        :rtype: Dict[str,str]
+        """
+        result = {}
+        for image in self.mirror_pool_status(
+                pool, verbose=True).get('images', []):
+            # The state is prefixed with the daemon state, e.g. ``up+error``
+            state = image['state'].split('+')[-1]
+            if states and state not in states:
+                continue
+            result[image['name']] = state
+        return result
+
+    @staticmethod
+    def pool_fingerprint(attrs, mode):
+        """Get fingerprint for pool attributes and requested mirroring mode.
+
+        :param attrs: Pool attributes as provided over the relation
+        :type attrs: Dict[str,any]
+        :param mode: Ceph RBD mirroring mode requested for the pool
+        :type mode: str
+        :returns: Fingerprint
+        :rtype: str
+        """
+        return hashlib.sha256(
+            json.dumps([attrs, mode], sort_keys=True).encode('utf-8')
+        ).hexdigest()
+
+    def _mirrored_pools(self):
+        return ch_core.unitdata.kv().get(self.mirrored_pools_key, {})
+
+    def mirror_pool_confirmed(self, pool, attrs, mode):
+        """Check whether pool was recently confirmed mirrored.
+
+        A pool needs probing again if it is new, its attributes or requested
+        mirroring mode changed or the record is older than the
+        ``pool-revalidate-interval`` config option.
+
+        :param pool: Pool name
+        :type pool: str
+        :param attrs: Pool attributes as provided over the relation
+        :type attrs: Dict[str,any]
+        :param mode: Ceph RBD mirroring mode requested for the pool
+        :type mode: str
+        :returns: True if the pool is known to be mirrored, False otherwise
+        :rtype: bool
+        """
+        record = self._mirrored_pools().get(pool)
+        if not record:
+            return False
+        return (
+            record['fingerprint'] == self.pool_fingerprint(attrs, mode) and
+            time.time() - record['confirmed'] <
+            (self.config.get('pool-revalidate-interval') or 0))
+
+    def mirror_pools_record(self, confirmed, pools):
+        """Record pools confirmed mirrored and forget pools that are gone.
+
+        :param confirmed: Map of pool name to tuple of pool attributes and
+                          mirroring mode for pools confirmed in this hook
+        :type confirmed: Dict[str,Tuple[Dict[str,any],str]]
+        :param pools: Names of all eligible pools
+        :type pools: Iterable[str]
+        """
+        now = time.time()
+        pools = set(pools)
+        records = {pool: record
+                   for pool, record in self._mirrored_pools().items()
+                   if pool in pools}
+        for pool, (attrs, mode) in confirmed.items():
+            records[pool] = {
+                'mode': mode,
+                'fingerprint': self.pool_fingerprint(attrs, mode),
+                'confirmed': now,
+            }
+        ch_core.unitdata.kv().set(self.mirrored_pools_key, records)
+
+    def pools_delta(self, pools):
+        """Compare pool state with the state seen by the previous hook.
+
+        :param pools: Map of pool name to JSON serializable pool state
+        :type pools: Dict[str,any]
+        :returns: Sorted names of added, removed and changed pools
+        :rtype: PoolsDelta
+        """
+        seen = ch_core.unitdata.kv().get(self.seen_pools_key) or {}
+        return PoolsDelta(
+            sorted(pool for pool in pools if pool not in seen),
+            sorted(pool for pool in seen if pool not in pools),
+            sorted(pool for pool, state in pools.items()
+                   if pool in seen and seen[pool] != state))
+
+    def record_seen_pools(self, pools, forget=()):
+        """Record pool state for comparison by the next hook.
+
+        :param pools: Map of pool name to JSON serializable pool state
+        :type pools: Dict[str,any]
+        :param forget: Pools not to record, so that they show up as added in
+                       the next delta, e.g. pools that failed
+        :type forget: Iterable[str]
+        """
+        kv = ch_core.unitdata.kv()
+        seen = kv.get(self.seen_pools_key) or {}
+        records = {pool: state for pool, state in pools.items()
+                   if pool not in forget}
+        if records != seen:
+            kv.set(self.seen_pools_key, records)
+
+    def forwarded_pools(self):
+        """Get manually created pools forwarded to the remote cluster.
+
+        :returns: Pool names
+        :rtype: Set[str]
+        """
+        pools = ch_core.hookenv.leader_get(self.forwarded_pools_key)
+        return set(json.loads(pools)) if pools else set()
+
+    def record_forwarded_pools(self, pools):
+        """Record manually created pools forwarded to the remote cluster.
+
+        Only the leader may call this, leader settings are only updated when
+        the pools changed.
+
+        :param pools: Pool names
+        :type pools: Iterable[str]
+        """
+        pools = set(pools)
+        if pools != self.forwarded_pools():
+            ch_core.hookenv.leader_set(
+                {self.forwarded_pools_key: json.dumps(sorted(pools))})
+
+    def pools_sweep_due(self):
+        """Check whether every pool should be revisited.
+
+        Outside of a sweep only pools that changed are looked at.
+
+        :returns: True if the last sweep is older than
+                  ``pool-revalidate-interval`` seconds
+        :rtype: bool
+        """
+        swept = ch_core.unitdata.kv().get(self.pools_swept_key)
+        return (not swept or time.time() - swept >=
+                (self.config.get('pool-revalidate-interval') or 0))
+
+    def record_pools_sweep(self):
+        """Record that every pool was revisited."""
+        ch_core.unitdata.kv().set(self.pools_swept_key, time.time())
 
     def mirror_pools_summary(self, pools):
+        """Summarize mirror status of pools.
+
+        With the ``status-source`` config option set to ``admin-socket``
+        status of the pools the local daemon replays on its own is taken from
+        its admin socket in a single call.  Status of the other pools, or of
+        every pool when the socket is not available, is queried from the
+        cluster.
+
+        Pool status is collected concurrently, bounded by the
+        ``status-concurrency`` config option.  Pools that have not reported
+        within ``status-timeout`` seconds are left out of the summary and
+        listed in ``pools_timed_out``.
+
+        :param pools: Pool names
+        :type pools: Iterable[str]
+        :returns: Pool health and image state counts, in total and per pool
+                  in ``pools``
+        :rtype: Dict[str,any]
+        :raises: backend.CEPH_ERRORS
+        """
+        pools = list(pools)
+        daemon_pools = {}
+        if self.config.get('status-source') == 'admin-socket':
+            status = backend.daemon_mirror_status(self.ceph_id)
+            if status is not None:
+                daemon_pools = backend.daemon_pools_status(status)
+            ch_core.hookenv.log('Status of {} of {} pools from admin socket'
+                                .format(len(set(pools) & set(daemon_pools)),
+                                        len(pools)),
+                                level=ch_core.hookenv.DEBUG)
+        outcome = map_concurrently(
+            self.mirror_pool_status,
+            [pool for pool in pools if pool not in daemon_pools],
+            concurrency=self.config.get('status-concurrency') or 1,
+            timeout=self.config.get('status-timeout') or None)
+        outcome.results.update(
+            (pool, daemon_pools[pool]) for pool in pools
+            if pool in daemon_pools)
+        if outcome.errors:
+            raise next(iter(outcome.errors.values()))
+        if outcome.pending:
+            ch_core.hookenv.log('Timed out retrieving mirror pool status for '
+                                'pools: "{}"'.format(outcome.pending),
+                                level=ch_core.hookenv.WARNING)
         stats = {}
         stats['pool_health'] = collections.defaultdict(int)
         stats['image_states'] = collections.defaultdict(int)
-        for pool in pools:
-            pool_stat = self.mirror_pool_status(pool)
+        stats['pools_timed_out'] = sorted(outcome.pending)
+        stats['pools'] = {}
+        for pool, pool_stat in outcome.results.items():
             stats['pool_health'][pool_stat['summary']['health']] += 1
             for state, value in pool_stat['summary']['states'].items():
                 stats['image_states'][state] += value
+            stats['pools'][pool] = {
+                'health': pool_stat['summary']['health'],
+                'states': pool_stat['summary']['states'],
+            }
         return stats
 
-    def mirror_pool_enable(self, pool, mode='pool'):
-        base_cmd = ['rbd', '--id', self.ceph_id, 'mirror', 'pool']
-        subprocess.check_call(base_cmd + ['enable', pool, mode])
-        subprocess.check_call(base_cmd + ['peer', 'add', pool,
-                                          'client.{}@remote'
-                                          .format(self.ceph_id)])
-
-    def pools_in_broker_request(self, rq, ops_to_check=None):
-        """Extract pool names touched by a broker request.
-
-        :param rq: Ceph Broker Request Object
-        :type rq: ch_ceph.CephBrokerRq
-        :param ops_to_check: Set providing which ops to check
-        :type ops_to_check: Optional[Set[str]]
-        :returns: Set of pool names
-        :rtype: Set[str]
+    def cached_mirror_pools_summary(self, pools):
+        """Summarize mirror status of pools, reusing a recent summary.
+
+        The summary is kept in unitdata so that hooks executing in quick
+        succession do not each query every pool.  A summary is reused for the
+        same set of pools for up to ``status-cache-max-age`` seconds.
+        Partial summaries are not kept.
+
+        :param pools: Pool names
+        :type pools: Iterable[str]
+        :returns: Pool health and image state counts
+        :rtype: Dict[str,any]
+        :raises: backend.CEPH_ERRORS
+        """
+        pools = sorted(pools)
+        fingerprint = hashlib.sha256(
+            json.dumps(pools).encode('utf-8')).hexdigest()
+        kv = ch_core.unitdata.kv()
+        cached = kv.get(self.pools_summary_key)
+        if (cached and cached['fingerprint'] == fingerprint and
+                time.time() - cached['timestamp'] <
+                (self.config.get('status-cache-max-age') or 0)):
+            return cached['stats']
+        stats = self.mirror_pools_summary(pools)
+        if not stats.get('pools_timed_out'):
+            kv.set(self.pools_summary_key, {
+                'fingerprint': fingerprint,
+                'timestamp': time.time(),
+                'stats': stats,
+            })
+        return stats
+
+    def metrics_due(self):
+        """Check whether the Prometheus metrics file needs refreshing.
+
+        :returns: True if export is enabled and the file is missing or older
+                  than ``prometheus-textfile-interval`` seconds
+        :rtype: bool
+        """
+        directory = self.config.get('prometheus-textfile-dir')
+        if not directory:
+            return False
+        return file_outdated(
+            os.path.join(directory, metrics.TEXTFILE_NAME),
+            self.config.get('prometheus-textfile-interval'))
+
+    def collect_mirror_pool_status(self, pools):
+        """Get verbose mirror status of pools without failing on errors.
+
+        One verbose mirror status query is made per pool, bounded by the
+        ``status-concurrency`` and ``status-timeout`` config options.
+
+        :param pools: Pool names
+        :type pools: Iterable[str]
+        :returns: Map of pool name to status and list of pools status could
+                  not be retrieved for
+        :rtype: Tuple[Dict[str,Dict[str,any]],List[str]]
+        """
+        outcome = map_concurrently(
+            lambda pool: self.mirror_pool_status(pool, verbose=True),
+            pools,
+            concurrency=self.config.get('status-concurrency') or 1,
+            timeout=self.config.get('status-timeout') or None)
+        for pool, error in outcome.errors.items():
+            ch_core.hookenv.log('Unable to retrieve mirror pool status for '
+                                'pool "{}": "{}"'.format(pool, error),
+                                level=ch_core.hookenv.WARNING)
+        return outcome.results, list(outcome.errors) + outcome.pending
+
+    def export_metrics(self, pools):
+        """Write mirror metrics for pools to the textfile collector directory.
+
+        Pools whose status could not be retrieved are exported as such rather
+        than failing the export.
+
+        :param pools: Pool names
+        :type pools: Iterable[str]
+        :returns: Path to the metrics file
+        :rtype: str
+        """
+        start = time.time()
+        pool_status, failed_pools = self.collect_mirror_pool_status(pools)
+        text = metrics.format_metrics(
+            pool_status, failed_pools, time.time() - start, start)
+        return metrics.write_textfile(
+            self.config['prometheus-textfile-dir'], text)
+
+    def status_snapshot_due(self):
+        """Check whether the status snapshot for NRPE needs refreshing.
+
+        :returns: True if the snapshot is missing or older than
+                  ``nagios-snapshot-interval`` seconds
+        :rtype: bool
         """
-        assert rq.api_version == 1
-        ops_to_check = ops_to_check or set(('create-pool',))
-        result_set = set()
-        for op in rq.ops:
-            if op['op'] in ops_to_check:
-                result_set.add(op['name'])
-        return result_set
+        return file_outdated(STATUS_SNAPSHOT_FILE,
+                             self.config.get('nagios-snapshot-interval'))
+
+    def write_status_snapshot(self, pools):
+        """Write summary of mirror status of pools for the NRPE checks.
+
+        The checks run frequently and only read this file, which keeps them
+        from querying both clusters on every run.
+
+        :param pools: Pool names
+        :type pools: Iterable[str]
+        :raises: OSError
+        """
+        pool_status, failed_pools = self.collect_mirror_pool_status(pools)
+        snapshot = {
+            'timestamp': time.time(),
+            'pools': {},
+            'failed_pools': sorted(failed_pools),
+        }
+        for pool, status in pool_status.items():
+            data = {
+                'health': status['summary']['health'],
+                'states': status['summary']['states'],
+                'error_images': [],
+                'max_entries_behind_primary': None,
+                'max_lag_image': None,
+            }
+            for image in status.get('images', []):
+                if image['state'].split('+')[-1] == 'error':
+                    data['error_images'].append(image['name'])
+                lag = backend.image_replay_status(
+                    image)['entries_behind_primary']
+                if lag is not None and (
+                        data['max_entries_behind_primary'] is None or
+                        lag > data['max_entries_behind_primary']):
+                    data['max_entries_behind_primary'] = lag
+                    data['max_lag_image'] = image['name']
+            snapshot['pools'][pool] = data
+        metrics.replace_file(STATUS_SNAPSHOT_FILE,
+                             json.dumps(snapshot, sort_keys=True),
+                             perms=0o644)
+
+    def update_nrpe_config(self):
+        """Install check script and register NRPE checks."""
+        ch_core.host.mkdir(NAGIOS_PLUGINS)
+        nrpe.copy_nrpe_checks(nrpe_files_dir=os.path.join(
+            ch_core.hookenv.charm_dir(), 'files', 'nrpe'))
+        check = os.path.join(NAGIOS_PLUGINS, 'check_ceph_rbd_mirror.py')
+        check_args = '--snapshot {} --max-age {}'.format(
+            STATUS_SNAPSHOT_FILE, self.config.get('nagios-snapshot-max-age'))
+        nrpe_setup = nrpe.NRPE(hostname=nrpe.get_nagios_hostname())
+        nrpe.add_init_service_checks(nrpe_setup, self.services,
+                                     nrpe.get_nagios_unit_name())
+        nrpe_setup.add_check(
+            shortname='rbd_mirror_health',
+            description='Ceph RBD mirror pool health',
+            check_cmd='{} health {}'.format(check, check_args))
+        nrpe_setup.add_check(
+            shortname='rbd_mirror_image_errors',
+            description='Ceph RBD mirror images in error state',
+            check_cmd='{} errors {} -w {} -c {}'.format(
+                check, check_args,
+                self.config.get('nagios-image-errors-warning'),
+                self.config.get('nagios-image-errors-critical')))
+        nrpe_setup.add_check(
+            shortname='rbd_mirror_lag',
+            description='Ceph RBD mirror replication lag',
+            check_cmd='{} lag {} -w {} -c {}'.format(
+                check, check_args,
+                self.config.get('nagios-lag-warning'),
+                self.config.get('nagios-lag-critical')))
+        nrpe_setup.write()
 
-    def pool_mirroring_mode(self, pool, broker_requests=[]):
-        """Get the Ceph RBD mirroring mode for the pool.
+    def invalidate_mirror_pools_summary(self):
+        """Force next status assessment to query pools."""
+        ch_core.unitdata.kv().unset(self.pools_summary_key)
 
-        Checks if the pool RBD mirroring mode was explicitly set as part of
-        the 'create-pool' operation into any of the given broker requests.
-        If this is true, its value is returned, otherwise the default 'pool'
-        mirroring mode is used.
+    def _mirror_pool_configure(self, pool, mode):
+        """Enable mirroring mode and add peer for pool where missing.
 
         :param pool: Pool name
         :type pool: str
-        :param broker_requests: List of broker requests
-        :type broker_requests: List[ch_ceph.CephBrokerRq]
-        :returns: Ceph RBD mirroring mode
-        :rtype: str
+        :param mode: Ceph RBD mirroring mode, ``pool``, ``image`` or
+                     ``snapshot``
+        :type mode: str
+        :returns: Steps performed, e.g. ``enable`` and ``peer-add``
+        :rtype: List[str]
         """
-        default_mirroring_mode = 'pool'
-        for rq in broker_requests:
+        steps = []
+        # Snapshot based mirroring is enabled per image in pools with the
+        # ``image`` mirroring mode.
+        pool_mode = 'image' if mode == 'snapshot' else mode
+        try:
+            if not self.mirror_pool_enabled(pool, pool_mode):
+                self.backend.mirror_pool_enable(pool, pool_mode)
+                steps.append('enable')
+            if not self.mirror_pool_has_peers(pool):
+                self.backend.mirror_pool_peer_add(
+                    pool, 'client.{}@remote'.format(self.ceph_id))
+                steps.append('peer-add')
+            if mode == 'snapshot':
+                steps.extend(self._mirror_snapshot_configure(pool))
+        finally:
+            if steps:
+                self.query_cache.invalidate(pool)
+        return steps
+
+    def _mirror_snapshot_configure(self, pool):
+        """Enable snapshot mirroring for images and reconcile schedules.
+
+        Images with mirroring enabled are found with one bulk status query,
+        only the images missing from it are enabled.  Images that already
+        have journal based mirroring enabled are left alone.  Schedules are
+        only managed when the ``snapshot-schedule-interval`` config option
+        is set.
+
+        :param pool: Pool name
+        :type pool: str
+        :returns: Steps performed
+        :rtype: List[str]
+        :raises: ValueError
+        """
+        steps = []
+        images = self.backend.image_list(pool)
+        if images:
+            mirrored = self.mirrored_images(pool)
+            disabled = [image for image in images if image not in mirrored]
+            for image in disabled:
+                self.backend.mirror_image_enable(pool, image, 'snapshot')
+            if disabled:
+                steps.append('image-enable ({})'.format(len(disabled)))
+        desired = set(self.snapshot_schedule_intervals())
+        if not desired:
+            return steps
+        current = set(
+            schedule['interval'] for schedule in
+            self.backend.mirror_snapshot_schedule_list(pool))
+        for interval in sorted(desired - current):
+            self.backend.mirror_snapshot_schedule_add(pool, interval)
+            steps.append('schedule-add {}'.format(interval))
+        for interval in sorted(current - desired):
+            self.backend.mirror_snapshot_schedule_remove(pool, interval)
+            steps.append('schedule-remove {}'.format(interval))
+        return steps
+
+    def mirror_pools_enable(self, pools):
+        """Configure mirroring for many pools concurrently.
+
+        Pools are processed by a bounded pool of workers as given by the
+        ``enable-concurrency`` config option.  For each pool the mirroring
+        mode is set unless already set, and the remote peer is added unless
+        the pool already has a peer.  A failure for one pool does not abort
+        the others.
+
+        :param pools: Map of pool name to Ceph RBD mirroring mode, ``pool``,
+                      ``image`` or ``snapshot``
+        :type pools: Dict[str,str]
+        :returns: Map of pool name to steps performed, map of pool name to
+                  exception for pools that failed and an empty list of
+                  pending pools
+        :rtype: ConcurrentResult
+        """
+        outcome = map_concurrently(
+            lambda pool: self._mirror_pool_configure(pool, pools[pool]),
+            pools,
+            concurrency=self.config.get('enable-concurrency') or 1)
+        if any(outcome.results.values()) or outcome.errors:
+            self.invalidate_mirror_pools_summary()
+        return outcome
+
+    def mirror_pools_role_change(self, action, pools, force=False,
+                                 concurrency=1, timeout=None, callback=None,
+                                 cluster=None):
+        """Promote or demote many pools concurrently, timing each pool.
+
+        A pool that fails or does not complete within ``timeout`` seconds
+        does not abort the others, the ``rbd`` process of a pool that timed
+        out is killed.
+
+        :param action: ``promote`` or ``demote``
+        :type action: str
+        :param pools: Pool names
+        :type pools: Iterable[str]
+        :param force: Pass ``--force`` to ``rbd``
+        :type force: bool
+        :param concurrency: Maximum number of pools to process concurrently
+        :type concurrency: int
+        :param timeout: Seconds to allow per pool, ``None`` for the timeout
+                        configured for the command, ``backend.NO_TIMEOUT``
+                        for no limit
+        :type timeout: Optional[float]
+        :param callback: Called with pool, result and exception as each pool
+                         completes, see ``map_concurrently``
+        :type callback: Optional[Callable[[str, Dict[str,any],
+                                           Optional[Exception]], None]]
+        :param cluster: Cluster name, e.g. ``remote``
+        :type cluster: Optional[str]
+        :returns: Map of pool name to result with ``duration`` in seconds and
+                  either ``output`` or ``error``
+        :rtype: ConcurrentResult
+        """
+        cmd = ['rbd', '--id', self.ceph_id]
+        if cluster:
+            cmd += ['--cluster', cluster]
+        cmd += ['mirror', 'pool', action]
+        if force:
+            cmd.append('--force')
+
+        def _role_change(pool):
+            start = time.time()
+            try:
+                output = backend.check_output(
+                    cmd + [pool], 'pool {}'.format(action), pool,
+                    cluster=cluster, stderr=subprocess.STDOUT,
+                    universal_newlines=True, timeout=timeout)
+            except subprocess.TimeoutExpired as e:
+                result = {'error': 'timed out after {}s'.format(e.timeout)}
+            except subprocess.CalledProcessError as e:
+                result = {'error': (e.output or '').rstrip() or str(e)}
+            except backend.CircuitOpenError as e:
+                result = {'error': str(e)}
+            else:
+                result = {'output': output.rstrip()}
+            result['duration'] = round(time.time() - start, 3)
+            return result
+
+        try:
+            return map_concurrently(_role_change, pools,
+                                    concurrency=concurrency,
+                                    callback=callback)
+        finally:
+            self.invalidate_mirror_pools_summary()
+
+    def mirror_pools_check_sync(self, pools, cluster=None, concurrency=1):
+        """Find images of the pools that cannot get in sync.
+
+        Meant to be run against the non-primary cluster before demoting the
+        primary images, as images that do not replay would be left without
+        a primary.
+
+        :param pools: Pool names
+        :type pools: Iterable[str]
+        :param cluster: Cluster name of the non-primary images
+        :type cluster: Optional[str]
+        :param concurrency: Maximum number of pools to query concurrently
+        :type concurrency: int
+        :returns: Names of the images that cannot get in sync per pool, and
+                  errors per pool whose status could not be retrieved
+        :rtype: ConcurrentResult
+        """
+        def _check(pool):
+            status = self.backend.mirror_pool_status(
+                pool, verbose=True, cluster=cluster)
+            return sorted(image['name'] for image in status.get('images', [])
+                          if not backend.image_can_sync(image))
+
+        return map_concurrently(_check, pools, concurrency=concurrency)
+
+    def mirror_pools_await_sync(self, pools, cluster=None, timeout=None,
+                                concurrency=1, min_interval=1,
+                                max_interval=30):
+        """Poll mirror status until every image of the pools is in sync.
+
+        Each round queries verbose status of the pools not in sync yet, one
+        call per pool.  The interval between rounds is reset to
+        ``min_interval`` while images keep catching up and doubles up to
+        ``max_interval`` while they do not.
+
+        :param pools: Pool names
+        :type pools: Iterable[str]
+        :param cluster: Cluster name of the non-primary images
+        :type cluster: Optional[str]
+        :param timeout: Seconds to wait at most, ``None`` to wait indefinitely
+        :type timeout: Optional[float]
+        :param concurrency: Maximum number of pools to query concurrently
+        :type concurrency: int
+        :param min_interval: Minimum seconds between rounds
+        :type min_interval: float
+        :param max_interval: Maximum seconds between rounds
+        :type max_interval: float
+        :returns: Dictionary with ``time_to_consistent``, map of pool name to
+                  seconds until it was in sync, ``held_up``, map of pool name
+                  to images still catching up in the round before the pool
+                  was in sync, ``lagging``, map of pool name to images not in
+                  sync at the deadline, and the number of ``rounds``
+        :rtype: Dict[str,any]
+        """
+        start = time.time()
+        remaining = set(pools)
+        result = {
+            'time_to_consistent': {},
+            'held_up': {},
+            'lagging': {},
+            'rounds': 0,
+        }
+        interval = min_interval
+        behind = None
+        while True:
+            outcome = map_concurrently(
+                lambda pool: self.backend.mirror_pool_status(
+                    pool, verbose=True, cluster=cluster),
+                sorted(remaining), concurrency=concurrency)
+            result['rounds'] += 1
+            now = time.time()
+            for pool, error in outcome.errors.items():
+                ch_core.hookenv.log('Unable to retrieve mirror status of '
+                                    'pool "{}": "{}"'.format(pool, error),
+                                    level=ch_core.hookenv.WARNING)
+            for pool, status in outcome.results.items():
+                lagging = sorted(
+                    image['name'] for image in status.get('images', [])
+                    if not backend.image_in_sync(image))
+                if lagging:
+                    result['lagging'][pool] = lagging
+                    continue
+                remaining.discard(pool)
+                result['time_to_consistent'][pool] = round(now - start, 3)
+                if pool in result['lagging']:
+                    result['held_up'][pool] = result['lagging'].pop(pool)
+            if not remaining:
+                break
+            count = sum(len(images)
+                        for images in result['lagging'].values())
+            if behind is not None and count >= behind:
+                interval = min(interval * 2, max_interval)
+            else:
+                interval = min_interval
+            behind = count
+            delay = interval
+            if timeout is not None:
+                delay = min(delay, start + timeout - now)
+                if delay <= 0:
+                    # Pools whose status could not be retrieved are lagging
+                    # without known images
+                    for pool in remaining:
+                        result['lagging'].setdefault(pool, [])
+                    break
+            time.sleep(delay)
+        return result
+
+    def broker_request_pool_index(self, broker_requests):
+        """Index pools created by broker requests.
+
+        Building the index once allows looking up mirroring mode and origin
+        of any number of pools without rescanning the requests for each.
+        When multiple requests create the same pool the first one wins.
+
+        :param broker_requests: List of tuples with origin of request, e.g.
+                                ``local`` or ``remote``, and the request
+        :type broker_requests: List[Tuple[str,Optional[ch_ceph.CephBrokerRq]]]
+        :returns: Map of pool name to dictionary with ``mode`` and ``origin``
+        :rtype: Dict[str,Dict[str,str]]
+        """
+        index = {}
+        for origin, rq in broker_requests:
             if not rq:
                 continue
             assert rq.api_version == 1
             for op in rq.ops:
-                if op['op'] == 'create-pool' and op['name'] == pool:
-                    return op.get(
-                        'rbd-mirroring-mode', default_mirroring_mode)
-        return default_mirroring_mode
+                if op['op'] == 'create-pool' and op['name'] not in index:
+                    index[op['name']] = {
+                        'mode': op.get('rbd-mirroring-mode',
+                                       self.default_mirroring_mode),
+                        'origin': origin,
+                    }
+        return index
 
     def collapse_and_filter_broker_requests(self, broker_requests,
                                             allowed_ops, require_vp=None):
@@ -221,6 +1277,10 @@ class CephRBDMirrorCharm(charms_openstack.plugins.CephCharm):
         """
         require_vp = require_vp or {}
         new_rq = ch_ceph.CephBrokerRq()
+        # ``CephBrokerRq.add_op`` deduplicates by list membership which is
+        # quadratic in the number of ops, keep track of seen ops in a set.
+        seen = set()
+        ops = []
         for rq in broker_requests:
             assert rq['api-version'] == 1
             for op in rq['ops']:
@@ -229,6 +1289,49 @@ class CephRBDMirrorCharm(charms_openstack.plugins.CephCharm):
                         if k not in op or op[k] != v:
                             break
                     else:
-                        new_rq.add_op(op)
-        if len(new_rq.ops):
+                        key = json.dumps(op, sort_keys=True)
+                        if key not in seen:
+                            seen.add(key)
+                            ops.append(op)
+        if ops:
+            new_rq.set_ops(ops)
             return new_rq
+
+    def add_replicated_pool_ops(self, rq, pools):
+        """Add ops creating replicated pools to a broker request.
+
+        ``CephBrokerRq.add_op`` checks every op already in the request for
+        duplicates, which is quadratic when adding many pools.  Each op is
+        built on a scratch request and all of them are appended at once, the
+        pools must not be created by the request already.
+
+        :param rq: Broker request to add to, ``None`` to start a new one
+        :type rq: Optional[ch_ceph.CephBrokerRq]
+        :param pools: Map of pool name to pool attributes as provided over
+                      the relation
+        :type pools: Dict[str,Dict[str,any]]
+        :returns: Broker request
+        :rtype: ch_ceph.CephBrokerRq
+        """
+        if not rq:
+            rq = ch_ceph.CephBrokerRq()
+        ops = []
+        for pool, attrs in sorted(pools.items()):
+            pg_num = attrs['parameters'].get('pg_num')
+            max_bytes = attrs['quota'].get('max_bytes')
+            max_objects = attrs['quota'].get('max_objects')
+            size = attrs['parameters'].get('size')
+            op_rq = ch_ceph.CephBrokerRq()
+            op_rq.add_op_create_replicated_pool(
+                pool,
+                replica_count=size if not size else int(size),
+                pg_num=pg_num if not pg_num else int(pg_num),
+                app_name='rbd',
+                max_bytes=max_bytes if not max_bytes else int(max_bytes),
+                max_objects=max_objects if not max_objects else int(
+                    max_objects),
+            )
+            ops.extend(op_rq.ops)
+        if ops:
+            rq.set_ops(rq.ops + ops)
+        return rq
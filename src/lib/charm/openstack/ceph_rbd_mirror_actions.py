@@ -0,0 +1,396 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Action helpers and read-only actions.
+
+This module must not import the reactive framework nor charms.openstack so
+that read-only actions can be served without bootstrapping them, see
+``actions/query_actions.py``.
+"""
+
+import collections
+import concurrent.futures
+import json
+import os
+import subprocess
+import time
+
+import charmhelpers.core as ch_core
+
+import charm.openstack.ceph_rbd_mirror_backend as backend
+import charm.openstack.ceph_rbd_mirror_sharding as sharding
+
+# unitdata key for names of pools eligible for mirroring, recorded by hooks
+ELIGIBLE_POOLS_KEY = 'ceph-rbd-mirror.eligible-pools'
+
+# Directory for files with complete action results
+ACTION_RESULTS_DIR = '/var/lib/charm/ceph-rbd-mirror/action-results'
+# Maximum size of results returned inline in the action output
+MAX_INLINE_OUTPUT = 16 * 1024
+# Number of result files kept, older ones are removed when a new one is opened
+MAX_ACTION_RESULTS = 20
+# Result files older than this many seconds are removed regardless of count
+MAX_ACTION_RESULTS_AGE = 7 * 24 * 3600
+
+
+def prune_action_results(keep=MAX_ACTION_RESULTS,
+                         max_age=MAX_ACTION_RESULTS_AGE):
+    """Remove old action result files.
+
+    :param keep: Number of most recent result files to keep
+    :type keep: int
+    :param max_age: Remove result files older than this many seconds
+    :type max_age: int
+    """
+    entries = []
+    for name in os.listdir(ACTION_RESULTS_DIR):
+        if not name.endswith('.jsonl'):
+            continue
+        path = os.path.join(ACTION_RESULTS_DIR, name)
+        try:
+            entries.append((os.stat(path).st_mtime, path))
+        except FileNotFoundError:
+            continue
+    entries.sort(reverse=True)
+    oldest = time.time() - max_age
+    for index, (mtime, path) in enumerate(entries):
+        if index < keep and mtime >= oldest:
+            continue
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+class ActionResults(object):
+    """Stream per-item action results to a JSON lines file on disk.
+
+    Results are kept in memory for the inline action output only as long as
+    they fit within ``MAX_INLINE_OUTPUT``.  Opening a new results file prunes
+    old ones, see ``prune_action_results``.
+    """
+
+    def __init__(self, action_name):
+        os.makedirs(ACTION_RESULTS_DIR, exist_ok=True)
+        prune_action_results(keep=MAX_ACTION_RESULTS - 1)
+        self.path = os.path.join(
+            ACTION_RESULTS_DIR, '{}-{}.jsonl'.format(
+                action_name,
+                ch_core.hookenv.action_uuid() or int(time.time())))
+        self.count = 0
+        self.truncated = False
+        self._inline = collections.OrderedDict()
+        self._inline_size = 0
+        self._file = open(self.path, 'w')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self._file.close()
+
+    def add(self, key, value):
+        """Add result.
+
+        :param key: Name of item the result is for, e.g. pool name
+        :type key: str
+        :param value: Result, must be JSON serializable
+        :type value: any
+        """
+        line = json.dumps({'key': key, 'value': value})
+        self._file.write(line + '\n')
+        self.count += 1
+        if self.truncated:
+            return
+        self._inline_size += len(line)
+        if self._inline_size > MAX_INLINE_OUTPUT:
+            self.truncated = True
+            self._inline.clear()
+        else:
+            self._inline[key] = value
+
+    def output(self, as_json=False, sort=False):
+        """Get inline action output.
+
+        :param as_json: Format output as a JSON object
+        :type as_json: bool
+        :param sort: Sort results by key
+        :type sort: bool
+        :returns: Results, or a pointer to the results file when the results
+                  do not fit inline
+        :rtype: str
+        """
+        if self.truncated:
+            return ('{} results too large for inline output, see {}'
+                    .format(self.count, self.path))
+        items = self._inline.items()
+        if sort:
+            items = sorted(items)
+        if as_json:
+            return json.dumps(collections.OrderedDict(items))
+        return '\n'.join('{}: {}'.format(key, value) for key, value in items)
+
+    def action_set(self, extra=None, as_json=False, sort=False):
+        """Set action results.
+
+        :param extra: Additional results to set
+        :type extra: Optional[Dict[str,any]]
+        :param as_json: Format output as a JSON object
+        :type as_json: bool
+        :param sort: Sort results by key
+        :type sort: bool
+        """
+        results = {
+            'output': self.output(as_json=as_json, sort=sort),
+            'results-file': self.path,
+            'count': self.count,
+        }
+        results.update(extra or {})
+        ch_core.hookenv.action_set(results)
+
+
+def get_pools():
+    """Get the list of pools given as parameter to perform the actions on."""
+    pools = ch_core.hookenv.action_get('pools')
+    if pools:
+        return [p.strip() for p in pools.split(',')]
+    return None
+
+
+def get_page(items):
+    """Select page of items given by the offset and limit parameters.
+
+    :param items: Items to select from
+    :type items: Iterable[any]
+    :returns: Page of items and total number of items
+    :rtype: Tuple[List[any],int]
+    """
+    items = sorted(items)
+    offset = ch_core.hookenv.action_get('offset') or 0
+    limit = ch_core.hookenv.action_get('limit')
+    if limit:
+        return items[offset:offset + limit], len(items)
+    return items[offset:], len(items)
+
+
+def mirror_pool_action(action_name, ceph_id, pools, total):
+    """Run ``rbd mirror pool <action>`` for pools and set action results.
+
+    :param action_name: Name of action, e.g. ``status``
+    :type action_name: str
+    :param ceph_id: Ceph client id to run commands as
+    :type ceph_id: str
+    :param pools: Pool names
+    :type pools: List[str]
+    :param total: Total number of pools before paging
+    :type total: int
+    """
+    cmd = ['rbd', '--id', ceph_id, 'mirror', 'pool', action_name]
+    if ch_core.hookenv.action_get('verbose'):
+        cmd += ['--verbose']
+    output_format = ch_core.hookenv.action_get('format')
+    if output_format:
+        cmd += ['--format', output_format]
+    with ActionResults(action_name) as results:
+        for pool in pools:
+            output = backend.check_output(
+                cmd + [pool], 'pool {}'.format(action_name), pool,
+                stderr=subprocess.STDOUT, universal_newlines=True)
+            if output_format == 'json':
+                results.add(pool, json.loads(output))
+            else:
+                results.add(pool, output.rstrip())
+        results.action_set({'total': total},
+                           as_json=output_format == 'json')
+
+
+def status(args):
+    """Get mirror pool status without loading the charm class.
+
+    Pools eligible for mirroring are taken from the record hooks keep in
+    unitdata rather than from the relation, limited to the shard of the
+    unit.
+    """
+    pools = get_pools()
+    if not pools:
+        pools = ch_core.unitdata.kv().get(ELIGIBLE_POOLS_KEY)
+        if pools is None:
+            ch_core.hookenv.action_fail(
+                'Pools not known yet, retry after the next hook has run or '
+                'provide the pools parameter')
+            return
+        pools = sharding.local_shard(pools)
+    pools, total = get_page(pools)
+    mirror_pool_action('status', backend.local_ceph_id(), pools, total)
+
+
+def hook_stats(args):
+    """Get Ceph call statistics of the most recent hooks and actions."""
+    count = ch_core.hookenv.action_get('count') or 10
+    ch_core.hookenv.action_set({
+        'output': json.dumps(backend.read_hook_stats(count), sort_keys=True),
+    })
+
+
+def lag_estimates(samples):
+    """Estimate drain rate and time to sync of images from samples.
+
+    :param samples: Map of image key to list of ``(timestamp,
+                    entries_behind_primary)`` tuples in sample order
+    :type samples: Dict[any,List[Tuple[float,int]]]
+    :returns: Map of image key to dictionary with ``entries-behind`` of the
+              last sample, ``drain-rate`` in entries per second and ``eta``
+              in seconds, ``None`` when the image is not catching up
+    :rtype: Dict[any,Dict[str,Optional[float]]]
+    """
+    estimates = {}
+    for key, values in samples.items():
+        (first_time, first), (last_time, last) = values[0], values[-1]
+        elapsed = last_time - first_time
+        rate = (first - last) / elapsed if elapsed > 0 else 0.0
+        if not last:
+            eta = 0.0
+        elif rate > 0:
+            eta = round(last / rate, 1)
+        else:
+            eta = None
+        estimates[key] = {
+            'entries-behind': last,
+            'drain-rate': round(rate, 2),
+            'eta': eta,
+        }
+    return estimates
+
+
+def _max_eta(etas):
+    """Get the longest time to sync, ``None`` standing for never."""
+    etas = list(etas)
+    if any(eta is None for eta in etas):
+        return None
+    return max(etas, default=0.0)
+
+
+def readiness(args):
+    """Assess how far the secondary images are behind before a failover.
+
+    Verbose mirror status of every pool is sampled ``samples`` times,
+    ``interval`` seconds apart.  Lag is taken from the journal replay
+    progress the daemon reports per image, images without it, e.g. using
+    snapshot based mirroring, are counted as unmeasured.  Progress is
+    counted in journal entries rather than time, which rules out checking
+    an RPO.  Instead ``max-time-to-sync`` is met when every measured image
+    is estimated to catch up within that many seconds and no image is in
+    error.
+    """
+    pools = get_pools()
+    if not pools:
+        pools = ch_core.unitdata.kv().get(ELIGIBLE_POOLS_KEY)
+        if pools is None:
+            ch_core.hookenv.action_fail(
+                'Pools not known yet, retry after the next hook has run or '
+                'provide the pools parameter')
+            return
+    pools = sorted(pools)
+    cluster = ('remote' if ch_core.hookenv.action_get('endpoint') ==
+               'ceph-remote' else None)
+    count = max(2, ch_core.hookenv.action_get('samples') or 2)
+    interval = ch_core.hookenv.action_get('interval') or 0
+    max_time_to_sync = ch_core.hookenv.action_get('max-time-to-sync')
+    top = ch_core.hookenv.action_get('top') or 10
+    concurrency = ch_core.hookenv.action_get('concurrency') or 1
+    cli = backend.CLIBackend(backend.local_ceph_id())
+
+    def _sample(pool):
+        timestamp = time.time()
+        try:
+            return timestamp, cli.mirror_pool_status(
+                pool, verbose=True, cluster=cluster)
+        except backend.CEPH_ERRORS + (ValueError,) as e:
+            ch_core.hookenv.log('Unable to get mirror status of pool {}: {}'
+                                .format(pool, e), level=ch_core.hookenv.ERROR)
+            return timestamp, None
+
+    samples = collections.defaultdict(list)
+    unmeasured = collections.defaultdict(set)
+    errors = collections.defaultdict(set)
+    failed = set()
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=concurrency) as executor:
+        for n in range(count):
+            if n:
+                time.sleep(interval)
+            for pool, (timestamp, status) in zip(
+                    pools, executor.map(_sample, pools)):
+                if status is None:
+                    failed.add(pool)
+                    continue
+                for image in status.get('images', []):
+                    key = (pool, image['name'])
+                    if image.get('state', '').endswith('error'):
+                        errors[pool].add(image['name'])
+                    behind = backend.image_replay_status(image)[
+                        'entries_behind_primary']
+                    if behind is None:
+                        unmeasured[pool].add(image['name'])
+                    else:
+                        samples[key].append((timestamp, behind))
+    estimates = lag_estimates(
+        {key: values for key, values in samples.items()
+         if len(values) > 1})
+    by_pool = collections.defaultdict(dict)
+    for (pool, image), estimate in estimates.items():
+        by_pool[pool][image] = estimate
+    with ActionResults('readiness') as results:
+        for pool in pools:
+            images = by_pool.get(pool, {})
+            if pool in failed:
+                results.add(pool, {'error': 'mirror status unavailable'})
+                continue
+            results.add(pool, {
+                'images': len(images),
+                'unmeasured-images': len(unmeasured[pool] - set(images)),
+                'error-images': sorted(errors[pool]),
+                'entries-behind': sum(
+                    e['entries-behind'] for e in images.values()),
+                'eta': _max_eta(e['eta'] for e in images.values()),
+            })
+        eta = _max_eta(e['eta'] for e in estimates.values())
+        worst = sorted(
+            estimates.items(),
+            key=lambda item: (item[1]['eta'] is not None,
+                              -(item[1]['eta'] or 0),
+                              -item[1]['entries-behind']))
+        extra = {
+            'samples': count,
+            'failed-pools': len(failed),
+            'eta': 'never' if eta is None else '{:.1f}'.format(eta),
+            'error-images': sum(len(images) for images in errors.values()),
+            'worst-images': json.dumps([
+                dict(estimate, pool=pool, image=image)
+                for (pool, image), estimate in worst[:top]
+                if estimate['entries-behind']]),
+        }
+        if max_time_to_sync is not None:
+            extra['time-to-sync-met'] = (
+                eta is not None and eta <= max_time_to_sync and
+                not extra['error-images'] and not failed)
+        results.action_set(extra, as_json=True)
+
+
+# Actions served by ``actions/query_actions.py``
+QUERY_ACTIONS = {
+    'hook-stats': hook_stats,
+    'readiness': readiness,
+    'status': status,
+}
@@ -0,0 +1,1162 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import abc
+import atexit
+import collections
+import contextlib
+import errno
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import charmhelpers.core as ch_core
+
+# The rados and rbd Python bindings are installed from the distribution
+# packages below, when the librados backend is configured, to a directory
+# that is not on the path of the charm's virtualenv
+LIBRADOS_PACKAGES = ['python3-rados', 'python3-rbd']
+BINDINGS_PATH = '/usr/lib/python3/dist-packages'
+
+rados = None
+rbd = None
+
+
+# Image status states in the order they are enumerated by librbd, the names
+# match what the ``rbd`` CLI puts in its JSON output.
+MIRROR_IMAGE_STATUS_STATES = (
+    'unknown',
+    'error',
+    'syncing',
+    'starting_replay',
+    'replaying',
+    'stopping_replay',
+    'stopped',
+)
+
+MIRROR_MODES = ('disabled', 'image', 'pool')
+
+MIRROR_IMAGE_STATES = ('disabling', 'enabled', 'disabled')
+
+MIRROR_IMAGE_MODES = ('journal', 'snapshot')
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a cluster that repeatedly timed out."""
+    pass
+
+
+class DeadlineExceeded(subprocess.TimeoutExpired):
+    """Raised when a command runs into the deadline of its thread.
+
+    See ``deadline``, the command was cut short by the caller rather than
+    timing out on its own.
+    """
+    pass
+
+
+# Exceptions raised by the backends when a call to Ceph fails
+CEPH_ERRORS = (subprocess.CalledProcessError, subprocess.TimeoutExpired,
+               CircuitOpenError)
+
+
+def load_bindings():
+    """Import the rados and rbd Python bindings when installed.
+
+    Only the bindings are imported from ``BINDINGS_PATH``, it is removed
+    from ``sys.path`` again so that no other system package shadows the
+    packages of the virtualenv.  Their errors are added to ``CEPH_ERRORS``.
+
+    :returns: True if the bindings are available
+    :rtype: bool
+    """
+    global rados, rbd, CEPH_ERRORS
+    if rados and rbd:
+        return True
+    added = BINDINGS_PATH not in sys.path
+    if added:
+        sys.path.append(BINDINGS_PATH)
+    try:
+        import rados as rados_module
+        import rbd as rbd_module
+    except ImportError:
+        return False
+    finally:
+        if added:
+            sys.path.remove(BINDINGS_PATH)
+    rados, rbd = rados_module, rbd_module
+    CEPH_ERRORS += (rados.Error, rbd.Error)
+    return True
+
+
+load_bindings()
+
+# Seconds a Ceph command may run before it is killed, unless configured
+DEFAULT_COMMAND_TIMEOUT = 60
+# Default timeouts of commands expected to take longer, by verb
+COMMAND_TIMEOUTS = {
+    'pool status verbose': 120,
+    'pool promote': 300,
+    'pool demote': 300,
+}
+# Verbs that only read state and are therefore safe to retry
+RETRY_VERBS = frozenset((
+    'pool info',
+    'pool status',
+    'pool status verbose',
+    'image list',
+    'image info',
+    'snapshot schedule list',
+))
+# Number of retries of read-only commands, unless configured
+DEFAULT_COMMAND_RETRIES = 2
+# Delay before the first retry, doubled for every further retry
+RETRY_BACKOFF = 1.0
+RETRY_MAX_BACKOFF = 10.0
+# Exit codes of ``rbd``, the errno of the failed operation, worth a retry.
+# Other failures such as a missing pool or lacking permissions are not.
+TRANSIENT_RETURNCODES = frozenset((errno.EAGAIN, errno.EINTR,
+                                   errno.ETIMEDOUT))
+# Timeout passed to the command runner to let a command run indefinitely,
+# ``None`` stands for the timeout configured for the verb
+NO_TIMEOUT = 0
+
+# unitdata key for the circuit breaker state of each cluster
+CIRCUIT_BREAKER_KEY = 'ceph-rbd-mirror.circuit-breaker'
+# Consecutive timeouts after which calls to a cluster are suspended
+CIRCUIT_BREAKER_THRESHOLD = 3
+# Seconds calls to a cluster are suspended for, unless configured
+DEFAULT_CIRCUIT_BREAKER_COOLDOWN = 300
+
+
+# Admin socket of the rbd-mirror daemon, by Ceph client id
+ADMIN_SOCKET = '/var/run/ceph/ceph-client.{}.asok'
+
+# Image replayer states reported through the admin socket, mapped to the
+# image status states of ``rbd mirror pool status``
+DAEMON_IMAGE_STATES = {
+    'Starting': 'starting_replay',
+    'Replaying': 'replaying',
+    'Stopping': 'stopping_replay',
+    'Stopped': 'stopped',
+}
+
+# File per-hook summaries of Ceph calls are appended to
+HOOK_STATS_FILE = '/var/lib/charm/ceph-rbd-mirror/hook-stats.jsonl'
+# Size at which the file is rotated, one previous generation is kept
+HOOK_STATS_MAX_BYTES = 1024 * 1024
+
+
+def local_ceph_id():
+    """Get Ceph client id of the rbd-mirror daemon on this unit.
+
+    :returns: Ceph client id
+    :rtype: str
+    """
+    return 'rbd-mirror.{}'.format(socket.gethostname())
+
+
+def percentile(values, fraction):
+    """Get nearest-rank percentile of values.
+
+    :param values: Sorted values
+    :type values: List[float]
+    :param fraction: Percentile as a fraction, e.g. 0.95
+    :type fraction: float
+    :returns: Percentile
+    :rtype: float
+    """
+    if not values:
+        return 0.0
+    return values[max(0, min(len(values) - 1,
+                             int(round(fraction * len(values))) - 1))]
+
+
+class CallStats(object):
+    """Record duration and outcome of every call made to Ceph.
+
+    One instance collects the calls of the running hook or action, on exit a
+    summary per verb is logged and appended to ``HOOK_STATS_FILE``.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+        self._registered = False
+
+    @contextlib.contextmanager
+    def measure(self, verb, pool=None):
+        """Measure a call.
+
+        :param verb: Name of the operation, e.g. ``pool status``
+        :type verb: str
+        :param pool: Pool the call operates on
+        :type pool: Optional[str]
+        :returns: Dictionary for the caller to set ``output_size`` in
+        :rtype: Iterator[Dict[str,any]]
+        """
+        call = {'verb': verb, 'pool': pool, 'status': 0, 'output_size': None}
+        start = time.time()
+        try:
+            yield call
+        except subprocess.CalledProcessError as e:
+            call['status'] = e.returncode
+            raise
+        except Exception as e:
+            call['status'] = type(e).__name__
+            raise
+        finally:
+            call['duration'] = time.time() - start
+            with self._lock:
+                self.calls.append(call)
+                if not self._registered:
+                    ch_core.hookenv.atexit(self.flush)
+                    self._registered = True
+
+    def summary(self):
+        """Summarize calls per verb.
+
+        :returns: Map of verb to count, error count, output bytes and total,
+                  p50, p95 and max latency in seconds
+        :rtype: Dict[str,Dict[str,any]]
+        """
+        by_verb = collections.defaultdict(list)
+        with self._lock:
+            calls = list(self.calls)
+        for call in calls:
+            by_verb[call['verb']].append(call)
+        result = {}
+        for verb, verb_calls in sorted(by_verb.items()):
+            durations = sorted(call['duration'] for call in verb_calls)
+            result[verb] = {
+                'count': len(verb_calls),
+                'errors': sum(1 for call in verb_calls if call['status']),
+                'output_bytes': sum(call['output_size'] or 0
+                                    for call in verb_calls),
+                'total': round(sum(durations), 3),
+                'p50': round(percentile(durations, 0.5), 3),
+                'p95': round(percentile(durations, 0.95), 3),
+                'max': round(durations[-1], 3),
+            }
+        return result
+
+    def flush(self):
+        """Log summary and append it to the hook stats file."""
+        if not self.calls:
+            return
+        summary = self.summary()
+        ch_core.hookenv.log('Ceph call summary: {}'.format(summary),
+                            level=ch_core.hookenv.DEBUG)
+        entry = {
+            'timestamp': time.time(),
+            'hook': (os.environ.get('JUJU_ACTION_NAME') or
+                     ch_core.hookenv.hook_name()),
+            'summary': summary,
+        }
+        try:
+            os.makedirs(os.path.dirname(HOOK_STATS_FILE), exist_ok=True)
+            if (os.path.exists(HOOK_STATS_FILE) and
+                    os.path.getsize(HOOK_STATS_FILE) > HOOK_STATS_MAX_BYTES):
+                os.replace(HOOK_STATS_FILE, HOOK_STATS_FILE + '.1')
+            with open(HOOK_STATS_FILE, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+        except OSError as e:
+            ch_core.hookenv.log('Unable to write hook stats: "{}"'.format(e),
+                                level=ch_core.hookenv.WARNING)
+        with self._lock:
+            self.calls = []
+
+
+call_stats = CallStats()
+
+
+def read_hook_stats(count):
+    """Read the most recent hook stats entries.
+
+    :param count: Maximum number of entries to return
+    :type count: int
+    :returns: Entries, oldest first
+    :rtype: List[Dict[str,any]]
+    """
+    entries = collections.deque(maxlen=count)
+    for path in (HOOK_STATS_FILE + '.1', HOOK_STATS_FILE):
+        if not os.path.exists(path):
+            continue
+        with open(path) as f:
+            for line in f:
+                entries.append(json.loads(line))
+    return list(entries)
+
+
+def parse_command_timeouts(value):
+    """Parse per-verb command timeouts.
+
+    :param value: Comma separated ``verb=seconds`` pairs, e.g.
+                  ``pool status=30,image list=120``
+    :type value: Optional[str]
+    :returns: Map of verb to seconds
+    :rtype: Dict[str,int]
+    :raises: ValueError
+    """
+    timeouts = {}
+    for item in (value or '').split(','):
+        if not item.strip():
+            continue
+        verb, _, seconds = item.rpartition('=')
+        verb = ' '.join(verb.split())
+        try:
+            seconds = int(seconds)
+        except ValueError:
+            seconds = 0
+        if not verb or seconds < 1:
+            raise ValueError('invalid command timeout "{}"'
+                             .format(item.strip()))
+        timeouts[verb] = seconds
+    return timeouts
+
+
+def _positive_int(value, default):
+    if isinstance(value, int) and value >= 0:
+        return value
+    return default
+
+
+# Deadline of commands run by the current thread, see ``deadline``
+_thread_deadline = threading.local()
+
+
+@contextlib.contextmanager
+def deadline(timestamp):
+    """Bound commands run by the current thread to complete by a deadline.
+
+    Commands still running at the deadline are killed and commands started
+    after it are not run, so that worker threads do not outlive the caller
+    waiting for them.  Either raises ``DeadlineExceeded``.
+
+    :param timestamp: Deadline as seconds since the epoch
+    :type timestamp: float
+    """
+    previous = getattr(_thread_deadline, 'value', None)
+    _thread_deadline.value = (timestamp if previous is None
+                              else min(previous, timestamp))
+    try:
+        yield
+    finally:
+        _thread_deadline.value = previous
+
+
+class CircuitBreaker(object):
+    """Suspend calls to a cluster after repeated timeouts.
+
+    Once ``threshold`` consecutive calls to a cluster timed out, further
+    calls fail immediately with ``CircuitOpenError`` for ``cooldown``
+    seconds.  The first call after that probes the cluster, a success closes
+    the circuit and another timeout opens it again.
+
+    The state is persisted in unitdata so that subsequent hooks skip the
+    cluster too.  It is loaded and saved from the main thread only, calls
+    from worker threads just update the copy in memory.
+    """
+
+    def __init__(self, threshold=CIRCUIT_BREAKER_THRESHOLD,
+                 cooldown=DEFAULT_CIRCUIT_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._state = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Load state from unitdata."""
+        state = ch_core.unitdata.kv().get(CIRCUIT_BREAKER_KEY)
+        with self._lock:
+            self._state = dict(state) if isinstance(state, dict) else {}
+            self._dirty = False
+
+    def save(self):
+        """Save state to unitdata if it changed."""
+        with self._lock:
+            if not self._dirty:
+                return
+            state = json.loads(json.dumps(self._state))
+            self._dirty = False
+        kv = ch_core.unitdata.kv()
+        kv.set(CIRCUIT_BREAKER_KEY, state)
+        kv.flush()
+
+    def open_for(self, cluster):
+        """Get seconds calls to cluster remain suspended for.
+
+        :param cluster: Cluster name
+        :type cluster: str
+        :returns: Seconds, 0 when calls are allowed
+        :rtype: float
+        """
+        with self._lock:
+            until = self._state.get(cluster, {}).get('open_until') or 0
+        return max(0.0, until - time.time())
+
+    def open_circuits(self):
+        """Get clusters calls are currently suspended for.
+
+        :returns: Map of cluster name to seconds calls remain suspended for
+        :rtype: Dict[str,float]
+        """
+        with self._lock:
+            clusters = list(self._state)
+        return {cluster: remaining for cluster, remaining in (
+            (cluster, self.open_for(cluster)) for cluster in clusters)
+            if remaining}
+
+    def check(self, cluster):
+        """Check that calls to cluster are allowed.
+
+        :param cluster: Cluster name
+        :type cluster: str
+        :raises: CircuitOpenError
+        """
+        remaining = self.open_for(cluster)
+        if remaining:
+            raise CircuitOpenError(
+                'Calls to Ceph cluster "{}" suspended for {:.0f}s after '
+                'repeated timeouts'.format(cluster, remaining))
+
+    def record_success(self, cluster):
+        with self._lock:
+            if self._state.pop(cluster, None):
+                self._dirty = True
+
+    def record_timeout(self, cluster):
+        with self._lock:
+            state = self._state.setdefault(cluster, {'failures': 0})
+            state['failures'] += 1
+            if state['failures'] >= self.threshold:
+                state['open_until'] = time.time() + self.cooldown
+            self._dirty = True
+            failures = state['failures']
+        if failures >= self.threshold:
+            ch_core.hookenv.log(
+                'Ceph cluster "{}" timed out {} times in a row, suspending '
+                'calls for {}s'.format(cluster, failures, self.cooldown),
+                level=ch_core.hookenv.WARNING)
+
+
+class CommandRunner(object):
+    """Run Ceph commands with timeouts, retries and a circuit breaker.
+
+    Every command is killed after the timeout for its verb.  Read-only
+    commands are retried with jittered exponential backoff, commands that
+    change state are not as their effect is unknown after a failure.
+    """
+
+    def __init__(self, breaker=None):
+        self.breaker = breaker or CircuitBreaker()
+        self.timeout = DEFAULT_COMMAND_TIMEOUT
+        self.timeouts = dict(COMMAND_TIMEOUTS)
+        self.retries = DEFAULT_COMMAND_RETRIES
+        self._registered = False
+
+    def configure(self, config):
+        """Apply charm configuration and load the circuit breaker state.
+
+        Must be called from the main thread.
+
+        :param config: Charm configuration
+        :type config: Dict[str,any]
+        """
+        self.timeout = _positive_int(config.get('ceph-command-timeout'),
+                                     DEFAULT_COMMAND_TIMEOUT) or None
+        self.timeouts = dict(COMMAND_TIMEOUTS)
+        try:
+            self.timeouts.update(parse_command_timeouts(
+                config.get('ceph-command-timeouts')))
+        except (AttributeError, ValueError) as e:
+            ch_core.hookenv.log('Ignoring ceph-command-timeouts: {}'
+                                .format(e), level=ch_core.hookenv.ERROR)
+        self.retries = _positive_int(config.get('ceph-command-retries'),
+                                     DEFAULT_COMMAND_RETRIES)
+        self.breaker.cooldown = _positive_int(
+            config.get('ceph-circuit-breaker-cooldown'),
+            DEFAULT_CIRCUIT_BREAKER_COOLDOWN)
+        self.breaker.load()
+        if not self._registered:
+            ch_core.hookenv.atexit(self.breaker.save)
+            self._registered = True
+
+    def timeout_for(self, verb):
+        """Get seconds a command may run for.
+
+        :param verb: Name of the operation, e.g. ``pool status``
+        :type verb: str
+        :returns: Seconds, ``None`` for no limit
+        :rtype: Optional[int]
+        """
+        return self.timeouts.get(verb, self.timeout)
+
+    @staticmethod
+    def backoff(attempt):
+        """Get jittered delay before retry.
+
+        :param attempt: Number of the failed attempt, starting at 0
+        :type attempt: int
+        :returns: Seconds to wait
+        :rtype: float
+        """
+        return random.uniform(
+            0, min(RETRY_MAX_BACKOFF, RETRY_BACKOFF * 2 ** attempt))
+
+    def run(self, func, cmd, verb, pool=None, cluster=None, **kwargs):
+        """Run command and record the call.
+
+        :param func: Function running the command, e.g.
+                     ``subprocess.check_output``
+        :type func: Callable
+        :param cmd: Command to run
+        :type cmd: List[str]
+        :param verb: Name of the operation
+        :type verb: str
+        :param pool: Pool the command operates on
+        :type pool: Optional[str]
+        :param cluster: Cluster the command operates on
+        :type cluster: Optional[str]
+        :param kwargs: Keyword arguments passed on to ``func``, a ``timeout``
+                       overrides the timeout for the verb, ``NO_TIMEOUT``
+                       lifts it
+        :returns: Return value of ``func``
+        :rtype: any
+        :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired,
+                 DeadlineExceeded, CircuitOpenError
+        """
+        cluster = cluster or 'ceph'
+        timeout = kwargs.pop('timeout', None)
+        if timeout is None:
+            timeout = self.timeout_for(verb)
+        elif timeout == NO_TIMEOUT:
+            timeout = None
+        attempts = 1 + (self.retries if verb in RETRY_VERBS else 0)
+        for attempt in range(attempts):
+            self.breaker.check(cluster)
+            # The deadline of the thread takes precedence over the timeout
+            # of the verb, running into it says nothing about the cluster
+            limit = getattr(_thread_deadline, 'value', None)
+            bounded = False
+            kwargs['timeout'] = timeout
+            if limit is not None:
+                remaining = limit - time.time()
+                if remaining <= 0:
+                    raise DeadlineExceeded(cmd, 0)
+                if timeout is None or remaining < timeout:
+                    kwargs['timeout'] = remaining
+                    bounded = True
+            try:
+                with call_stats.measure(verb, pool) as call:
+                    result = func(cmd, **kwargs)
+                    if isinstance(result, (str, bytes)):
+                        call['output_size'] = len(result)
+            except subprocess.TimeoutExpired as e:
+                if bounded:
+                    raise DeadlineExceeded(e.cmd, e.timeout, output=e.output,
+                                           stderr=e.stderr)
+                self.breaker.record_timeout(cluster)
+                if attempt + 1 == attempts:
+                    raise
+            except subprocess.CalledProcessError as e:
+                if e.returncode not in TRANSIENT_RETURNCODES:
+                    raise
+                if e.returncode == errno.ETIMEDOUT:
+                    # rbd gave up reaching the cluster on its own
+                    self.breaker.record_timeout(cluster)
+                if attempt + 1 == attempts:
+                    raise
+            else:
+                self.breaker.record_success(cluster)
+                return result
+            delay = self.backoff(attempt)
+            if limit is not None:
+                delay = min(delay, max(0.0, limit - time.time()))
+            ch_core.hookenv.log('Retrying {} of pool {} in {:.1f}s'
+                                .format(verb, pool, delay),
+                                level=ch_core.hookenv.DEBUG)
+            time.sleep(delay)
+
+
+runner = CommandRunner()
+
+
+def check_output(cmd, verb, pool=None, cluster=None, **kwargs):
+    """Run command, return its output and record the call.
+
+    :param cmd: Command to run
+    :type cmd: List[str]
+    :param verb: Name of the operation for the call statistics
+    :type verb: str
+    :param pool: Pool the command operates on
+    :type pool: Optional[str]
+    :param cluster: Cluster the command operates on
+    :type cluster: Optional[str]
+    :param kwargs: Keyword arguments passed on to ``subprocess.check_output``
+    :returns: Command output
+    :rtype: Union[str,bytes]
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired,
+             CircuitOpenError
+    """
+    return runner.run(subprocess.check_output, cmd, verb, pool,
+                      cluster=cluster, **kwargs)
+
+
+def check_call(cmd, verb, pool=None, cluster=None, **kwargs):
+    """Run command and record the call.
+
+    :param cmd: Command to run
+    :type cmd: List[str]
+    :param verb: Name of the operation for the call statistics
+    :type verb: str
+    :param pool: Pool the command operates on
+    :type pool: Optional[str]
+    :param cluster: Cluster the command operates on
+    :type cluster: Optional[str]
+    :param kwargs: Keyword arguments passed on to ``subprocess.check_call``
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired,
+             CircuitOpenError
+    """
+    runner.run(subprocess.check_call, cmd, verb, pool, cluster=cluster,
+               **kwargs)
+
+
+def mirror_pool_health(states):
+    """Derive pool health from image state counts the same way the CLI does.
+
+    :param states: Map of image state name to count
+    :type states: Dict[str,int]
+    :returns: One of ``OK``, ``WARNING`` or ``ERROR``
+    :rtype: str
+    """
+    health = 'OK'
+    for state, count in states.items():
+        if not count:
+            continue
+        if state == 'error':
+            return 'ERROR'
+        if state not in ('replaying', 'stopped'):
+            health = 'WARNING'
+    return health
+
+
+def image_replay_status(image):
+    """Extract replay progress from verbose mirror pool status of an image.
+
+    For journal based mirroring the daemon reports replay progress as JSON
+    appended to the description, e.g.
+    ``replaying, {"entries_behind_primary":3,...}``.
+
+    :param image: Image entry of verbose ``mirror pool status`` output
+    :type image: Dict[str,any]
+    :returns: Dictionary with ``entries_behind_primary``, ``None`` when not
+              reported, and ``last_update`` as seconds since the epoch,
+              ``None`` when not available
+    :rtype: Dict[str,Optional[float]]
+    """
+    result = {'entries_behind_primary': None, 'last_update': None}
+    description = image.get('description') or ''
+    _, sep, detail = description.partition(', ')
+    if sep and detail.startswith('{'):
+        try:
+            result['entries_behind_primary'] = json.loads(detail).get(
+                'entries_behind_primary')
+        except ValueError:
+            pass
+    if image.get('last_update'):
+        try:
+            result['last_update'] = time.mktime(time.strptime(
+                image['last_update'], '%Y-%m-%d %H:%M:%S'))
+        except ValueError:
+            pass
+    return result
+
+
+# States of non-primary images that replay or are about to replay their
+# primary
+REPLAYING_IMAGE_STATES = ('up+replaying', 'up+syncing', 'up+starting_replay')
+
+
+def image_is_primary(image):
+    """Check whether the daemon reports the image as primary locally.
+
+    :param image: Image entry of verbose ``mirror pool status`` output
+    :type image: Dict[str,any]
+    :returns: True if the image is primary
+    :rtype: bool
+    """
+    return (image.get('state') == 'up+stopped' and
+            'local image is primary' in (image.get('description') or ''))
+
+
+def image_in_sync(image):
+    """Check whether a non-primary image has replayed all of its primary.
+
+    An image is in sync once the daemon reports that the demotion of the
+    primary was replayed.  Until then an image that has caught up with the
+    primary is considered in sync too, that is no journal entries behind for
+    journal based mirroring or the latest primary snapshot synced for
+    snapshot based mirroring.  An image that is already primary has nothing
+    to replay and is in sync as well.
+
+    :param image: Image entry of verbose ``mirror pool status`` output
+    :type image: Dict[str,any]
+    :returns: True if the image is in sync
+    :rtype: bool
+    """
+    description = image.get('description') or ''
+    if 'remote image demoted' in description or image_is_primary(image):
+        return True
+    if not image.get('state', '').endswith('replaying'):
+        return False
+    _, sep, detail = description.partition(', ')
+    if not sep or not detail.startswith('{'):
+        return False
+    try:
+        detail = json.loads(detail)
+    except ValueError:
+        return False
+    if 'remote_snapshot_timestamp' in detail:
+        return (detail.get('replay_state') == 'idle' and
+                detail['remote_snapshot_timestamp'] ==
+                detail.get('local_snapshot_timestamp'))
+    return detail.get('entries_behind_primary') == 0
+
+
+def image_can_sync(image):
+    """Check whether an image can get in sync with its primary.
+
+    Images that are stopped, in error or whose daemon is down do not replay
+    a demotion of their primary.
+
+    :param image: Image entry of verbose ``mirror pool status`` output
+    :type image: Dict[str,any]
+    :returns: True if the image is in sync or replaying its primary
+    :rtype: bool
+    """
+    return (image.get('state') in REPLAYING_IMAGE_STATES or
+            image_in_sync(image))
+
+
+def daemon_mirror_status(ceph_id):
+    """Get replayer state from the admin socket of the local daemon.
+
+    The daemon answers from memory, no request is made to the clusters.
+
+    :param ceph_id: Ceph client id of the daemon
+    :type ceph_id: str
+    :returns: Output of the ``rbd mirror status`` admin socket command,
+              ``None`` when the socket is not available
+    :rtype: Optional[Dict[str,any]]
+    """
+    path = ADMIN_SOCKET.format(ceph_id)
+    if not os.path.exists(path):
+        return None
+    try:
+        with call_stats.measure('admin socket status') as call:
+            output = subprocess.check_output(
+                ['ceph', '--admin-daemon', path, 'rbd', 'mirror', 'status'],
+                universal_newlines=True,
+                timeout=runner.timeout_for('admin socket status'))
+            call['output_size'] = len(output)
+        return json.loads(output)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired,
+            ValueError) as e:
+        ch_core.hookenv.log('Unable to query admin socket {}: "{}"'
+                            .format(path, e), level=ch_core.hookenv.WARNING)
+        return None
+
+
+def daemon_pools_status(status):
+    """Derive mirror pool status from replayer state of the daemon.
+
+    A daemon only replays the images assigned to it, pools that are shared
+    with other daemon instances are left out as their status would be
+    incomplete.  The daemon does not tell images in error apart from
+    stopped or primary ones, pools with any stopped image are left out too
+    so that their status is queried from the cluster.
+
+    :param status: Output of the ``rbd mirror status`` admin socket command
+    :type status: Dict[str,any]
+    :returns: Map of pool name to mirror pool status in the shape of
+              non-verbose ``mirror_pool_status``
+    :rtype: Dict[str,Dict[str,any]]
+    """
+    result = {}
+    for replayer in status.get('pool_replayers', []):
+        pool = replayer.get('pool')
+        instance_id = replayer.get('instance_id')
+        if (not pool or not replayer.get('leader') or
+                replayer.get('leader_instance_id') != instance_id or
+                any(instance != instance_id
+                    for instance in replayer.get('instances', []))):
+            continue
+        states = collections.defaultdict(int)
+        for image in replayer.get('image_replayers', []):
+            states[DAEMON_IMAGE_STATES.get(image.get('state'),
+                                           'unknown')] += 1
+        if states.get('stopped'):
+            continue
+        result[pool] = {
+            'summary': {
+                'health': mirror_pool_health(states),
+                'states': dict(states),
+            },
+        }
+    return result
+
+
+class CephBackend(abc.ABC):
+    """Interface for the Ceph RBD mirror queries and operations of the charm.
+
+    The ``cluster`` argument accepted by all methods names the cluster to
+    operate on, ``None`` is the local cluster and ``remote`` is the cluster
+    configured in ``/etc/ceph/remote.conf``.
+
+    Results are returned in the same shape as the JSON output of the ``rbd``
+    CLI so callers do not need to care about which backend is in use.
+    """
+
+    name = None
+
+    def __init__(self, ceph_id):
+        self.ceph_id = ceph_id
+
+    @abc.abstractmethod
+    def mirror_pool_info(self, pool, cluster=None):
+        pass
+
+    @abc.abstractmethod
+    def mirror_pool_status(self, pool, verbose=False, cluster=None):
+        """Get mirror status of pool.
+
+        :param pool: Pool name
+        :type pool: str
+        :param verbose: Include per-image status in ``images``, when not set
+                        only the ``summary`` is returned
+        :type verbose: bool
+        :param cluster: Cluster name
+        :type cluster: Optional[str]
+        :returns: Mirror pool status
+        :rtype: Dict[str,any]
+        """
+
+    @abc.abstractmethod
+    def mirror_pool_enable(self, pool, mode, cluster=None):
+        pass
+
+    @abc.abstractmethod
+    def mirror_pool_peer_add(self, pool, peer, cluster=None):
+        pass
+
+    @abc.abstractmethod
+    def image_list(self, pool, cluster=None):
+        pass
+
+    @abc.abstractmethod
+    def image_info(self, pool, image, cluster=None):
+        pass
+
+    @abc.abstractmethod
+    def image_resync(self, pool, image, cluster=None):
+        pass
+
+    @abc.abstractmethod
+    def mirror_image_enable(self, pool, image, mode, cluster=None):
+        pass
+
+    @abc.abstractmethod
+    def mirror_snapshot_schedule_list(self, pool, cluster=None):
+        """Get mirror snapshot schedules of pool.
+
+        :param pool: Pool name
+        :type pool: str
+        :param cluster: Cluster name
+        :type cluster: Optional[str]
+        :returns: Schedules with ``interval`` and ``start_time``
+        :rtype: List[Dict[str,str]]
+        """
+
+    @abc.abstractmethod
+    def mirror_snapshot_schedule_add(self, pool, interval, cluster=None):
+        pass
+
+    @abc.abstractmethod
+    def mirror_snapshot_schedule_remove(self, pool, interval, cluster=None):
+        pass
+
+    def close(self):
+        """Release any resources held by the backend."""
+        pass
+
+
+class CLIBackend(CephBackend):
+    """Backend forking the ``rbd`` CLI for every call."""
+
+    name = 'cli'
+
+    def _rbd(self, args, cluster=None):
+        cmd = ['rbd', '--id', self.ceph_id]
+        if cluster:
+            cmd += ['--cluster', cluster]
+        return cmd + args
+
+    def _check_output(self, args, verb, pool, cluster=None):
+        return check_output(self._rbd(args, cluster=cluster), verb, pool,
+                            cluster=cluster, universal_newlines=True)
+
+    def _check_call(self, args, verb, pool, cluster=None):
+        check_call(self._rbd(args, cluster=cluster), verb, pool,
+                   cluster=cluster)
+
+    def mirror_pool_info(self, pool, cluster=None):
+        return json.loads(self._check_output(
+            ['mirror', 'pool', 'info', '--format', 'json', pool],
+            'pool info', pool, cluster=cluster))
+
+    def mirror_pool_status(self, pool, verbose=False, cluster=None):
+        cmd = ['mirror', 'pool', 'status', '--format', 'json']
+        verb = 'pool status'
+        if verbose:
+            cmd.append('--verbose')
+            verb = 'pool status verbose'
+        return json.loads(self._check_output(cmd + [pool], verb, pool,
+                                             cluster=cluster))
+
+    def mirror_pool_enable(self, pool, mode, cluster=None):
+        self._check_call(['mirror', 'pool', 'enable', pool, mode],
+                         'pool enable', pool, cluster=cluster)
+
+    def mirror_pool_peer_add(self, pool, peer, cluster=None):
+        self._check_call(['mirror', 'pool', 'peer', 'add', pool, peer],
+                         'pool peer add', pool, cluster=cluster)
+
+    def image_list(self, pool, cluster=None):
+        return json.loads(self._check_output(
+            ['--format', 'json', '-p', pool, 'ls'], 'image list', pool,
+            cluster=cluster))
+
+    def image_info(self, pool, image, cluster=None):
+        return json.loads(self._check_output(
+            ['--format', 'json', 'info', '{}/{}'.format(pool, image)],
+            'image info', pool, cluster=cluster))
+
+    def image_resync(self, pool, image, cluster=None):
+        return self._check_output(
+            ['mirror', 'image', 'resync', '{}/{}'.format(pool, image)],
+            'image resync', pool, cluster=cluster).rstrip()
+
+    def mirror_image_enable(self, pool, image, mode, cluster=None):
+        self._check_call(
+            ['mirror', 'image', 'enable', '{}/{}'.format(pool, image), mode],
+            'image enable', pool, cluster=cluster)
+
+    def mirror_snapshot_schedule_list(self, pool, cluster=None):
+        output = self._check_output(
+            ['mirror', 'snapshot', 'schedule', 'ls', '--pool', pool,
+             '--format', 'json'], 'snapshot schedule list', pool,
+            cluster=cluster)
+        # Older releases print nothing at all when there are no schedules
+        return json.loads(output) if output.strip() else []
+
+    def mirror_snapshot_schedule_add(self, pool, interval, cluster=None):
+        self._check_call(
+            ['mirror', 'snapshot', 'schedule', 'add', '--pool', pool,
+             interval], 'snapshot schedule add', pool, cluster=cluster)
+
+    def mirror_snapshot_schedule_remove(self, pool, interval, cluster=None):
+        self._check_call(
+            ['mirror', 'snapshot', 'schedule', 'remove', '--pool', pool,
+             interval], 'snapshot schedule remove', pool, cluster=cluster)
+
+
+class LibradosBackend(CephBackend):
+    """Backend using the ``rados`` and ``rbd`` Python bindings.
+
+    One connection per cluster is kept open for the lifetime of the backend,
+    which is the duration of the hook or action.
+
+    Mirror snapshot schedules are managed by the ``rbd_support`` manager
+    module which has no librbd binding, those calls go through the CLI.
+    """
+
+    name = 'librados'
+
+    def __init__(self, ceph_id):
+        super().__init__(ceph_id)
+        self._rbd = rbd.RBD()
+        self._connections = {}
+        self._cli = CLIBackend(ceph_id)
+        # Methods are called from worker threads, connect only once
+        self._lock = threading.Lock()
+
+    def _connect(self, cluster=None):
+        cluster = cluster or 'ceph'
+        with self._lock:
+            if cluster not in self._connections:
+                runner.breaker.check(cluster)
+                # Bound monitor and OSD operations the same way the timeouts
+                # of the command runner bound the CLI
+                timeout = str(runner.timeout or 0)
+                connection = rados.Rados(
+                    rados_id=self.ceph_id,
+                    clustername=cluster,
+                    conffile='/etc/ceph/{}.conf'.format(cluster),
+                    conf={'client_mount_timeout': timeout,
+                          'rados_mon_op_timeout': timeout,
+                          'rados_osd_op_timeout': timeout})
+                try:
+                    connection.connect()
+                except rados.TimedOut:
+                    runner.breaker.record_timeout(cluster)
+                    raise
+                runner.breaker.record_success(cluster)
+                self._connections[cluster] = connection
+            return self._connections[cluster]
+
+    def _ioctx(self, pool, cluster=None):
+        return self._connect(cluster).open_ioctx(pool)
+
+    def mirror_pool_info(self, pool, cluster=None):
+        with call_stats.measure('pool info', pool), \
+                self._ioctx(pool, cluster=cluster) as ioctx:
+            mode = self._rbd.mirror_mode_get(ioctx)
+            peers = [dict(peer)
+                     for peer in self._rbd.mirror_peer_list(ioctx)]
+        return {'mode': MIRROR_MODES[mode], 'peers': peers}
+
+    def mirror_pool_status(self, pool, verbose=False, cluster=None):
+        verb = 'pool status verbose' if verbose else 'pool status'
+        with call_stats.measure(verb, pool), \
+                self._ioctx(pool, cluster=cluster) as ioctx:
+            states = {
+                MIRROR_IMAGE_STATUS_STATES[state]: count
+                for state, count in self._rbd.mirror_image_status_summary(
+                    ioctx)
+            }
+            result = {
+                'summary': {
+                    'health': mirror_pool_health(states),
+                    'states': states,
+                },
+            }
+            if verbose:
+                result['images'] = [
+                    self._image_status(status)
+                    for status in self._rbd.mirror_image_status_list(ioctx)]
+        return result
+
+    @staticmethod
+    def _image_status(status):
+        last_update = status.get('last_update')
+        return {
+            'name': status['name'],
+            'global_id': status.get('info', {}).get('global_id'),
+            'state': '{}+{}'.format(
+                'up' if status.get('up') else 'down',
+                MIRROR_IMAGE_STATUS_STATES[status['state']]),
+            'description': status.get('description', ''),
+            'last_update': (last_update.strftime('%Y-%m-%d %H:%M:%S')
+                            if last_update else ''),
+        }
+
+    def mirror_pool_enable(self, pool, mode, cluster=None):
+        with call_stats.measure('pool enable', pool), \
+                self._ioctx(pool, cluster=cluster) as ioctx:
+            self._rbd.mirror_mode_set(ioctx, MIRROR_MODES.index(mode))
+
+    def mirror_pool_peer_add(self, pool, peer, cluster=None):
+        client_name, site_name = peer.split('@')
+        with call_stats.measure('pool peer add', pool), \
+                self._ioctx(pool, cluster=cluster) as ioctx:
+            self._rbd.mirror_peer_add(ioctx, site_name, client_name)
+
+    def image_list(self, pool, cluster=None):
+        with call_stats.measure('image list', pool), \
+                self._ioctx(pool, cluster=cluster) as ioctx:
+            return self._rbd.list(ioctx)
+
+    def image_info(self, pool, image, cluster=None):
+        with call_stats.measure('image info', pool), \
+                self._ioctx(pool, cluster=cluster) as ioctx:
+            with rbd.Image(ioctx, image, read_only=True) as rbd_image:
+                info = rbd_image.mirror_image_get_info()
+        return {
+            'name': image,
+            'mirroring': {
+                'global_id': info['global_id'],
+                'state': MIRROR_IMAGE_STATES[info['state']],
+                'primary': info['primary'],
+            },
+        }
+
+    def image_resync(self, pool, image, cluster=None):
+        with call_stats.measure('image resync', pool), \
+                self._ioctx(pool, cluster=cluster) as ioctx:
+            with rbd.Image(ioctx, image) as rbd_image:
+                rbd_image.mirror_image_resync()
+        return 'Flagged image for resync from primary'
+
+    def mirror_image_enable(self, pool, image, mode, cluster=None):
+        with call_stats.measure('image enable', pool), \
+                self._ioctx(pool, cluster=cluster) as ioctx:
+            with rbd.Image(ioctx, image) as rbd_image:
+                rbd_image.mirror_image_enable(MIRROR_IMAGE_MODES.index(mode))
+
+    def mirror_snapshot_schedule_list(self, pool, cluster=None):
+        return self._cli.mirror_snapshot_schedule_list(pool, cluster=cluster)
+
+    def mirror_snapshot_schedule_add(self, pool, interval, cluster=None):
+        self._cli.mirror_snapshot_schedule_add(pool, interval,
+                                               cluster=cluster)
+
+    def mirror_snapshot_schedule_remove(self, pool, interval, cluster=None):
+        self._cli.mirror_snapshot_schedule_remove(pool, interval,
+                                                  cluster=cluster)
+
+    def close(self):
+        for connection in self._connections.values():
+            connection.shutdown()
+        self._connections.clear()
+
+
+def get_backend(ceph_id, name=None):
+    """Get backend instance.
+
+    The librados backend is used when requested and the Python bindings are
+    available, otherwise we fall back to the CLI backend.
+
+    :param ceph_id: Ceph client id to use
+    :type ceph_id: str
+    :param name: Name of the backend, ``cli`` or ``librados``
+    :type name: Optional[str]
+    :returns: Backend instance
+    :rtype: CephBackend
+    """
+    if name == LibradosBackend.name:
+        if load_bindings():
+            backend = LibradosBackend(ceph_id)
+            atexit.register(backend.close)
+            return backend
+        ch_core.hookenv.log('Python rados/rbd bindings not available, '
+                            'falling back to the CLI backend',
+                            level=ch_core.hookenv.WARNING)
+    return CLIBackend(ceph_id)
@@ -0,0 +1,181 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Prometheus metrics in the node-exporter textfile collector format."""
+
+import os
+import tempfile
+
+import charm.openstack.ceph_rbd_mirror_backend as backend
+
+# Name of the file written to the textfile collector directory
+TEXTFILE_NAME = 'ceph_rbd_mirror.prom'
+
+# Numeric value exported for each mirror pool health
+POOL_HEALTH_VALUES = {'OK': 0, 'WARNING': 1, 'ERROR': 2}
+
+METRICS = (
+    ('ceph_rbd_mirror_pool_status_success',
+     'Whether mirror status of the pool was retrieved.'),
+    ('ceph_rbd_mirror_pool_health',
+     'Mirror pool health, 0 for OK, 1 for WARNING and 2 for ERROR.'),
+    ('ceph_rbd_mirror_pool_images',
+     'Number of mirrored images in the pool by state.'),
+    ('ceph_rbd_mirror_image_entries_behind_primary',
+     'Number of journal entries the image replay is behind the primary.'),
+    ('ceph_rbd_mirror_image_last_update_timestamp_seconds',
+     'Time the mirror daemon last updated the image status.'),
+    ('ceph_rbd_mirror_exporter_duration_seconds',
+     'Time taken to collect the metrics.'),
+    ('ceph_rbd_mirror_exporter_last_run_timestamp_seconds',
+     'Time the metrics were collected.'),
+)
+
+
+def escape_label_value(value):
+    """Escape label value as required by the exposition format.
+
+    :param value: Label value
+    :type value: str
+    :returns: Escaped label value
+    :rtype: str
+    """
+    return (str(value).replace('\\', '\\\\')
+            .replace('\n', '\\n')
+            .replace('"', '\\"'))
+
+
+def sample(name, value, **labels):
+    """Format one sample.
+
+    :param name: Metric name
+    :type name: str
+    :param value: Sample value
+    :type value: Union[int,float]
+    :param labels: Labels of the sample
+    :type labels: Dict[str,str]
+    :returns: Sample line
+    :rtype: str
+    """
+    if labels:
+        name += '{{{}}}'.format(','.join(
+            '{}="{}"'.format(key, escape_label_value(labels[key]))
+            for key in sorted(labels)))
+    return '{} {}'.format(name, value)
+
+
+def format_metrics(pool_status, failed_pools, duration, timestamp):
+    """Format metrics from verbose mirror pool status.
+
+    :param pool_status: Map of pool name to verbose mirror pool status
+    :type pool_status: Dict[str,Dict[str,any]]
+    :param failed_pools: Pools mirror status could not be retrieved for
+    :type failed_pools: Iterable[str]
+    :param duration: Seconds taken to collect the status
+    :type duration: float
+    :param timestamp: Time of collection as seconds since the epoch
+    :type timestamp: float
+    :returns: Metrics in text exposition format
+    :rtype: str
+    """
+    samples = {name: [] for name, _ in METRICS}
+    for pool in sorted(failed_pools):
+        samples['ceph_rbd_mirror_pool_status_success'].append(
+            sample('ceph_rbd_mirror_pool_status_success', 0, pool=pool))
+    for pool, status in sorted(pool_status.items()):
+        samples['ceph_rbd_mirror_pool_status_success'].append(
+            sample('ceph_rbd_mirror_pool_status_success', 1, pool=pool))
+        summary = status.get('summary', {})
+        samples['ceph_rbd_mirror_pool_health'].append(
+            sample('ceph_rbd_mirror_pool_health',
+                   POOL_HEALTH_VALUES.get(summary.get('health'), 2),
+                   pool=pool))
+        for state, count in sorted(summary.get('states', {}).items()):
+            samples['ceph_rbd_mirror_pool_images'].append(
+                sample('ceph_rbd_mirror_pool_images', count,
+                       pool=pool, state=state))
+        for image in status.get('images', []):
+            replay = backend.image_replay_status(image)
+            if replay['entries_behind_primary'] is not None:
+                samples['ceph_rbd_mirror_image_entries_behind_primary'].append(
+                    sample('ceph_rbd_mirror_image_entries_behind_primary',
+                           replay['entries_behind_primary'],
+                           pool=pool, image=image['name']))
+            if replay['last_update'] is not None:
+                samples[
+                    'ceph_rbd_mirror_image_last_update_timestamp_seconds'
+                ].append(sample(
+                    'ceph_rbd_mirror_image_last_update_timestamp_seconds',
+                    int(replay['last_update']),
+                    pool=pool, image=image['name']))
+    samples['ceph_rbd_mirror_exporter_duration_seconds'].append(
+        sample('ceph_rbd_mirror_exporter_duration_seconds',
+               round(duration, 3)))
+    samples['ceph_rbd_mirror_exporter_last_run_timestamp_seconds'].append(
+        sample('ceph_rbd_mirror_exporter_last_run_timestamp_seconds',
+               int(timestamp)))
+    lines = []
+    for name, help_text in METRICS:
+        if not samples[name]:
+            continue
+        lines.append('# HELP {} {}'.format(name, help_text))
+        lines.append('# TYPE {} gauge'.format(name))
+        lines.extend(samples[name])
+    return '\n'.join(lines) + '\n'
+
+
+def replace_file(path, content, perms=0o644):
+    """Atomically replace file with content.
+
+    The content is written to a temporary file in the same directory and
+    renamed over the file so that readers never see a partially written
+    file.
+
+    :param path: Path to file
+    :type path: str
+    :param content: Content to write
+    :type content: str
+    :param perms: File permissions
+    :type perms: int
+    :raises: OSError
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix='.' + os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.chmod(tmp_path, perms)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+def write_textfile(directory, text):
+    """Atomically replace the metrics file in the collector directory.
+
+    :param directory: Textfile collector directory
+    :type directory: str
+    :param text: Metrics in text exposition format
+    :type text: str
+    :returns: Path to the metrics file
+    :rtype: str
+    """
+    # The collector only reads files ending with ``.prom``, it skips the
+    # temporary file
+    path = os.path.join(directory, TEXTFILE_NAME)
+    replace_file(path, text)
+    return path
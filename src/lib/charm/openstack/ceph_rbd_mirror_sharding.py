@@ -0,0 +1,110 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Sharding of per pool work across units with consistent hashing.
+
+The leader publishes the units taking part through leader settings, every
+unit derives the same pool to unit assignment from them.  Like the action
+helpers this module must not import the reactive framework nor
+charms.openstack.
+"""
+
+import bisect
+import hashlib
+import json
+
+import charmhelpers.core as ch_core
+
+# Leader setting with the sorted list of units pool work is sharded across
+SHARD_UNITS_KEY = 'pool-shard-units'
+
+# Points on the ring per unit, more points spread pools more evenly
+VNODES = 64
+
+
+def _hash(key):
+    return int.from_bytes(
+        hashlib.sha256(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing(object):
+    """Consistent hash ring mapping keys to nodes.
+
+    Adding or removing a node only moves the keys that node gains or loses,
+    roughly ``1 / len(nodes)`` of them.
+    """
+
+    def __init__(self, nodes, vnodes=VNODES):
+        self._ring = sorted(
+            (_hash('{}#{}'.format(node, i)), node)
+            for node in set(nodes)
+            for i in range(vnodes))
+        self._points = [point for point, _ in self._ring]
+
+    def get(self, key):
+        """Get node owning key.
+
+        :param key: Key, e.g. pool name
+        :type key: str
+        :returns: Node or None when there are no nodes
+        :rtype: Optional[str]
+        """
+        if not self._ring:
+            return None
+        index = bisect.bisect(self._points, _hash(key)) % len(self._ring)
+        return self._ring[index][1]
+
+    def assign(self, keys):
+        """Assign keys to nodes.
+
+        :param keys: Keys to assign
+        :type keys: Iterable[str]
+        :returns: Map of node to sorted keys it owns
+        :rtype: Dict[str,List[str]]
+        """
+        assignment = {}
+        for key in sorted(keys):
+            assignment.setdefault(self.get(key), []).append(key)
+        return assignment
+
+
+def shard_units():
+    """Get units published by the leader.
+
+    :returns: Unit names, empty until the leader has published them
+    :rtype: List[str]
+    """
+    units = ch_core.hookenv.leader_get(SHARD_UNITS_KEY)
+    if not units:
+        return []
+    return json.loads(units)
+
+
+def local_shard(pools):
+    """Select the pools the local unit is responsible for.
+
+    Until the leader has published the units it is responsible for every
+    pool and the other units for none.
+
+    :param pools: Pool names
+    :type pools: Iterable[str]
+    :returns: Pool names owned by the local unit
+    :rtype: List[str]
+    """
+    units = shard_units()
+    if not units:
+        return list(pools) if ch_core.hookenv.is_leader() else []
+    ring = HashRing(units)
+    local_unit = ch_core.hookenv.local_unit()
+    return [pool for pool in pools if ring.get(pool) == local_unit]
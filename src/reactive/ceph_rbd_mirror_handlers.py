@@ -18,7 +18,6 @@ import charms_openstack.bus
 import charms_openstack.charm as charm
 
 import charmhelpers.core as ch_core
-import charmhelpers.contrib.storage.linux.ceph as ch_ceph
 
 
 charms_openstack.bus.discover()
@@ -47,6 +46,14 @@ def request_keys():
         charm_instance.assess_status()
 
 
+@reactive.when('charm.installed',
+               'config.changed.ceph-backend')
+def install_backend_packages():
+    # The librados backend needs packages not installed by default
+    with charm.provide_charm_instance() as charm_instance:
+        charm_instance.install()
+
+
 @reactive.when_none('is-update-status-hook')
 @reactive.when('config.changed',
                'ceph-local.available',
@@ -74,13 +81,25 @@ def render_stuff(*args):
             ch_core.hookenv.log('Ceph endpoint "{}" available, configuring '
                                 'keyring'.format(endpoint.endpoint_name),
                                 level=ch_core.hookenv.INFO)
-            ch_core.hookenv.log('Pools: "{}"'.format(endpoint.pools),
-                                level=ch_core.hookenv.INFO)
+            ch_core.hookenv.log('Ceph endpoint "{}" has {} pools'
+                                .format(endpoint.endpoint_name,
+                                        len(endpoint.pools)),
+                                level=ch_core.hookenv.DEBUG)
 
+            if endpoint.endpoint_name == 'ceph-local':
+                charm_instance.record_eligible_pools(endpoint.pools)
             cluster_name = (
                 'remote') if endpoint.endpoint_name == 'ceph-remote' else None
             charm_instance.configure_ceph_keyring(endpoint.key,
                                                   cluster_name=cluster_name)
+        try:
+            charm_instance.rbd_mirror_tuning()
+        except ValueError as e:
+            # Keep the daemon running with the configuration it has, the
+            # workload status tells the operator what to fix.
+            ch_core.hookenv.log('Not rendering configuration: "{}"'
+                                .format(e), level=ch_core.hookenv.ERROR)
+            return
         charm_instance.render_with_interfaces(args)
         reactive.set_flag('config.rendered')
 
@@ -98,8 +117,17 @@ def refresh_pools():
 
 
 @reactive.when_none('is-update-status-hook')
-@reactive.when('leadership.is_leader',
-               'config.rendered',
+@reactive.when('leadership.is_leader')
+def publish_shard_units():
+    with charm.provide_charm_instance() as charm_instance:
+        if charm_instance.publish_shard_units():
+            ch_core.hookenv.log('Sharding pools across units: "{}"'
+                                .format(charm_instance.peer_units()),
+                                level=ch_core.hookenv.INFO)
+
+
+@reactive.when_none('is-update-status-hook')
+@reactive.when('config.rendered',
                'ceph-local.available',
                'ceph-remote.available')
 def configure_pools():
@@ -112,48 +140,156 @@ def configure_pools():
         remote_rq = charm_instance.collapse_and_filter_broker_requests(
             remote.broker_requests, set(('create-pool',)),
             require_vp={'app-name': 'rbd'})
-        pools_in_rq = charm_instance.pools_in_broker_request(
-            rq) if rq else set()
-        pools_in_rq |= charm_instance.pools_in_broker_request(
-            remote_rq) if remote_rq else set()
-        for pool, attrs in charm_instance.eligible_pools(local.pools).items():
-            pool_mirroring_mode = charm_instance.pool_mirroring_mode(
-                pool, [rq, remote_rq])
-            mirroring_enabled = charm_instance.mirror_pool_enabled(
-                pool, pool_mirroring_mode)
-            has_peers = charm_instance.mirror_pool_has_peers(pool)
-            if not (mirroring_enabled and has_peers):
-                ch_core.hookenv.log('Enabling mirroring for pool "{}"'
-                                    .format(pool),
+        pool_index = charm_instance.broker_request_pool_index(
+            [('local', rq), ('remote', remote_rq)])
+        eligible_pools = charm_instance.eligible_pools(local.pools)
+        # Every unit enables mirroring for the pools in its shard, only the
+        # leader forwards pool creation to the remote cluster.
+        shard = charm_instance.pool_shard(eligible_pools)
+        is_leader = reactive.is_flag_set('leadership.is_leader')
+        snapshot_pools = charm_instance.snapshot_mirroring_pools()
+        modes = {}
+        states = {}
+        for pool, attrs in eligible_pools.items():
+            if pool in snapshot_pools:
+                modes[pool] = 'snapshot'
+            elif pool in pool_index:
+                modes[pool] = pool_index[pool]['mode']
+            else:
+                modes[pool] = charm_instance.default_mirroring_mode
+            states[pool] = [attrs, modes[pool], pool in shard,
+                            pool in pool_index]
+        # Only pools that changed since the previous hook are looked at,
+        # apart from a periodic sweep over all pools.  Confirmed pools do not
+        # record the schedule, revisit them all when it changes.
+        delta = charm_instance.pools_delta(states)
+        for name, pools in zip(delta._fields, delta):
+            if pools:
+                ch_core.hookenv.log('Pools {}: "{}"'.format(name, pools),
                                     level=ch_core.hookenv.INFO)
-                charm_instance.mirror_pool_enable(pool, pool_mirroring_mode)
-            if (pool not in pools_in_rq and
-                    'erasure_code_profile' not in attrs['parameters']):
-                # A pool exists that there is no broker request for which means
-                # it is a manually created pool. We will forward creation of
-                # replicated pools but forwarding of manually created Erasure
-                # Coded pools is not supported.
-                pg_num = attrs['parameters'].get('pg_num')
-                max_bytes = attrs['quota'].get('max_bytes')
-                max_objects = attrs['quota'].get('max_objects')
-                size = attrs['parameters'].get('size')
-                ch_core.hookenv.log('Adding manually created pool "{}" to '
-                                    'request.'
-                                    .format(pool),
+        schedule_changed = reactive.is_flag_set(
+            'config.changed.snapshot-schedule-interval')
+        sweep = charm_instance.pools_sweep_due() or schedule_changed
+        if sweep:
+            candidates = sorted(eligible_pools)
+        else:
+            candidates = delta.added + delta.changed
+        unconfirmed = {}
+        for pool in candidates:
+            if pool in shard and (
+                    not charm_instance.mirror_pool_confirmed(
+                        pool, eligible_pools[pool], modes[pool]) or
+                    (modes[pool] == 'snapshot' and schedule_changed)):
+                unconfirmed[pool] = modes[pool]
+        outcome = charm_instance.mirror_pools_enable(unconfirmed)
+        for pool, steps in sorted(outcome.results.items()):
+            if steps:
+                ch_core.hookenv.log('Enabled mirroring for pool "{}": {}'
+                                    .format(pool, ', '.join(steps)),
                                     level=ch_core.hookenv.INFO)
-                if not rq:
-                    rq = ch_ceph.CephBrokerRq()
-                rq.add_op_create_replicated_pool(
-                    pool,
-                    replica_count=size if not size else int(size),
-                    pg_num=pg_num if not pg_num else int(pg_num),
-                    app_name='rbd',
-                    max_bytes=max_bytes if not max_bytes else int(max_bytes),
-                    max_objects=max_objects if not max_objects else int(
-                        max_objects),
-                )
+        for pool, error in sorted(outcome.errors.items()):
+            ch_core.hookenv.log('Unable to enable mirroring for pool "{}": '
+                                '"{}"'.format(pool, error),
+                                level=ch_core.hookenv.ERROR)
+        charm_instance.mirror_pools_record(
+            {pool: (eligible_pools[pool], unconfirmed[pool])
+             for pool in outcome.results},
+            shard)
+        # Failed pools are forgotten so that they show up in the next delta
+        # again to be retried, a sweep is only complete without failures
+        failed = set(outcome.errors) | set(outcome.pending)
+        charm_instance.record_seen_pools(states, forget=failed)
+        if sweep and not failed:
+            charm_instance.record_pools_sweep()
+        ch_core.hookenv.log('Mirror query cache: {} hits, {} misses'
+                            .format(charm_instance.query_cache.hits,
+                                    charm_instance.query_cache.misses),
+                            level=ch_core.hookenv.DEBUG)
+        if not is_leader:
+            return
+        previously_forwarded = charm_instance.forwarded_pools()
+        forwarded = set(candidates)
+        if not sweep:
+            forwarded.update(previously_forwarded)
+        forwarded = set(
+            pool for pool in forwarded
+            if (pool in eligible_pools and pool not in pool_index and
+                'erasure_code_profile' not in
+                eligible_pools[pool]['parameters']))
+        # A pool exists that there is no broker request for which means it is
+        # a manually created pool. We will forward creation of replicated
+        # pools but forwarding of manually created Erasure Coded pools is not
+        # supported.
+        for pool in sorted(forwarded - set(previously_forwarded)):
+            ch_core.hookenv.log('Adding manually created pool "{}" to '
+                                'request.'
+                                .format(pool),
+                                level=ch_core.hookenv.INFO)
+        if forwarded:
+            rq = charm_instance.add_replicated_pool_ops(
+                rq, {pool: eligible_pools[pool] for pool in forwarded})
+        charm_instance.record_forwarded_pools(forwarded)
         ch_core.hookenv.log('Request for evaluation: "{}"'
                             .format(rq),
                             level=ch_core.hookenv.DEBUG)
         if rq:
             remote.maybe_send_rq(rq)
+
+
+@reactive.when('config.set.prometheus-textfile-dir',
+               'config.rendered',
+               'ceph-local.available',
+               'ceph-remote.available')
+def export_metrics():
+    local = reactive.endpoint_from_flag('ceph-local.available')
+    with charm.provide_charm_instance() as charm_instance:
+        if not charm_instance.metrics_due():
+            return
+        try:
+            path = charm_instance.export_metrics(
+                charm_instance.pool_shard(
+                    charm_instance.eligible_pools(local.pools)))
+        except OSError as e:
+            ch_core.hookenv.log('Unable to write metrics: "{}"'.format(e),
+                                level=ch_core.hookenv.WARNING)
+            return
+        ch_core.hookenv.log('Wrote metrics to "{}"'.format(path),
+                            level=ch_core.hookenv.DEBUG)
+
+
+@reactive.when('nrpe-external-master.available')
+@reactive.when_not('ceph-rbd-mirror.nrpe.configured')
+def update_nrpe_config():
+    with charm.provide_charm_instance() as charm_instance:
+        charm_instance.update_nrpe_config()
+    reactive.set_flag('ceph-rbd-mirror.nrpe.configured')
+
+
+@reactive.when('config.changed',
+               'ceph-rbd-mirror.nrpe.configured')
+def reconfigure_nrpe():
+    reactive.clear_flag('ceph-rbd-mirror.nrpe.configured')
+
+
+@reactive.when_not('nrpe-external-master.available')
+@reactive.when('ceph-rbd-mirror.nrpe.configured')
+def nrpe_departed():
+    reactive.clear_flag('ceph-rbd-mirror.nrpe.configured')
+
+
+@reactive.when('nrpe-external-master.available',
+               'config.rendered',
+               'ceph-local.available',
+               'ceph-remote.available')
+def refresh_status_snapshot():
+    local = reactive.endpoint_from_flag('ceph-local.available')
+    with charm.provide_charm_instance() as charm_instance:
+        if not charm_instance.status_snapshot_due():
+            return
+        try:
+            charm_instance.write_status_snapshot(
+                charm_instance.pool_shard(
+                    charm_instance.eligible_pools(local.pools)))
+        except OSError as e:
+            ch_core.hookenv.log('Unable to write status snapshot: "{}"'
+                                .format(e), level=ch_core.hookenv.WARNING)
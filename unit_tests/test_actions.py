@@ -14,6 +14,10 @@
 
 import collections
 import json
+import os
+import shutil
+import subprocess
+import tempfile
 from unittest import mock
 import sys
 
@@ -36,80 +40,277 @@ class TestCephRBDMirrorActions(test_utils.PatchHelper):
         self.provide_charm_instance().__enter__.return_value = \
             self.crm_charm
         self.provide_charm_instance().__exit__.return_value = None
+        self.results_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.results_dir)
+        self.patch_object(actions.rbd_actions, 'ACTION_RESULTS_DIR',
+                          new=self.results_dir)
+        self.patch_object(actions.ch_core.hookenv, 'action_uuid')
+        self.action_uuid.return_value = 'auuid'
 
     def test_rbd_mirror_action(self):
         self.patch_object(actions.reactive, 'endpoint_from_name')
         self.patch_object(actions.ch_core.hookenv, 'action_get')
-        self.patch_object(actions.subprocess, 'check_output')
         self.patch_object(actions.ch_core.hookenv, 'action_set')
+        self.patch_object(actions.ch_core.hookenv, 'action_fail')
+        self.patch_object(actions.ch_core.unitdata, 'kv')
         endpoint = mock.MagicMock()
         endpoint.pools = collections.OrderedDict(
             {'apool': {'applications': {'rbd': {}}},
              'bpool': {'applications': {'rbd': {}}}})
         self.endpoint_from_name.return_value = endpoint
         self.crm_charm.eligible_pools.return_value = endpoint.pools
-        self.crm_charm.ceph_id = 'acephid'
-        self.action_get.return_value = False
-        self.check_output.return_value = 'Promoted 0 mirrored images\n'
+
+        def _role_change(action, pools, force=False, concurrency=1,
+                         timeout=None, callback=None):
+            results = {
+                'apool': {'output': 'Promoted 0 mirrored images',
+                          'duration': 1.5},
+                'bpool': {'output': 'Promoted 0 mirrored images',
+                          'duration': 0.5},
+            }
+            for pool in pools:
+                callback(pool, results[pool], None)
+            return crm.ConcurrentResult(results, {}, [])
+
+        self.crm_charm.mirror_pools_role_change.side_effect = _role_change
+        self.action_get.side_effect = [None, True, 4, 60]
         actions.rbd_mirror_action(['promote'])
         self.endpoint_from_name.assert_called_once_with('ceph-local')
         self.crm_charm.eligible_pools.assert_called_once_with(endpoint.pools)
         self.action_get.assert_has_calls([
             mock.call('pools'),
             mock.call('force'),
-            mock.call('verbose'),
-            mock.call('format'),
+            mock.call('concurrency'),
+            mock.call('timeout'),
         ])
-        self.check_output.assert_has_calls([
-            mock.call(['rbd', '--id', 'acephid', 'mirror', 'pool', 'promote',
-                       'apool'],
-                      stderr=actions.subprocess.STDOUT,
-                      universal_newlines=True),
-            mock.call(['rbd', '--id', 'acephid', 'mirror', 'pool', 'promote',
-                       'bpool'],
-                      stderr=actions.subprocess.STDOUT,
-                      universal_newlines=True),
-        ], any_order=True)
-        # the order the pools has in the output string is undefined
-        self.action_set.assert_called_once_with(
-            {'output': mock.ANY})
-        self.assertEquals(
-            sorted(self.action_set.call_args[0][0]['output'].split('\n')),
-            ['apool: Promoted 0 mirrored images',
-             'bpool: Promoted 0 mirrored images'])
-        self.action_get.side_effect = [None, True, True, False]
-        self.check_output.reset_mock()
-        actions.rbd_mirror_action(['promote'])
-        self.check_output.assert_has_calls([
-            mock.call(['rbd', '--id', 'acephid', 'mirror', 'pool', 'promote',
-                       '--force', '--verbose', 'apool'],
-                      stderr=actions.subprocess.STDOUT,
-                      universal_newlines=True),
-            mock.call(['rbd', '--id', 'acephid', 'mirror', 'pool', 'promote',
-                       '--force', '--verbose', 'bpool'],
-                      stderr=actions.subprocess.STDOUT,
-                      universal_newlines=True),
-        ], any_order=True)
+        self.crm_charm.mirror_pools_role_change.assert_called_once_with(
+            'promote', ['apool', 'bpool'], force=True, concurrency=4,
+            timeout=60, callback=mock.ANY)
+        self.kv.return_value.flush.assert_called_once_with()
+        results = self.action_set.call_args[0][0]
+        self.assertEqual(json.loads(results.pop('output')), {
+            'apool': {'output': 'Promoted 0 mirrored images',
+                      'duration': 1.5},
+            'bpool': {'output': 'Promoted 0 mirrored images',
+                      'duration': 0.5},
+        })
+        elapsed = results.pop('elapsed')
+        self.assertTrue(float(elapsed) >= 0)
+        self.assertEqual(results, {
+            'results-file': os.path.join(self.results_dir,
+                                         'promote-auuid.jsonl'),
+            'count': 2,
+            'total': 2,
+            'failed': 0,
+            'pool-duration-p50': '0.50',
+            'pool-duration-p95': '1.50',
+            'pool-duration-max': '1.50',
+        })
+        self.assertFalse(self.action_fail.called)
+
+        # failed pools do not abort the others and fail the action
+        def _role_change_failed(action, pools, force=False, concurrency=1,
+                                timeout=None, callback=None):
+            error = Exception('boom')
+            callback('apool', None, error)
+            callback('bpool', {'error': 'timed out after 60s',
+                               'duration': 60.0}, None)
+            return crm.ConcurrentResult(
+                {'bpool': {'error': 'timed out after 60s',
+                           'duration': 60.0}},
+                {'apool': error}, [])
+
+        self.crm_charm.mirror_pools_role_change.side_effect = \
+            _role_change_failed
+        self.action_get.side_effect = ['apool,bpool', False, None, 0]
+        actions.rbd_mirror_action(['demote'])
+        self.crm_charm.mirror_pools_role_change.assert_called_with(
+            'demote', ['apool', 'bpool'], force=False, concurrency=1,
+            timeout=0, callback=mock.ANY)
+        self.assertEqual(
+            json.loads(self.action_set.call_args[0][0]['output']),
+            {'apool': {'error': 'boom'},
+             'bpool': {'error': 'timed out after 60s', 'duration': 60.0}})
+        self.assertEqual(self.action_set.call_args[0][0]['failed'], 2)
+        self.action_fail.assert_called_once_with(
+            'Demote failed for 2 of 2 pools: apool, bpool')
+
+    def test_failover(self):
+        self.patch_object(actions.reactive, 'endpoint_from_name')
+        self.patch_object(actions.ch_core.hookenv, 'action_get')
+        self.patch_object(actions.ch_core.hookenv, 'action_set')
+        self.patch_object(actions.ch_core.hookenv, 'action_fail')
+        self.patch_object(actions.ch_core.unitdata, 'kv')
+        self.action_get.side_effect = [False]
+        actions.failover(['failover'])
+        self.action_fail.assert_called_once_with('Required parameter not set')
+        self.assertFalse(self.crm_charm.mirror_pools_role_change.called)
+
+        self.action_fail.reset_mock()
+        endpoint = mock.MagicMock()
+        endpoint.pools = collections.OrderedDict(
+            {'bpool': {'applications': {'rbd': {}}},
+             'apool': {'applications': {'rbd': {}}}})
+        self.endpoint_from_name.return_value = endpoint
+        self.crm_charm.eligible_pools.return_value = endpoint.pools
+        self.crm_charm.mirror_pools_check_sync.return_value = (
+            crm.ConcurrentResult({'apool': [], 'bpool': []}, {}, []))
+        self.crm_charm.mirror_pools_role_change.side_effect = [
+            crm.ConcurrentResult({
+                'apool': {'output': 'Demoted', 'duration': 1.0},
+                'bpool': {'output': 'Demoted', 'duration': 2.0},
+            }, {}, []),
+            crm.ConcurrentResult({
+                'apool': {'output': 'Promoted', 'duration': 1.0},
+                'bpool': {'output': 'Promoted', 'duration': 1.5},
+            }, {}, []),
+        ]
+        self.crm_charm.mirror_pools_await_sync.return_value = {
+            'time_to_consistent': {'apool': 0.5, 'bpool': 3.0},
+            'held_up': {'bpool': ['animage']},
+            'lagging': {},
+            'rounds': 3,
+        }
+        self.action_get.side_effect = [True, None, 4, 60, 600]
+        actions.failover(['failover'])
         self.action_get.assert_has_calls([
+            mock.call('i-really-mean-it'),
             mock.call('pools'),
-            mock.call('force'),
-            mock.call('verbose'),
-            mock.call('format'),
+            mock.call('concurrency'),
+            mock.call('timeout'),
+            mock.call('sync-timeout'),
         ])
-        self.action_get.side_effect = ['apool', True, True, False]
-        self.check_output.reset_mock()
-        actions.rbd_mirror_action(['promote'])
-        self.check_output.assert_called_once_with(
-            ['rbd', '--id', 'acephid', 'mirror', 'pool', 'promote',
-             '--force', '--verbose', 'apool'],
-            stderr=actions.subprocess.STDOUT,
-            universal_newlines=True)
-        self.action_get.assert_has_calls([
-            mock.call('pools'),
-            mock.call('force'),
-            mock.call('verbose'),
-            mock.call('format'),
+        self.crm_charm.mirror_pools_check_sync.assert_called_once_with(
+            ['apool', 'bpool'], cluster='remote', concurrency=4)
+        self.crm_charm.mirror_pools_role_change.assert_has_calls([
+            mock.call('demote', ['apool', 'bpool'], concurrency=4,
+                      timeout=60, cluster=None),
+            mock.call('promote', ['apool', 'bpool'], concurrency=4,
+                      timeout=60, cluster='remote'),
+        ])
+        self.crm_charm.mirror_pools_await_sync.assert_called_once_with(
+            ['apool', 'bpool'], cluster='remote', timeout=600,
+            concurrency=4)
+        results = self.action_set.call_args[0][0]
+        self.assertEqual(json.loads(results['output']), {
+            'apool': {
+                'demote': {'output': 'Demoted', 'duration': 1.0},
+                'time-to-consistent': 0.5,
+                'promote': {'output': 'Promoted', 'duration': 1.0},
+            },
+            'bpool': {
+                'demote': {'output': 'Demoted', 'duration': 2.0},
+                'time-to-consistent': 3.0,
+                'held-up-by': ['animage'],
+                'promote': {'output': 'Promoted', 'duration': 1.5},
+            },
+        })
+        for key in ('elapsed', 'check-duration', 'demote-duration',
+                    'sync-duration', 'promote-duration'):
+            self.assertTrue(float(results[key]) >= 0)
+        self.assertEqual(results['sync-rounds'], 3)
+        self.assertEqual(results['held-up-images'], 1)
+        self.assertFalse(self.action_fail.called)
+
+        # pools not in sync by the deadline are not promoted but promoted
+        # locally again, the other pools carry on
+        self.crm_charm.mirror_pools_role_change.reset_mock()
+        self.crm_charm.mirror_pools_role_change.side_effect = [
+            crm.ConcurrentResult({
+                'apool': {'output': 'Demoted', 'duration': 1.0},
+                'bpool': {'output': 'Demoted', 'duration': 1.0},
+            }, {}, []),
+            crm.ConcurrentResult({
+                'bpool': {'output': 'Promoted', 'duration': 1.0},
+            }, {}, []),
+            crm.ConcurrentResult({
+                'apool': {'output': 'Promoted', 'duration': 0.5},
+            }, {}, []),
+        ]
+        self.crm_charm.mirror_pools_await_sync.reset_mock()
+        self.crm_charm.mirror_pools_await_sync.return_value = {
+            'time_to_consistent': {'bpool': 1.0},
+            'held_up': {},
+            'lagging': {'apool': ['animage']},
+            'rounds': 5,
+        }
+        self.action_get.side_effect = [True, 'apool,bpool', 4, 60, 600]
+        actions.failover(['failover'])
+        self.crm_charm.mirror_pools_await_sync.assert_called_once_with(
+            ['apool', 'bpool'], cluster='remote', timeout=600,
+            concurrency=4)
+        self.crm_charm.mirror_pools_role_change.assert_has_calls([
+            mock.call('demote', ['apool', 'bpool'], concurrency=4,
+                      timeout=60, cluster=None),
+            mock.call('promote', ['bpool'], concurrency=4,
+                      timeout=60, cluster='remote'),
+            mock.call('promote', ['apool'], concurrency=4,
+                      timeout=60, cluster=None),
+        ])
+        results = self.action_set.call_args[0][0]
+        self.assertTrue(float(results['rollback-duration']) >= 0)
+        report = json.loads(results['output'])
+        self.assertEqual(report['apool'], {
+            'demote': {'output': 'Demoted', 'duration': 1.0},
+            'lagging': ['animage'],
+            'rollback': {'output': 'Promoted', 'duration': 0.5},
+        })
+        self.assertEqual(report['bpool']['promote'],
+                         {'output': 'Promoted', 'duration': 1.0})
+        self.action_fail.assert_called_once_with(
+            'Failover did not complete for 1 of 2 pools: apool (sync)')
+
+        # pools failing to promote on the remote are promoted locally again,
+        # pools failing to demote are not
+        self.action_fail.reset_mock()
+        self.crm_charm.mirror_pools_role_change.reset_mock()
+        self.crm_charm.mirror_pools_role_change.side_effect = [
+            crm.ConcurrentResult({
+                'apool': {'output': 'Demoted', 'duration': 1.0},
+                'bpool': {'error': 'timed out after 60s', 'duration': 60.0},
+            }, {}, []),
+            crm.ConcurrentResult({
+                'apool': {'error': 'Operation not permitted',
+                          'duration': 1.0},
+            }, {}, []),
+            crm.ConcurrentResult({}, {'apool': Exception('boom')}, []),
+        ]
+        self.crm_charm.mirror_pools_await_sync.return_value = {
+            'time_to_consistent': {'apool': 1.0},
+            'held_up': {},
+            'lagging': {},
+            'rounds': 1,
+        }
+        self.action_get.side_effect = [True, 'apool,bpool', 4, 60, 600]
+        actions.failover(['failover'])
+        self.crm_charm.mirror_pools_role_change.assert_has_calls([
+            mock.call('promote', ['apool'], concurrency=4,
+                      timeout=60, cluster='remote'),
+            mock.call('promote', ['apool'], concurrency=4,
+                      timeout=60, cluster=None),
         ])
+        report = json.loads(self.action_set.call_args[0][0]['output'])
+        self.assertEqual(report['apool']['rollback'], {'error': 'boom'})
+        self.assertNotIn('rollback', report['bpool'])
+        self.action_fail.assert_called_once_with(
+            'Failover did not complete for 2 of 2 pools: apool (promote), '
+            'bpool (demote)')
+
+        # nothing is demoted when images on the remote cannot sync
+        self.action_fail.reset_mock()
+        self.crm_charm.mirror_pools_role_change.reset_mock()
+        self.crm_charm.mirror_pools_await_sync.reset_mock()
+        self.crm_charm.mirror_pools_check_sync.return_value = (
+            crm.ConcurrentResult({'apool': ['animage']}, {}, []))
+        self.action_get.side_effect = [True, 'apool', 4, 60, 600]
+        actions.failover(['failover'])
+        self.assertFalse(self.crm_charm.mirror_pools_role_change.called)
+        self.assertFalse(self.crm_charm.mirror_pools_await_sync.called)
+        results = self.action_set.call_args[0][0]
+        self.assertEqual(json.loads(results['output']),
+                         {'apool': {'cannot-sync': ['animage']}})
+        self.action_fail.assert_called_once_with(
+            'Failover did not complete for 1 of 1 pools: apool (check)')
 
     def test_refresh_pools(self):
         self.patch_object(actions.reactive, 'is_flag_set')
@@ -131,53 +332,77 @@ class TestCephRBDMirrorActions(test_utils.PatchHelper):
     def test_resync_pools(self):
         self.patch_object(actions.reactive, 'endpoint_from_name')
         self.patch_object(actions.ch_core.hookenv, 'action_get')
-        self.patch_object(actions.subprocess, 'check_output')
         self.patch_object(actions.ch_core.hookenv, 'action_set')
+        self.patch_object(actions.ch_core.hookenv, 'action_fail')
         endpoint = mock.MagicMock()
         endpoint.pools = collections.OrderedDict(
             {'apool': {'applications': {'rbd': {}}}})
         self.endpoint_from_name.return_value = endpoint
         self.crm_charm.eligible_pools.return_value = endpoint.pools
-        self.crm_charm.ceph_id = 'acephid'
+        self.crm_charm.pool_shard.return_value = endpoint.pools
+        backend = self.crm_charm.backend
         self.action_get.side_effect = [False, None]
         actions.resync_pools([])
         self.action_get.assert_has_calls([
             mock.call('i-really-mean-it'),
         ])
-        self.assertFalse(self.check_output.called)
+        self.assertFalse(self.crm_charm.mirrored_images.called)
         self.assertFalse(self.action_set.called)
-        self.action_get.side_effect = [True, 'bpool']
-        self.check_output.return_value = json.dumps([])
+        self.action_fail.reset_mock()
+        self.action_get.side_effect = [True, 'bpool', 2, None, 0, None]
+        self.crm_charm.mirrored_images.return_value = {}
         actions.resync_pools([])
         self.action_get.assert_has_calls([
             mock.call('i-really-mean-it'),
             mock.call('pools'),
+            mock.call('concurrency'),
+            mock.call('states'),
+            mock.call('offset'),
+            mock.call('limit'),
         ])
-        self.check_output.assert_called_once_with(
-            ['rbd', '--id', 'acephid', '--format', 'json',
-             '-p', 'bpool', 'ls'],
-            universal_newlines=True)
-        self.action_set.assert_called_once_with({'output': ''})
-        self.action_get.side_effect = [True, None]
-        self.check_output.side_effect = [
-            json.dumps(['imagea', 'imageb']),
-            json.dumps({'mirroring': {'state': 'enabled'}}),
-            'resync flagged for imagea\n',
-            json.dumps({'mirroring': {'state': 'disabled'}}),
-        ]
-        self.check_output.reset_mock()
+        self.crm_charm.mirrored_images.assert_called_once_with(
+            'bpool', states=None)
+        self.action_set.assert_called_once_with({
+            'output': '',
+            'results-file': os.path.join(self.results_dir,
+                                         'resync-pools-auuid.jsonl'),
+            'count': 0,
+            'total': 0,
+            'failed': 0,
+            'elapsed': mock.ANY,
+            'images-per-second': mock.ANY,
+        })
+        self.action_get.side_effect = [True, None, 2, 'error, unknown', 0,
+                                       None]
+        self.crm_charm.mirrored_images.reset_mock()
+        self.crm_charm.mirrored_images.return_value = {
+            'imagea': 'error', 'imagec': 'unknown'}
+
+        def _image_resync(pool, image):
+            if image == 'imagec':
+                raise subprocess.CalledProcessError(1, 'rbd')
+            return 'resync flagged for {}'.format(image)
+        backend.image_resync.side_effect = _image_resync
         actions.resync_pools([])
-        self.action_get.assert_has_calls([
-            mock.call('i-really-mean-it'),
-            mock.call('pools'),
-        ])
+        self.crm_charm.mirrored_images.assert_called_once_with(
+            'apool', states={'error', 'unknown'})
+        backend.image_resync.assert_has_calls([
+            mock.call('apool', 'imagea'),
+            mock.call('apool', 'imagec'),
+        ], any_order=True)
         self.assertEquals(
-            sorted(self.action_set.call_args[0][0]['output'].split('\n')),
-            ['apool/imagea: resync flagged for imagea'])
+            self.action_set.call_args[0][0]['output'].split('\n'),
+            ['apool/imagea: resync flagged for imagea',
+             "apool/imagec: failed: Command 'rbd' returned non-zero exit "
+             "status 1."])
+        self.assertEqual(self.action_set.call_args[0][0]['failed'], 1)
+        self.action_fail.assert_called_once_with(
+            'Resync failed for 1 of 2 images')
 
     def test_main(self):
         self.patch_object(actions, 'ACTIONS')
         self.patch_object(actions.ch_core.hookenv, 'action_fail')
+        self.patch_object(actions.ch_core.hookenv, '_run_atexit')
         args = ['/non-existent/path/to/charm/binary/promote']
         function = mock.MagicMock()
         self.ACTIONS.__getitem__.return_value = function
@@ -189,3 +414,4 @@ class TestCephRBDMirrorActions(test_utils.PatchHelper):
         function.side_effect = Exception('random exception')
         actions.main(args)
         self.action_fail.assert_called_once_with('random exception')
+        self.assertEqual(self._run_atexit.call_count, 2)
@@ -36,12 +36,16 @@ class TestRegisteredHooks(test_utils.TestRegisteredHooks):
                     'ceph-local.available',
                     'ceph-remote.available',
                 ),
+                'install_backend_packages': (
+                    'charm.installed',
+                    'config.changed.ceph-backend',
+                ),
                 'render_stuff': (
                     'ceph-local.available',
                     'ceph-remote.available',
                 ),
+                'publish_shard_units': ('leadership.is_leader',),
                 'configure_pools': (
-                    'leadership.is_leader',
                     'config.rendered',
                     'ceph-local.available',
                     'ceph-remote.available',
@@ -56,6 +60,28 @@ class TestRegisteredHooks(test_utils.TestRegisteredHooks):
                     'ceph-local.connected',
                     'ceph-remote.connected',
                 ),
+                'export_metrics': (
+                    'config.set.prometheus-textfile-dir',
+                    'config.rendered',
+                    'ceph-local.available',
+                    'ceph-remote.available',
+                ),
+                'update_nrpe_config': (
+                    'nrpe-external-master.available',
+                ),
+                'reconfigure_nrpe': (
+                    'config.changed',
+                    'ceph-rbd-mirror.nrpe.configured',
+                ),
+                'nrpe_departed': (
+                    'ceph-rbd-mirror.nrpe.configured',
+                ),
+                'refresh_status_snapshot': (
+                    'nrpe-external-master.available',
+                    'config.rendered',
+                    'ceph-local.available',
+                    'ceph-remote.available',
+                ),
             },
             'when_none': {
                 'config_changed': (
@@ -66,12 +92,20 @@ class TestRegisteredHooks(test_utils.TestRegisteredHooks):
                     'is-update-status-hook',),
                 'configure_pools': (
                     'is-update-status-hook',),
+                'publish_shard_units': (
+                    'is-update-status-hook',),
                 'request_keys': (
                     'is-update-status-hook',
                     'ceph-local.available',
                     'ceph-remote.available',
                 ),
             },
+            'when_not': {
+                'update_nrpe_config': (
+                    'ceph-rbd-mirror.nrpe.configured',),
+                'nrpe_departed': (
+                    'nrpe-external-master.available',),
+            },
         }
         # test that the hooks were registered
         self.registered_hooks_test_helper(handlers, hook_set, defaults)
@@ -106,6 +140,10 @@ class TestCephRBDMirrorHandlers(test_utils.PatchHelper):
         endpoint_remote.request_key.assert_called_once_with()
         self.crm_charm.assess_status.assert_called_once_with()
 
+    def test_install_backend_packages(self):
+        handlers.install_backend_packages()
+        self.crm_charm.install.assert_called_once_with()
+
     def test_config_changed(self):
         self.patch_object(handlers.reactive, 'endpoint_from_flag')
         handlers.config_changed()
@@ -137,6 +175,13 @@ class TestCephRBDMirrorHandlers(test_utils.PatchHelper):
         ])
         self.crm_charm.render_with_interfaces.assert_called_once_with(
             (endpoint_local, endpoint_remote))
+        self.crm_charm.record_eligible_pools.assert_called_once_with(
+            endpoint_local.pools)
+        # invalid tuning options leave the rendered configuration alone
+        self.crm_charm.render_with_interfaces.reset_mock()
+        self.crm_charm.rbd_mirror_tuning.side_effect = ValueError
+        handlers.render_stuff(endpoint_local, endpoint_remote)
+        self.assertFalse(self.crm_charm.render_with_interfaces.called)
 
     def test_refresh_pools(self):
         self.patch_object(handlers.reactive, 'endpoint_from_name')
@@ -155,6 +200,13 @@ class TestCephRBDMirrorHandlers(test_utils.PatchHelper):
 
     def test_configure_pools(self):
         self.patch_object(handlers.reactive, 'endpoint_from_flag')
+        self.patch_object(handlers.reactive, 'is_flag_set')
+        flags = set(['leadership.is_leader'])
+        self.is_flag_set.side_effect = lambda flag: flag in flags
+        self.crm_charm.snapshot_mirroring_pools.return_value = set()
+        self.crm_charm.pool_shard.side_effect = lambda pools: pools
+        self.crm_charm.pools_sweep_due.return_value = True
+        self.crm_charm.forwarded_pools.return_value = set()
         endpoint_local = mock.MagicMock()
         endpoint_remote = mock.MagicMock()
         self.crm_charm.collapse_and_filter_broker_requests.side_effect = [
@@ -175,8 +227,12 @@ class TestCephRBDMirrorHandlers(test_utils.PatchHelper):
         self.endpoint_from_flag.side_effect = [endpoint_local,
                                                endpoint_remote]
         self.crm_charm.eligible_pools.return_value = endpoint_local.pools
-        self.crm_charm.mirror_pool_enabled.return_value = False
-        self.crm_charm.pool_mirroring_mode.return_value = 'pool'
+        self.crm_charm.mirror_pool_confirmed.return_value = False
+        self.crm_charm.broker_request_pool_index.return_value = {}
+        self.crm_charm.default_mirroring_mode = 'pool'
+        self.crm_charm.mirror_pools_enable.return_value = \
+            crm.ConcurrentResult({'cinder-ceph': ['enable', 'peer-add']},
+                                 {}, [])
 
         handlers.configure_pools()
         self.endpoint_from_flag.assert_has_calls([
@@ -185,10 +241,187 @@ class TestCephRBDMirrorHandlers(test_utils.PatchHelper):
         ])
         self.crm_charm.eligible_pools.assert_called_once_with(
             endpoint_local.pools)
-        self.crm_charm.pool_mirroring_mode.assert_called_once_with(
-            'cinder-ceph', [endpoint_local, endpoint_remote])
-        self.crm_charm.mirror_pool_enabled.assert_called_once_with(
-            'cinder-ceph', 'pool')
-        self.crm_charm.mirror_pool_enable.assert_called_once_with(
-            'cinder-ceph', 'pool')
-        endpoint_remote.maybe_send_rq.assert_called_once_with(endpoint_local)
+        self.crm_charm.broker_request_pool_index.assert_called_once_with(
+            [('local', endpoint_local), ('remote', endpoint_remote)])
+        self.crm_charm.mirror_pools_enable.assert_called_once_with(
+            {'cinder-ceph': 'pool'})
+        self.crm_charm.mirror_pools_record.assert_called_once_with(
+            {'cinder-ceph': (endpoint_local.pools['cinder-ceph'], 'pool')},
+            endpoint_local.pools)
+        states = {'cinder-ceph': [endpoint_local.pools['cinder-ceph'],
+                                  'pool', True, False]}
+        self.crm_charm.pools_delta.assert_called_once_with(states)
+        self.crm_charm.record_seen_pools.assert_called_once_with(
+            states, forget=set())
+        self.crm_charm.record_pools_sweep.assert_called_once_with()
+        # the manually created pool is forwarded to the remote cluster
+        self.crm_charm.add_replicated_pool_ops.assert_called_once_with(
+            endpoint_local,
+            {'cinder-ceph': endpoint_local.pools['cinder-ceph']})
+        self.crm_charm.record_forwarded_pools.assert_called_once_with(
+            set(['cinder-ceph']))
+        endpoint_remote.maybe_send_rq.assert_called_once_with(
+            self.crm_charm.add_replicated_pool_ops.return_value)
+
+        # pools that failed are not recorded
+        self.crm_charm.mirror_pools_enable.return_value = \
+            crm.ConcurrentResult({}, {'cinder-ceph': Exception()}, [])
+        self.crm_charm.mirror_pools_record.reset_mock()
+        self.crm_charm.collapse_and_filter_broker_requests.side_effect = [
+            endpoint_local, endpoint_remote]
+        self.endpoint_from_flag.side_effect = [endpoint_local,
+                                               endpoint_remote]
+        self.crm_charm.record_seen_pools.reset_mock()
+        self.crm_charm.record_pools_sweep.reset_mock()
+        handlers.configure_pools()
+        self.crm_charm.mirror_pools_record.assert_called_once_with(
+            {}, endpoint_local.pools)
+        self.crm_charm.record_seen_pools.assert_called_once_with(
+            states, forget=set(['cinder-ceph']))
+        # the sweep is not complete until every pool succeeded
+        self.assertFalse(self.crm_charm.record_pools_sweep.called)
+
+        # pools already confirmed mirrored are not probed again
+        self.crm_charm.mirror_pool_confirmed.return_value = True
+        self.crm_charm.mirror_pools_enable.reset_mock()
+        self.crm_charm.mirror_pools_enable.return_value = \
+            crm.ConcurrentResult({}, {}, [])
+        self.crm_charm.mirror_pools_record.reset_mock()
+        self.crm_charm.collapse_and_filter_broker_requests.side_effect = [
+            endpoint_local, endpoint_remote]
+        self.endpoint_from_flag.side_effect = [endpoint_local,
+                                               endpoint_remote]
+        handlers.configure_pools()
+        self.crm_charm.mirror_pools_enable.assert_called_once_with({})
+        self.crm_charm.mirror_pools_record.assert_called_once_with(
+            {}, endpoint_local.pools)
+
+        # snapshot pools are revisited when the schedule changes
+        self.crm_charm.snapshot_mirroring_pools.return_value = {
+            'cinder-ceph'}
+        flags.add('config.changed.snapshot-schedule-interval')
+        self.crm_charm.mirror_pools_enable.reset_mock()
+        self.crm_charm.collapse_and_filter_broker_requests.side_effect = [
+            endpoint_local, endpoint_remote]
+        self.endpoint_from_flag.side_effect = [endpoint_local,
+                                               endpoint_remote]
+        handlers.configure_pools()
+        self.is_flag_set.assert_called_with(
+            'config.changed.snapshot-schedule-interval')
+        self.crm_charm.mirror_pool_confirmed.assert_called_with(
+            'cinder-ceph', endpoint_local.pools['cinder-ceph'], 'snapshot')
+        self.crm_charm.mirror_pools_enable.assert_called_once_with(
+            {'cinder-ceph': 'snapshot'})
+
+        # other units only configure pools in their shard and leave pool
+        # creation to the leader
+        flags.clear()
+        self.crm_charm.mirror_pool_confirmed.return_value = False
+        self.crm_charm.pool_shard.side_effect = lambda pools: {}
+        self.crm_charm.mirror_pools_enable.reset_mock()
+        self.crm_charm.mirror_pools_record.reset_mock()
+        endpoint_remote.maybe_send_rq.reset_mock()
+        self.crm_charm.collapse_and_filter_broker_requests.side_effect = [
+            endpoint_local, endpoint_remote]
+        self.endpoint_from_flag.side_effect = [endpoint_local,
+                                               endpoint_remote]
+        handlers.configure_pools()
+        self.crm_charm.mirror_pools_enable.assert_called_once_with({})
+        self.crm_charm.mirror_pools_record.assert_called_once_with({}, {})
+        self.assertFalse(endpoint_remote.maybe_send_rq.called)
+
+        # outside of a sweep only pools that changed are looked at
+        flags.add('leadership.is_leader')
+        self.crm_charm.pool_shard.side_effect = lambda pools: pools
+        self.crm_charm.pools_sweep_due.return_value = False
+        self.crm_charm.pools_delta.return_value = crm.PoolsDelta([], [], [])
+        self.crm_charm.forwarded_pools.return_value = set(['cinder-ceph'])
+        self.crm_charm.mirror_pool_confirmed.reset_mock()
+        self.crm_charm.mirror_pools_enable.reset_mock()
+        self.crm_charm.record_pools_sweep.reset_mock()
+        self.crm_charm.record_forwarded_pools.reset_mock()
+        self.crm_charm.add_replicated_pool_ops.reset_mock()
+        self.crm_charm.collapse_and_filter_broker_requests.side_effect = [
+            endpoint_local, endpoint_remote]
+        self.endpoint_from_flag.side_effect = [endpoint_local,
+                                               endpoint_remote]
+        handlers.configure_pools()
+        self.assertFalse(self.crm_charm.mirror_pool_confirmed.called)
+        self.crm_charm.mirror_pools_enable.assert_called_once_with({})
+        self.assertFalse(self.crm_charm.record_pools_sweep.called)
+        # pools forwarded before keep being forwarded
+        self.assertTrue(self.crm_charm.add_replicated_pool_ops.called)
+        self.crm_charm.record_forwarded_pools.assert_called_once_with(
+            set(['cinder-ceph']))
+        self.crm_charm.pools_delta.return_value = crm.PoolsDelta(
+            [], [], ['cinder-ceph'])
+        self.crm_charm.collapse_and_filter_broker_requests.side_effect = [
+            endpoint_local, endpoint_remote]
+        self.endpoint_from_flag.side_effect = [endpoint_local,
+                                               endpoint_remote]
+        handlers.configure_pools()
+        self.crm_charm.mirror_pools_enable.assert_called_with(
+            {'cinder-ceph': 'snapshot'})
+
+    def test_publish_shard_units(self):
+        self.crm_charm.publish_shard_units.return_value = False
+        handlers.publish_shard_units()
+        self.assertFalse(self.crm_charm.peer_units.called)
+        self.crm_charm.publish_shard_units.return_value = True
+        handlers.publish_shard_units()
+        self.crm_charm.peer_units.assert_called_once_with()
+
+    def test_export_metrics(self):
+        self.patch_object(handlers.reactive, 'endpoint_from_flag')
+        endpoint_local = mock.MagicMock()
+        endpoint_local.pools = {'apool': {'applications': {'rbd': {}}}}
+        self.endpoint_from_flag.return_value = endpoint_local
+        self.crm_charm.metrics_due.return_value = False
+        handlers.export_metrics()
+        self.assertFalse(self.crm_charm.export_metrics.called)
+        self.crm_charm.metrics_due.return_value = True
+        handlers.export_metrics()
+        self.crm_charm.eligible_pools.assert_called_once_with(
+            endpoint_local.pools)
+        self.crm_charm.pool_shard.assert_called_once_with(
+            self.crm_charm.eligible_pools())
+        self.crm_charm.export_metrics.assert_called_once_with(
+            self.crm_charm.pool_shard())
+        self.crm_charm.export_metrics.side_effect = OSError
+        handlers.export_metrics()
+
+    def test_update_nrpe_config(self):
+        self.patch_object(handlers.reactive, 'set_flag')
+        handlers.update_nrpe_config()
+        self.crm_charm.update_nrpe_config.assert_called_once_with()
+        self.set_flag.assert_called_once_with(
+            'ceph-rbd-mirror.nrpe.configured')
+
+    def test_reconfigure_nrpe(self):
+        self.patch_object(handlers.reactive, 'clear_flag')
+        handlers.reconfigure_nrpe()
+        handlers.nrpe_departed()
+        self.clear_flag.assert_has_calls([
+            mock.call('ceph-rbd-mirror.nrpe.configured'),
+            mock.call('ceph-rbd-mirror.nrpe.configured'),
+        ])
+
+    def test_refresh_status_snapshot(self):
+        self.patch_object(handlers.reactive, 'endpoint_from_flag')
+        endpoint_local = mock.MagicMock()
+        self.endpoint_from_flag.return_value = endpoint_local
+        self.crm_charm.status_snapshot_due.return_value = False
+        handlers.refresh_status_snapshot()
+        self.assertFalse(self.crm_charm.write_status_snapshot.called)
+        self.crm_charm.status_snapshot_due.return_value = True
+        handlers.refresh_status_snapshot()
+        self.crm_charm.eligible_pools.assert_called_once_with(
+            endpoint_local.pools)
+        self.crm_charm.write_status_snapshot.assert_called_once_with(
+            self.crm_charm.pool_shard())
+        # a full or read-only disk does not fail the hook
+        self.patch_object(handlers.ch_core.hookenv, 'log')
+        self.crm_charm.write_status_snapshot.side_effect = OSError(
+            'Read-only file system')
+        handlers.refresh_status_snapshot()
+        self.assertTrue(self.log.called)
@@ -0,0 +1,95 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import importlib.util
+import json
+import os
+import shutil
+import tempfile
+
+import charms_openstack.test_utils as test_utils
+
+_spec = importlib.util.spec_from_file_location(
+    'check_ceph_rbd_mirror',
+    os.path.join('src', 'files', 'nrpe', 'check_ceph_rbd_mirror.py'))
+check = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(check)
+
+
+class TestCheckCephRBDMirror(test_utils.PatchHelper):
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.snapshot_file = os.path.join(self.tmpdir, 'snapshot.json')
+        self.patch_object(check.time, 'time')
+        self.time.return_value = 1000
+        self.snapshot = {
+            'timestamp': 900,
+            'failed_pools': [],
+            'pools': {
+                'apool': {
+                    'health': 'OK',
+                    'states': {'replaying': 2},
+                    'error_images': [],
+                    'max_entries_behind_primary': 5,
+                    'max_lag_image': 'imagea',
+                },
+                'bpool': {
+                    'health': 'OK',
+                    'states': {'stopped': 1},
+                    'error_images': [],
+                    'max_entries_behind_primary': None,
+                    'max_lag_image': None,
+                },
+            },
+        }
+
+    def _run(self, *args):
+        with open(self.snapshot_file, 'w') as f:
+            json.dump(self.snapshot, f)
+        return check.main(list(args) + ['--snapshot', self.snapshot_file])
+
+    def test_snapshot_unavailable(self):
+        self.assertEqual(
+            check.main(['health', '--snapshot', self.snapshot_file]),
+            check.UNKNOWN)
+        self.assertEqual(self._run('health', '--max-age', '60'),
+                         check.UNKNOWN)
+
+    def test_health(self):
+        self.assertEqual(self._run('health'), check.OK)
+        self.snapshot['failed_pools'] = ['cpool']
+        self.assertEqual(self._run('health'), check.WARNING)
+        self.snapshot['pools']['apool']['health'] = 'ERROR'
+        self.assertEqual(self._run('health'), check.CRITICAL)
+
+    def test_errors(self):
+        self.assertEqual(self._run('errors', '-w', '1', '-c', '2'), check.OK)
+        self.snapshot['pools']['apool']['error_images'] = ['imagea']
+        self.assertEqual(self._run('errors', '-w', '1', '-c', '2'),
+                         check.WARNING)
+        self.snapshot['pools']['bpool']['error_images'] = ['imageb']
+        self.assertEqual(self._run('errors', '-w', '1', '-c', '2'),
+                         check.CRITICAL)
+
+    def test_lag(self):
+        self.assertEqual(self._run('lag', '-w', '10', '-c', '20'), check.OK)
+        self.snapshot['pools']['bpool']['max_entries_behind_primary'] = 15
+        self.snapshot['pools']['bpool']['max_lag_image'] = 'imageb'
+        self.assertEqual(self._run('lag', '-w', '10', '-c', '20'),
+                         check.WARNING)
+        self.assertEqual(self._run('lag', '-w', '10', '-c', '15'),
+                         check.CRITICAL)
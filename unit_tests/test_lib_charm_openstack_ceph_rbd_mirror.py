@@ -14,12 +14,15 @@
 
 import collections
 import json
+import threading
+import time
 from unittest import mock
 import subprocess
 
 import charms_openstack.test_utils as test_utils
 
 import charm.openstack.ceph_rbd_mirror as ceph_rbd_mirror
+import charm.openstack.ceph_rbd_mirror_backend as backend
 
 
 class Helper(test_utils.PatchHelper):
@@ -29,13 +32,105 @@ class Helper(test_utils.PatchHelper):
         self.patch_release(ceph_rbd_mirror.CephRBDMirrorCharm.release)
 
 
+class TestMapConcurrently(Helper):
+
+    def test_map_concurrently(self):
+        def func(item):
+            if item == 'b':
+                raise ValueError('b')
+            return item.upper()
+        result = ceph_rbd_mirror.map_concurrently(
+            func, ['a', 'b', 'c'], concurrency=2)
+        self.assertEqual(result.results, {'a': 'A', 'c': 'C'})
+        self.assertIsInstance(result.errors['b'], ValueError)
+        self.assertEqual(result.pending, [])
+
+    def test_map_concurrently_timeout(self):
+        event = threading.Event()
+
+        def func(item):
+            if item == 'slow':
+                event.wait(5)
+            return item
+        result = ceph_rbd_mirror.map_concurrently(
+            func, ['fast', 'slow'], concurrency=2, timeout=0.5)
+        event.set()
+        self.assertEqual(result.results, {'fast': 'fast'})
+        self.assertEqual(result.pending, ['slow'])
+
+    def test_map_concurrently_timeout_kills_commands(self):
+        self.patch_object(backend, 'runner', new=backend.CommandRunner())
+        self.patch_object(backend, 'call_stats')
+        backend.runner.breaker.threshold = 1
+        done = threading.Event()
+        finished = {}
+
+        def func(item):
+            try:
+                backend.check_output(['sleep', '5'], 'pool status', item)
+            finally:
+                finished[item] = time.time()
+                done.set()
+        start = time.time()
+        result = ceph_rbd_mirror.map_concurrently(
+            func, ['blocked'], concurrency=1, timeout=0.5)
+        self.assertEqual(result.pending, ['blocked'])
+        # the straggling command is killed at the deadline instead of
+        # keeping the worker, and the hook, alive
+        self.assertTrue(done.wait(3))
+        self.assertLess(finished['blocked'] - start, 2)
+        # running into the deadline does not count against the cluster
+        self.assertEqual(backend.runner.breaker.open_circuits(), {})
+
+    def test_map_concurrently_timeout_many_slow_items(self):
+        self.patch_object(backend, 'runner', new=backend.CommandRunner())
+        self.patch_object(backend, 'call_stats')
+
+        def func(item):
+            if item == 'fast':
+                return backend.check_output(['true'], 'pool status', item)
+            if item == 'broken':
+                return backend.check_output(['false'], 'pool status', item)
+            return backend.check_output(['sleep', '5'], 'pool status', item)
+        slow = ['slow{}'.format(n) for n in range(6)]
+        start = time.time()
+        result = ceph_rbd_mirror.map_concurrently(
+            func, ['fast', 'broken'] + slow, concurrency=4, timeout=0.5)
+        self.assertLess(time.time() - start, 2)
+        self.assertEqual(list(result.results), ['fast'])
+        self.assertEqual(list(result.errors), ['broken'])
+        # slow items killed at the deadline, or not started before it, are
+        # pending rather than failed, wherever they were when it passed
+        self.assertEqual(sorted(result.pending), slow)
+
+
 class TestCephRBDMirrorCharm(Helper):
 
+    def test_custom_assess_status_check_circuit_open(self):
+        self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
+        self.patch_object(ceph_rbd_mirror.reactive, 'is_flag_set')
+        self.patch_object(ceph_rbd_mirror.backend, 'runner')
+        self.runner.breaker.open_circuits.return_value = {
+            'remote': 120.4, 'ceph': 30}
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm()
+        self.runner.configure.assert_called_once_with(crmc.config)
+        self.assertEqual(
+            crmc.custom_assess_status_check(),
+            ('blocked', 'Ceph cluster unreachable, retrying ceph in 30s, '
+                        'remote in 120s'))
+        self.assertFalse(self.is_flag_set.called)
+
     def test_custom_assess_status_check(self):
         self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
         self.patch_object(ceph_rbd_mirror.reactive, 'is_flag_set')
+        self.patch_object(ceph_rbd_mirror.ch_core.hookenv, 'is_leader')
+        self.is_leader.return_value = False
         self.is_flag_set.return_value = False
         crmc = ceph_rbd_mirror.CephRBDMirrorCharm()
+        crmc.pool_shard = mock.MagicMock()
+        crmc.pool_shard.side_effect = lambda pools: pools
+        crmc.share_mirror_pools_summary = mock.MagicMock()
+        crmc.aggregate_mirror_pools_summaries = mock.MagicMock()
         self.assertEqual(crmc.custom_assess_status_check(), (None, None))
         self.is_flag_set.return_value = True
         self.patch_object(ceph_rbd_mirror.reactive, 'endpoint_from_flag')
@@ -68,20 +163,797 @@ class TestCephRBDMirrorCharm(Helper):
         self.assertEqual(crmc.custom_assess_status_check(),
                          ('active', 'Unit is ready (Pools OK (1) '
                                     'Images Primary (2))'))
+        crmc.mirror_pools_summary.return_value['pools_timed_out'] = [
+            'apool', 'bpool']
+        self.assertEqual(crmc.custom_assess_status_check(),
+                         ('active', 'Unit is ready (Pools OK (1) '
+                                    'Images Primary (2)), status of 2 pools '
+                                    'timed out'))
+        crmc.share_mirror_pools_summary.assert_called_with(
+            crmc.mirror_pools_summary.return_value)
+        self.assertFalse(crmc.aggregate_mirror_pools_summaries.called)
+        # the leader reports on the pools of all shards
+        self.is_leader.return_value = True
+        crmc.aggregate_mirror_pools_summaries.return_value = {
+            'pool_health': {'OK': 3},
+            'image_states': {'stopped': 6},
+        }
+        self.assertEqual(crmc.custom_assess_status_check(),
+                         ('active', 'Unit is ready (Pools OK (3) '
+                                    'Images Primary (6))'))
+        self.is_leader.return_value = False
+        # other units may have no pools assigned
+        self.endpoint_from_flag.return_value.pools = {
+            'apool': {'applications': {'rbd': {}}}}
+        crmc.pool_shard.side_effect = lambda pools: {}
+        crmc.mirror_pools_summary.return_value = {
+            'pool_health': {}, 'image_states': {}}
+        self.assertEqual(crmc.custom_assess_status_check(),
+                         ('active', 'Unit is ready (no pools in shard)'))
         crmc.mirror_pools_summary.side_effect = subprocess.CalledProcessError(
             42, [])
         self.assertEqual(crmc.custom_assess_status_check(), (None, None))
 
+    def test_mirror_pools_summary(self):
+        self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm(
+            config={'status-concurrency': 2, 'status-timeout': 0})
+        crmc.mirror_pool_status = mock.MagicMock()
+        crmc.mirror_pool_status.side_effect = lambda pool: {
+            'summary': {
+                'health': 'OK',
+                'states': {'replaying': 2, 'stopped': 1},
+            },
+        }
+        stats = crmc.mirror_pools_summary(['apool', 'bpool'])
+        self.assertEqual(stats['pool_health'], {'OK': 2})
+        self.assertEqual(stats['image_states'],
+                         {'replaying': 4, 'stopped': 2})
+        self.assertEqual(stats['pools_timed_out'], [])
+        crmc.mirror_pool_status.side_effect = subprocess.CalledProcessError(
+            42, [])
+        with self.assertRaises(subprocess.CalledProcessError):
+            crmc.mirror_pools_summary(['apool', 'bpool'])
+
+    def test_mirror_pools_summary_admin_socket(self):
+        self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
+        self.patch_object(ceph_rbd_mirror.backend, 'daemon_mirror_status')
+        self.patch_object(ceph_rbd_mirror.backend, 'daemon_pools_status')
+        self.gethostname.return_value = 'ahostname'
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm(
+            config={'status-source': 'admin-socket'})
+        crmc.mirror_pool_status = mock.MagicMock()
+        crmc.mirror_pool_status.return_value = {
+            'summary': {'health': 'WARNING', 'states': {'syncing': 1}},
+        }
+        self.daemon_pools_status.return_value = {
+            'apool': {'summary': {'health': 'OK',
+                                  'states': {'replaying': 2}}},
+            'cpool': {'summary': {'health': 'OK',
+                                  'states': {'replaying': 5}}},
+        }
+        stats = crmc.mirror_pools_summary(['apool', 'bpool'])
+        self.daemon_mirror_status.assert_called_once_with(
+            'rbd-mirror.ahostname')
+        self.daemon_pools_status.assert_called_once_with(
+            self.daemon_mirror_status.return_value)
+        crmc.mirror_pool_status.assert_called_once_with('bpool')
+        self.assertEqual(stats['pool_health'], {'OK': 1, 'WARNING': 1})
+        self.assertEqual(stats['image_states'],
+                         {'replaying': 2, 'syncing': 1})
+        # socket not available
+        self.daemon_mirror_status.return_value = None
+        crmc.mirror_pool_status.reset_mock()
+        stats = crmc.mirror_pools_summary(['apool', 'bpool'])
+        self.assertEqual(crmc.mirror_pool_status.call_count, 2)
+        self.assertEqual(stats['pool_health'], {'WARNING': 2})
+        # not enabled
+        self.daemon_mirror_status.reset_mock()
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm(config={})
+        crmc.mirror_pool_status = mock.MagicMock()
+        crmc.mirror_pools_summary(['apool'])
+        self.assertFalse(self.daemon_mirror_status.called)
+        crmc.mirror_pool_status.assert_called_once_with('apool')
+
+    def test_record_eligible_pools(self):
+        self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
+        self.patch_object(ceph_rbd_mirror.ch_core.unitdata, 'kv')
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm()
+        crmc.record_eligible_pools({
+            'bpool': {'applications': {'rbd': {}}},
+            'apool': {'applications': {'rbd': {}}},
+            'cpool': {'applications': {'rgw': {}}},
+        })
+        self.kv().set.assert_called_once_with(
+            'ceph-rbd-mirror.eligible-pools', ['apool', 'bpool'])
+
+    def test_metrics_due(self):
+        self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
+        self.patch_object(ceph_rbd_mirror.os.path, 'getmtime')
+        self.patch_object(ceph_rbd_mirror.time, 'time')
+        self.time.return_value = 1000
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm(config={})
+        self.assertFalse(crmc.metrics_due())
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm(config={
+            'prometheus-textfile-dir': '/adir',
+            'prometheus-textfile-interval': 300})
+        self.getmtime.side_effect = OSError
+        self.assertTrue(crmc.metrics_due())
+        self.getmtime.side_effect = None
+        self.getmtime.return_value = 800
+        self.assertFalse(crmc.metrics_due())
+        self.getmtime.assert_called_with('/adir/ceph_rbd_mirror.prom')
+        self.getmtime.return_value = 700
+        self.assertTrue(crmc.metrics_due())
+
+    def test_export_metrics(self):
+        self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
+        self.patch_object(ceph_rbd_mirror.metrics, 'format_metrics')
+        self.patch_object(ceph_rbd_mirror.metrics, 'write_textfile')
+        self.patch_object(ceph_rbd_mirror.time, 'time')
+        self.time.return_value = 1000
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm(config={
+            'prometheus-textfile-dir': '/adir'})
+        crmc.mirror_pool_status = mock.MagicMock()
+
+        def _status(pool, verbose=False):
+            if pool == 'bpool':
+                raise subprocess.CalledProcessError(42, [])
+            return {'summary': {'health': 'OK'}, 'images': []}
+
+        crmc.mirror_pool_status.side_effect = _status
+        self.assertEqual(crmc.export_metrics(['apool', 'bpool']),
+                         self.write_textfile.return_value)
+        crmc.mirror_pool_status.assert_has_calls([
+            mock.call('apool', verbose=True),
+            mock.call('bpool', verbose=True),
+        ], any_order=True)
+        self.format_metrics.assert_called_once_with(
+            {'apool': {'summary': {'health': 'OK'}, 'images': []}},
+            ['bpool'], 0, 1000)
+        self.write_textfile.assert_called_once_with(
+            '/adir', self.format_metrics.return_value)
+
+    def test_write_status_snapshot(self):
+        self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
+        self.patch_object(ceph_rbd_mirror.metrics, 'replace_file')
+        self.patch_object(ceph_rbd_mirror.time, 'time')
+        self.time.return_value = 1000
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm(config={})
+        crmc.collect_mirror_pool_status = mock.MagicMock()
+        crmc.collect_mirror_pool_status.return_value = ({
+            'apool': {
+                'summary': {'health': 'ERROR',
+                            'states': {'error': 1, 'replaying': 2}},
+                'images': [
+                    {'name': 'imagea', 'state': 'up+error',
+                     'description': 'failed'},
+                    {'name': 'imageb', 'state': 'up+replaying',
+                     'description': 'replaying, '
+                                    '{"entries_behind_primary":4}'},
+                    {'name': 'imagec', 'state': 'up+replaying',
+                     'description': 'replaying, '
+                                    '{"entries_behind_primary":7}'},
+                ],
+            },
+        }, ['bpool'])
+        crmc.write_status_snapshot(['apool', 'bpool'])
+        crmc.collect_mirror_pool_status.assert_called_once_with(
+            ['apool', 'bpool'])
+        self.replace_file.assert_called_once_with(
+            ceph_rbd_mirror.STATUS_SNAPSHOT_FILE, mock.ANY, perms=0o644)
+        self.assertEqual(json.loads(self.replace_file.call_args[0][1]), {
+            'timestamp': 1000,
+            'failed_pools': ['bpool'],
+            'pools': {
+                'apool': {
+                    'health': 'ERROR',
+                    'states': {'error': 1, 'replaying': 2},
+                    'error_images': ['imagea'],
+                    'max_entries_behind_primary': 7,
+                    'max_lag_image': 'imagec',
+                },
+            },
+        })
+
+    def test_update_nrpe_config(self):
+        self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
+        self.gethostname.return_value = 'ahost'
+        self.patch_object(ceph_rbd_mirror.ch_core.host, 'mkdir')
+        self.patch_object(ceph_rbd_mirror.ch_core.hookenv, 'charm_dir')
+        self.charm_dir.return_value = '/charm'
+        self.patch_object(ceph_rbd_mirror, 'nrpe')
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm(config={
+            'nagios-snapshot-max-age': 1800,
+            'nagios-image-errors-warning': 1,
+            'nagios-image-errors-critical': 5,
+            'nagios-lag-warning': 10,
+            'nagios-lag-critical': 100,
+        })
+        crmc.update_nrpe_config()
+        self.nrpe.copy_nrpe_checks.assert_called_once_with(
+            nrpe_files_dir='/charm/files/nrpe')
+        self.nrpe.add_init_service_checks.assert_called_once_with(
+            self.nrpe.NRPE(), ['ceph-rbd-mirror@rbd-mirror.ahost'],
+            self.nrpe.get_nagios_unit_name())
+        check = ('/usr/local/lib/nagios/plugins/check_ceph_rbd_mirror.py '
+                 '{} --snapshot '
+                 '/var/lib/charm/ceph-rbd-mirror/status-snapshot.json '
+                 '--max-age 1800')
+        self.nrpe.NRPE().add_check.assert_has_calls([
+            mock.call(shortname='rbd_mirror_health',
+                      description='Ceph RBD mirror pool health',
+                      check_cmd=check.format('health')),
+            mock.call(shortname='rbd_mirror_image_errors',
+                      description='Ceph RBD mirror images in error state',
+                      check_cmd=check.format('errors') + ' -w 1 -c 5'),
+            mock.call(shortname='rbd_mirror_lag',
+                      description='Ceph RBD mirror replication lag',
+                      check_cmd=check.format('lag') + ' -w 10 -c 100'),
+        ])
+        self.nrpe.NRPE().write.assert_called_once_with()
+
+    def test_cached_mirror_pools_summary(self):
+        self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
+        self.patch_object(ceph_rbd_mirror.ch_core.unitdata, 'kv')
+        self.patch_object(ceph_rbd_mirror.time, 'time')
+        kv = {}
+        self.kv.return_value.get.side_effect = (
+            lambda key, default=None: kv.get(key, default))
+        self.kv.return_value.set.side_effect = kv.__setitem__
+        self.kv.return_value.unset.side_effect = kv.pop
+        self.time.return_value = 1000
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm(
+            config={'status-cache-max-age': 60})
+        crmc.mirror_pools_summary = mock.MagicMock()
+        crmc.mirror_pools_summary.return_value = {
+            'pool_health': {'OK': 2},
+            'image_states': {},
+            'pools_timed_out': [],
+        }
+        self.assertEqual(crmc.cached_mirror_pools_summary(['bpool', 'apool']),
+                         crmc.mirror_pools_summary.return_value)
+        crmc.mirror_pools_summary.assert_called_once_with(['apool', 'bpool'])
+        self.time.return_value = 1059
+        crmc.cached_mirror_pools_summary(['apool', 'bpool'])
+        self.assertEqual(crmc.mirror_pools_summary.call_count, 1)
+        # different set of pools
+        crmc.cached_mirror_pools_summary(['apool'])
+        self.assertEqual(crmc.mirror_pools_summary.call_count, 2)
+        # stale
+        self.time.return_value = 1200
+        crmc.cached_mirror_pools_summary(['apool'])
+        crmc.cached_mirror_pools_summary(['apool'])
+        self.assertEqual(crmc.mirror_pools_summary.call_count, 3)
+        # invalidated
+        crmc.invalidate_mirror_pools_summary()
+        crmc.cached_mirror_pools_summary(['apool'])
+        self.assertEqual(crmc.mirror_pools_summary.call_count, 4)
+        # partial results are not kept
+        crmc.invalidate_mirror_pools_summary()
+        crmc.mirror_pools_summary.return_value = {
+            'pool_health': {},
+            'image_states': {},
+            'pools_timed_out': ['apool'],
+        }
+        crmc.cached_mirror_pools_summary(['apool'])
+        crmc.cached_mirror_pools_summary(['apool'])
+        self.assertEqual(crmc.mirror_pools_summary.call_count, 6)
+
     def test__mirror_pool_info(self):
         self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
-        self.patch_object(ceph_rbd_mirror.subprocess, 'check_output')
+        self.patch_object(backend.subprocess, 'check_output')
         self.gethostname.return_value = 'ahostname'
         self.check_output.return_value = '{}'
         crmc = ceph_rbd_mirror.CephRBDMirrorCharm()
         crmc._mirror_pool_info('apool')
         self.check_output.assert_called_once_with(
             ['rbd', '--id', 'rbd-mirror.ahostname', 'mirror', 'pool', 'info',
-             '--format', 'json', 'apool'], universal_newlines=True)
+             '--format', 'json', 'apool'], universal_newlines=True,
+            timeout=60)
+
+    def test__mirror_pool_info_cached(self):
+        self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
+        self.patch_object(backend.subprocess, 'check_output')
+        self.patch_object(backend.subprocess, 'check_call')
+        self.check_output.return_value = '{"mode": "pool", "peers": []}'
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm()
+        self.assertTrue(crmc.mirror_pool_enabled('apool'))
+        self.assertFalse(crmc.mirror_pool_has_peers('apool'))
+        self.check_output.assert_called_once()
+        self.assertEqual(crmc.query_cache.hits, 1)
+        self.assertEqual(crmc.query_cache.misses, 1)
+        self.assertEqual(crmc._mirror_pool_configure('apool', 'pool'),
+                         ['peer-add'])
+        crmc._mirror_pool_info('apool')
+        self.assertEqual(self.check_output.call_count, 2)
+        self.assertEqual(crmc.query_cache.misses, 2)
+
+    def test_mirror_query_cache(self):
+        cache = ceph_rbd_mirror.MirrorQueryCache()
+        loader = mock.MagicMock()
+        loader.return_value = 'aresult'
+        self.assertEqual(cache.get('info', 'apool', loader), 'aresult')
+        self.assertEqual(cache.get('info', 'apool', loader), 'aresult')
+        self.assertEqual(cache.get('status', 'apool', loader), 'aresult')
+        self.assertEqual(cache.get('info', 'bpool', loader), 'aresult')
+        self.assertEqual(loader.call_count, 3)
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+        cache.invalidate('apool')
+        cache.get('info', 'apool', loader)
+        cache.get('info', 'bpool', loader)
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+        cache.invalidate()
+        cache.get('info', 'bpool', loader)
+        self.assertEqual((cache.hits, cache.misses), (2, 5))
+
+    def test_mirror_pools_enable(self):
+        self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
+        self.gethostname.return_value = 'ahostname'
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm(
+            config={'enable-concurrency': 2})
+        crmc._backend = mock.MagicMock()
+        crmc.invalidate_mirror_pools_summary = mock.MagicMock()
+        info = {
+            'apool': {'mode': 'disabled', 'peers': []},
+            'bpool': {'mode': 'image', 'peers': [{'uuid': 'auuid'}]},
+            'cpool': {'mode': 'pool', 'peers': []},
+            'dpool': {'mode': 'disabled', 'peers': []},
+        }
+        crmc._backend.mirror_pool_info.side_effect = (
+            lambda pool: info[pool])
+
+        def _enable(pool, mode):
+            if pool == 'dpool':
+                raise subprocess.CalledProcessError(1, 'rbd')
+
+        crmc._backend.mirror_pool_enable.side_effect = _enable
+        outcome = crmc.mirror_pools_enable({
+            'apool': 'pool',
+            'bpool': 'image',
+            'cpool': 'pool',
+            'dpool': 'pool',
+        })
+        self.assertEqual(outcome.results, {
+            'apool': ['enable', 'peer-add'],
+            'bpool': [],
+            'cpool': ['peer-add'],
+        })
+        self.assertEqual(list(outcome.errors), ['dpool'])
+        crmc._backend.mirror_pool_enable.assert_has_calls([
+            mock.call('apool', 'pool'),
+            mock.call('dpool', 'pool'),
+        ], any_order=True)
+        self.assertEqual(crmc._backend.mirror_pool_enable.call_count, 2)
+        crmc._backend.mirror_pool_peer_add.assert_has_calls([
+            mock.call('apool', 'client.rbd-mirror.ahostname@remote'),
+            mock.call('cpool', 'client.rbd-mirror.ahostname@remote'),
+        ], any_order=True)
+        self.assertEqual(crmc._backend.mirror_pool_peer_add.call_count, 2)
+        crmc.invalidate_mirror_pools_summary.assert_called_once_with()
+        # nothing to do
+        crmc.invalidate_mirror_pools_summary.reset_mock()
+        outcome = crmc.mirror_pools_enable({'bpool': 'image'})
+        self.assertEqual(outcome.results, {'bpool': []})
+        self.assertFalse(crmc.invalidate_mirror_pools_summary.called)
+
+    def test_peer_units(self):
+        self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
+        self.patch_object(ceph_rbd_mirror.ch_core.hookenv, 'local_unit')
+        self.patch_object(ceph_rbd_mirror.ch_core.hookenv, 'relation_ids')
+        self.patch_object(ceph_rbd_mirror.ch_core.hookenv, 'related_units')
+        self.patch_object(ceph_rbd_mirror.ch_core.hookenv, 'leader_set')
+        self.patch_object(ceph_rbd_mirror.sharding, 'shard_units')
+        self.local_unit.return_value = 'ceph-rbd-mirror/1'
+        self.relation_ids.return_value = ['peers:3']
+        self.related_units.return_value = ['ceph-rbd-mirror/2',
+                                           'ceph-rbd-mirror/0']
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm()
+        units = ['ceph-rbd-mirror/0', 'ceph-rbd-mirror/1',
+                 'ceph-rbd-mirror/2']
+        self.assertEqual(crmc.peer_units(), units)
+        self.relation_ids.assert_called_once_with('peers')
+        self.related_units.assert_called_once_with('peers:3')
+        self.shard_units.return_value = units
+        self.assertFalse(crmc.publish_shard_units())
+        self.assertFalse(self.leader_set.called)
+        self.shard_units.return_value = units[:2]
+        self.assertTrue(crmc.publish_shard_units())
+        self.leader_set.assert_called_once_with(
+            {'pool-shard-units': json.dumps(units)})
+
+    def test_pool_shard(self):
+        self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
+        self.patch_object(ceph_rbd_mirror.sharding, 'local_shard')
+        self.local_shard.return_value = ['bpool']
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm()
+        pools = {'apool': {'a': 1}, 'bpool': {'b': 2}}
+        self.assertEqual(crmc.pool_shard(pools), {'bpool': {'b': 2}})
+        self.local_shard.assert_called_once_with(pools)
+
+    def test_pools_delta(self):
+        self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
+        self.patch_object(ceph_rbd_mirror.ch_core.unitdata, 'kv')
+        self.patch_object(ceph_rbd_mirror.time, 'time')
+        self.patch_object(ceph_rbd_mirror.ch_core.hookenv, 'leader_get')
+        self.patch_object(ceph_rbd_mirror.ch_core.hookenv, 'leader_set')
+        store = {}
+        self.kv.return_value.get.side_effect = store.get
+        self.kv.return_value.set.side_effect = store.__setitem__
+        leader_settings = {}
+        self.leader_get.side_effect = leader_settings.get
+        self.leader_set.side_effect = leader_settings.update
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm(
+            config={'pool-revalidate-interval': 60})
+        states = {'apool': [{'a': 1}, 'pool'], 'bpool': [{'b': 1}, 'pool']}
+        self.assertEqual(
+            crmc.pools_delta(states),
+            ceph_rbd_mirror.PoolsDelta(['apool', 'bpool'], [], []))
+        crmc.record_seen_pools(states, forget=set(['bpool']))
+        self.assertEqual(store['ceph-rbd-mirror.seen-pools'],
+                         {'apool': [{'a': 1}, 'pool']})
+        crmc.record_seen_pools(states)
+        self.assertEqual(crmc.pools_delta(states),
+                         ceph_rbd_mirror.PoolsDelta([], [], []))
+        new_states = {'apool': [{'a': 2}, 'pool'],
+                      'cpool': [{'c': 1}, 'image']}
+        self.assertEqual(crmc.pools_delta(new_states),
+                         ceph_rbd_mirror.PoolsDelta(
+                             ['cpool'], ['bpool'], ['apool']))
+        # failed pools are forgotten
+        crmc.record_seen_pools(new_states, forget=set(['apool', 'cpool']))
+        self.assertEqual(store['ceph-rbd-mirror.seen-pools'], {})
+        # an unchanged pool failing in a sweep is retried by the next hook
+        crmc.record_seen_pools(new_states)
+        self.assertEqual(crmc.pools_delta(new_states),
+                         ceph_rbd_mirror.PoolsDelta([], [], []))
+        crmc.record_seen_pools(new_states, forget=set(['cpool']))
+        self.assertEqual(crmc.pools_delta(new_states),
+                         ceph_rbd_mirror.PoolsDelta(['cpool'], [], []))
+        # forwarded pools are kept in leader settings
+        self.assertEqual(crmc.forwarded_pools(), set())
+        crmc.record_forwarded_pools(set(['bpool', 'apool']))
+        self.leader_set.assert_called_once_with(
+            {'forwarded-pools': '["apool", "bpool"]'})
+        self.assertEqual(crmc.forwarded_pools(), set(['apool', 'bpool']))
+        crmc.record_forwarded_pools(['apool', 'bpool'])
+        self.assertEqual(self.leader_set.call_count, 1)
+        self.time.return_value = 1000
+        self.assertTrue(crmc.pools_sweep_due())
+        crmc.record_pools_sweep()
+        self.assertFalse(crmc.pools_sweep_due())
+        self.time.return_value = 1060
+        self.assertTrue(crmc.pools_sweep_due())
+
+    def test_all_packages(self):
+        self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm(config={
+            'ceph-backend': 'cli'})
+        self.assertEqual(crmc.all_packages, ['rbd-mirror'])
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm(config={
+            'ceph-backend': 'librados'})
+        self.assertEqual(crmc.all_packages,
+                         ['rbd-mirror', 'python3-rados', 'python3-rbd'])
+
+    def test_mirror_pools_summaries(self):
+        self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
+        self.patch_object(ceph_rbd_mirror.ch_core.hookenv, 'relation_ids')
+        self.patch_object(ceph_rbd_mirror.ch_core.hookenv, 'related_units')
+        self.patch_object(ceph_rbd_mirror.ch_core.hookenv, 'relation_get')
+        self.patch_object(ceph_rbd_mirror.ch_core.hookenv, 'relation_set')
+        self.patch_object(ceph_rbd_mirror.ch_core.unitdata, 'kv')
+        kv = {}
+        self.kv.return_value.get.side_effect = (
+            lambda key, default=None: kv.get(key, default))
+        self.kv.return_value.set.side_effect = kv.__setitem__
+        self.relation_ids.return_value = ['peers:3']
+        self.related_units.return_value = ['ceph-rbd-mirror/1',
+                                           'ceph-rbd-mirror/2',
+                                           'ceph-rbd-mirror/3']
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm()
+        stats = {
+            'pool_health': {'OK': 2},
+            'image_states': {'stopped': 4},
+            'pools_timed_out': [],
+            'pools': {
+                'apool': {'health': 'OK', 'states': {'stopped': 2}},
+                'bpool': {'health': 'OK', 'states': {'stopped': 2}},
+            },
+        }
+        crmc.share_mirror_pools_summary(stats)
+        self.relation_set.assert_called_once_with(
+            relation_id='peers:3',
+            relation_settings={
+                'mirror-pools-summary': json.dumps(stats, sort_keys=True)})
+        # an unchanged summary is not published again
+        self.relation_set.reset_mock()
+        crmc.share_mirror_pools_summary(dict(stats))
+        self.assertFalse(self.relation_set.called)
+        self.relation_ids.return_value = ['peers:3', 'peers:4']
+        crmc.share_mirror_pools_summary(stats)
+        self.relation_set.assert_called_once_with(
+            relation_id='peers:4', relation_settings=mock.ANY)
+        self.relation_ids.return_value = ['peers:3']
+        self.relation_get.side_effect = [
+            json.dumps({
+                'pool_health': {'OK': 1, 'WARNING': 1},
+                'image_states': {'stopped': 1, 'replaying': 3},
+                'pools_timed_out': ['cpool', 'dpool'],
+                'pools': {
+                    # being reassigned from this unit, counted once
+                    'bpool': {'health': 'OK', 'states': {'stopped': 1}},
+                    'epool': {'health': 'WARNING',
+                              'states': {'replaying': 3}},
+                },
+            }),
+            # unit of a charm revision without per-pool status
+            json.dumps({
+                'pool_health': {'OK': 1},
+                'image_states': {'replaying': 1},
+                'pools_timed_out': [],
+            }),
+            None,
+        ]
+        self.assertEqual(crmc.aggregate_mirror_pools_summaries(stats), {
+            'pool_health': {'OK': 3, 'WARNING': 1},
+            'image_states': {'stopped': 4, 'replaying': 4},
+            'pools_timed_out': ['cpool', 'dpool'],
+        })
+        self.relation_get.assert_has_calls([
+            mock.call('mirror-pools-summary', unit='ceph-rbd-mirror/1',
+                      rid='peers:3'),
+            mock.call('mirror-pools-summary', unit='ceph-rbd-mirror/2',
+                      rid='peers:3'),
+        ])
+
+    def test_rbd_mirror_tuning(self):
+        self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
+        self.gethostname.return_value = 'ahostname'
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm(config={
+            'rbd-mirror-concurrent-image-syncs': 10,
+            'rbd-mirror-memory-target': 2048,
+            'rbd-mirror-memory-cache-min': 1024,
+            'rbd-mirror-pool-replayers-refresh-interval': None,
+        })
+        expect = {
+            'rbd_mirror_concurrent_image_syncs': 10,
+            'rbd_mirror_memory_target': 2048,
+            'rbd_mirror_memory_cache_min': 1024,
+        }
+        self.assertEqual(crmc.rbd_mirror_tuning(), expect)
+        config = mock.MagicMock()
+        config.charm_instance = crmc
+        self.assertEqual(ceph_rbd_mirror.rbd_mirror_tuning(config), expect)
+        self.assertEqual(ceph_rbd_mirror.rbd_mirror_client(config),
+                         'client.rbd-mirror.ahostname')
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm(config={
+            'rbd-mirror-memory-cache-min': 1024})
+        self.assertEqual(crmc.rbd_mirror_tuning(),
+                         {'rbd_mirror_memory_cache_min': 1024})
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm(config={
+            'rbd-mirror-memory-target': 512,
+            'rbd-mirror-memory-cache-min': 1024})
+        with self.assertRaises(ValueError):
+            crmc.rbd_mirror_tuning()
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm(config={
+            'rbd-mirror-concurrent-image-syncs': 0,
+            'rbd-mirror-image-state-check-interval': -1})
+        self.assertEqual(
+            crmc.custom_assess_status_check(),
+            ('blocked', 'Configuration error: '
+                        'rbd-mirror-concurrent-image-syncs, '
+                        'rbd-mirror-image-state-check-interval must be a '
+                        'positive integer'))
+
+    def test_snapshot_config(self):
+        self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm(config={
+            'snapshot-mirroring-pools': 'apool, bpool,',
+            'snapshot-schedule-interval': '1h, 15m 1h',
+        })
+        self.assertEqual(crmc.snapshot_mirroring_pools(), {'apool', 'bpool'})
+        self.assertEqual(crmc.snapshot_schedule_intervals(), ['15m', '1h'])
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm(config={})
+        self.assertEqual(crmc.snapshot_mirroring_pools(), set())
+        self.assertEqual(crmc.snapshot_schedule_intervals(), [])
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm(config={
+            'snapshot-schedule-interval': '1h 5s 0m'})
+        with self.assertRaises(ValueError):
+            crmc.snapshot_schedule_intervals()
+        self.assertEqual(
+            crmc.custom_assess_status_check(),
+            ('blocked', 'Configuration error: invalid '
+                        'snapshot-schedule-interval: 5s, 0m'))
+
+    def test_mirror_pools_role_change(self):
+        self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
+        self.patch_object(ceph_rbd_mirror.backend, 'check_output')
+        self.gethostname.return_value = 'ahostname'
+
+        def _check_output(cmd, verb, pool, **kwargs):
+            if pool == 'bpool':
+                raise subprocess.CalledProcessError(
+                    22, cmd, output='rbd: failed\n')
+            if pool == 'cpool':
+                raise subprocess.TimeoutExpired(cmd, 10)
+            return 'Demoted 2 mirrored images\n'
+
+        self.check_output.side_effect = _check_output
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm()
+        crmc.invalidate_mirror_pools_summary = mock.MagicMock()
+        callback = mock.MagicMock()
+        outcome = crmc.mirror_pools_role_change(
+            'demote', ['apool', 'bpool', 'cpool'], force=True,
+            concurrency=3, timeout=10, callback=callback)
+        self.check_output.assert_any_call(
+            ['rbd', '--id', 'rbd-mirror.ahostname', 'mirror', 'pool',
+             'demote', '--force', 'apool'], 'pool demote', 'apool',
+            cluster=None, stderr=subprocess.STDOUT, universal_newlines=True,
+            timeout=10)
+        self.assertEqual(outcome.errors, {})
+        for result in outcome.results.values():
+            self.assertTrue(result.pop('duration') >= 0)
+        self.assertEqual(outcome.results, {
+            'apool': {'output': 'Demoted 2 mirrored images'},
+            'bpool': {'error': 'rbd: failed'},
+            'cpool': {'error': 'timed out after 10s'},
+        })
+        self.assertEqual(callback.call_count, 3)
+        crmc.invalidate_mirror_pools_summary.assert_called_once_with()
+        crmc.mirror_pools_role_change('promote', ['apool'],
+                                      cluster='remote')
+        self.check_output.assert_called_with(
+            ['rbd', '--id', 'rbd-mirror.ahostname', '--cluster', 'remote',
+             'mirror', 'pool', 'promote', 'apool'], 'pool promote', 'apool',
+            cluster='remote', stderr=subprocess.STDOUT,
+            universal_newlines=True, timeout=None)
+
+    def test_mirror_pools_role_change_no_timeout(self):
+        self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
+        self.patch_object(backend.subprocess, 'check_output')
+        self.gethostname.return_value = 'ahostname'
+        self.check_output.return_value = 'Promoted 1 mirrored images\n'
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm()
+        crmc.invalidate_mirror_pools_summary = mock.MagicMock()
+        outcome = crmc.mirror_pools_role_change(
+            'promote', ['apool'], timeout=backend.NO_TIMEOUT)
+        self.assertEqual(outcome.results['apool']['output'],
+                         'Promoted 1 mirrored images')
+        self.check_output.assert_called_once_with(
+            ['rbd', '--id', 'rbd-mirror.ahostname', 'mirror', 'pool',
+             'promote', 'apool'], stderr=subprocess.STDOUT,
+            universal_newlines=True, timeout=None)
+
+    def test_mirror_pools_await_sync(self):
+        self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
+        self.patch_object(ceph_rbd_mirror.time, 'time')
+        self.patch_object(ceph_rbd_mirror.time, 'sleep')
+        clock = [100.0]
+        self.time.side_effect = lambda: clock[0]
+        self.sleep.side_effect = lambda seconds: clock.__setitem__(
+            0, clock[0] + seconds)
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm()
+        crmc._backend = mock.MagicMock()
+        synced = {'name': 'synced', 'state': 'up+unknown',
+                  'description': 'remote image demoted'}
+        lagging = {'name': 'lagging', 'state': 'up+replaying',
+                   'description': 'replaying, {"entries_behind_primary":5}'}
+        rounds = {
+            'apool': [[synced]],
+            'bpool': [[synced, lagging], [synced, lagging], [synced, lagging],
+                      [synced]],
+        }
+        crmc._backend.mirror_pool_status.side_effect = (
+            lambda pool, verbose, cluster: {'images': rounds[pool].pop(0)})
+        result = crmc.mirror_pools_await_sync(
+            ['apool', 'bpool'], cluster='remote', timeout=60,
+            concurrency=2)
+        crmc._backend.mirror_pool_status.assert_any_call(
+            'bpool', verbose=True, cluster='remote')
+        self.assertEqual(result, {
+            'time_to_consistent': {'apool': 0.0, 'bpool': 7.0},
+            'held_up': {'bpool': ['lagging']},
+            'lagging': {},
+            'rounds': 4,
+        })
+        # no progress doubles the interval
+        self.sleep.assert_has_calls([mock.call(1), mock.call(2),
+                                     mock.call(4)])
+        # images still lagging at the deadline are reported
+        rounds['bpool'] = [[lagging]] * 10
+        crmc._backend.mirror_pool_status.side_effect = (
+            lambda pool, verbose, cluster: {'images': rounds[pool].pop(0)})
+        result = crmc.mirror_pools_await_sync(['bpool'], timeout=10)
+        self.assertEqual(result['lagging'], {'bpool': ['lagging']})
+        self.assertEqual(result['time_to_consistent'], {})
+        self.assertEqual(result['rounds'], 5)
+        # images already primary on the peer are in sync
+        rounds['bpool'] = [[synced, {
+            'name': 'primary', 'state': 'up+stopped',
+            'description': 'local image is primary'}]]
+        crmc._backend.mirror_pool_status.side_effect = (
+            lambda pool, verbose, cluster: {'images': rounds[pool].pop(0)})
+        result = crmc.mirror_pools_await_sync(['bpool'], timeout=10)
+        self.assertEqual(result['lagging'], {})
+        self.assertEqual(result['rounds'], 1)
+
+    def test_mirror_pools_check_sync(self):
+        self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm()
+        crmc._backend = mock.MagicMock()
+        statuses = {
+            'apool': {'images': [
+                {'name': 'replaying', 'state': 'up+replaying',
+                 'description': 'replaying'},
+                {'name': 'primary', 'state': 'up+stopped',
+                 'description': 'local image is primary'}]},
+            'bpool': {'images': [
+                {'name': 'error', 'state': 'up+error',
+                 'description': 'split-brain'},
+                {'name': 'down', 'state': 'down+stopped',
+                 'description': 'stopped'}]},
+            'cpool': subprocess.CalledProcessError(1, 'rbd'),
+        }
+
+        def _mirror_pool_status(pool, verbose, cluster):
+            self.assertTrue(verbose)
+            self.assertEqual(cluster, 'remote')
+            if isinstance(statuses[pool], Exception):
+                raise statuses[pool]
+            return statuses[pool]
+
+        crmc._backend.mirror_pool_status.side_effect = _mirror_pool_status
+        outcome = crmc.mirror_pools_check_sync(
+            ['apool', 'bpool', 'cpool'], cluster='remote')
+        self.assertEqual(outcome.results, {'apool': [],
+                                           'bpool': ['down', 'error']})
+        self.assertEqual(list(outcome.errors), ['cpool'])
+
+    def test_mirror_pools_enable_snapshot(self):
+        self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
+        self.gethostname.return_value = 'ahostname'
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm(config={
+            'snapshot-schedule-interval': '15m 1d'})
+        crmc._backend = mock.MagicMock()
+        crmc.invalidate_mirror_pools_summary = mock.MagicMock()
+        crmc._backend.mirror_pool_info.return_value = {
+            'mode': 'disabled', 'peers': []}
+        crmc._backend.image_list.return_value = ['imagea', 'imageb',
+                                                 'imagec']
+        crmc._backend.mirror_pool_status.return_value = {'images': [
+            {'name': 'imageb', 'state': 'up+replaying'}]}
+        crmc._backend.mirror_snapshot_schedule_list.return_value = [
+            {'interval': '1h', 'start_time': ''},
+            {'interval': '1d', 'start_time': ''},
+        ]
+        outcome = crmc.mirror_pools_enable({'apool': 'snapshot'})
+        self.assertEqual(outcome.errors, {})
+        self.assertEqual(outcome.results, {'apool': [
+            'enable', 'peer-add', 'image-enable (2)', 'schedule-add 15m',
+            'schedule-remove 1h']})
+        crmc._backend.mirror_pool_enable.assert_called_once_with(
+            'apool', 'image')
+        crmc._backend.mirror_image_enable.assert_has_calls([
+            mock.call('apool', 'imagea', 'snapshot'),
+            mock.call('apool', 'imagec', 'snapshot'),
+        ])
+        crmc._backend.mirror_pool_status.assert_called_once_with(
+            'apool', verbose=True)
+        self.assertFalse(crmc._backend.image_info.called)
+        crmc._backend.mirror_snapshot_schedule_add.assert_called_once_with(
+            'apool', '15m')
+        crmc._backend.mirror_snapshot_schedule_remove.assert_called_once_with(
+            'apool', '1h')
+        # schedules are left alone when not configured
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm(config={})
+        crmc._backend = mock.MagicMock()
+        crmc._backend.mirror_pool_info.return_value = {
+            'mode': 'image', 'peers': [{'uuid': 'auuid'}]}
+        crmc._backend.image_list.return_value = []
+        outcome = crmc.mirror_pools_enable({'apool': 'snapshot'})
+        self.assertEqual(outcome.results, {'apool': []})
+        self.assertFalse(crmc._backend.mirror_snapshot_schedule_list.called)
+        self.assertFalse(crmc._backend.mirror_pool_status.called)
 
     def test_mirror_pool_enabled(self):
         self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
@@ -121,12 +993,30 @@ class TestCephRBDMirrorCharm(Helper):
             'peers': []}
         self.assertFalse(crmc.mirror_pool_has_peers('apool'))
 
-    def test_pools_in_broker_request(self):
-        rq = mock.MagicMock()
-        rq.api_version = 1
-        rq.ops = [{'op': 'create-pool', 'name': 'fakepool'}]
-        crmc = ceph_rbd_mirror.CephRBDMirrorCharm()
-        self.assertIn('fakepool', crmc.pools_in_broker_request(rq))
+    def test_mirror_pool_confirmed(self):
+        self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
+        self.patch_object(ceph_rbd_mirror.ch_core.unitdata, 'kv')
+        self.patch_object(ceph_rbd_mirror.time, 'time')
+        kv = {}
+        self.kv.return_value.get.side_effect = (
+            lambda key, default=None: kv.get(key, default))
+        self.kv.return_value.set.side_effect = kv.__setitem__
+        self.time.return_value = 1000
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm(
+            config={'pool-revalidate-interval': 60})
+        attrs = {'parameters': {'size': 3}}
+        self.assertFalse(crmc.mirror_pool_confirmed('apool', attrs, 'pool'))
+        crmc.mirror_pools_record({'apool': (attrs, 'pool')},
+                                 ['apool', 'bpool'])
+        self.assertTrue(crmc.mirror_pool_confirmed('apool', attrs, 'pool'))
+        self.assertFalse(crmc.mirror_pool_confirmed('apool', attrs, 'image'))
+        self.assertFalse(crmc.mirror_pool_confirmed(
+            'apool', {'parameters': {'size': 2}}, 'pool'))
+        self.assertFalse(crmc.mirror_pool_confirmed('bpool', attrs, 'pool'))
+        self.time.return_value = 1060
+        self.assertFalse(crmc.mirror_pool_confirmed('apool', attrs, 'pool'))
+        crmc.mirror_pools_record({'bpool': (attrs, 'pool')}, ['bpool'])
+        self.assertEqual(list(kv[crmc.mirrored_pools_key].keys()), ['bpool'])
 
     def test_collapse_and_filter_broker_requests(self):
         self.patch_object(ceph_rbd_mirror.ch_ceph, 'CephBrokerRq')
@@ -136,8 +1026,8 @@ class TestCephRBDMirrorCharm(Helper):
             def __init__(self):
                 self.ops = []
 
-            def add_op(self, op):
-                self.ops.append(op)
+            def set_ops(self, ops):
+                self.ops = ops
 
         self.CephBrokerRq.side_effect = FakeCephBrokerRq
 
@@ -150,6 +1040,11 @@ class TestCephRBDMirrorCharm(Helper):
                         'name': 'pool-rq0',
                         'app-name': 'rbd',
                     },
+                    {
+                        'op': 'create-pool',
+                        'app-name': 'rbd',
+                        'name': 'pool-rq0',
+                    },
                 ]
             },
             {
@@ -197,54 +1092,65 @@ class TestCephRBDMirrorCharm(Helper):
              'someotherkey': 'value'})
         self.assertTrue(len(rq.ops) == 1)
 
-    def test_pool_mirroring_mode(self):
+    def test_add_replicated_pool_ops(self):
         self.patch_object(ceph_rbd_mirror.ch_ceph, 'CephBrokerRq')
 
         class FakeCephBrokerRq(object):
-            def __init__(self, raw_request_data=None):
-                request_data = json.loads(raw_request_data)
-                self.api_version = request_data['api-version']
-                self.request_id = request_data['request-id']
-                self.set_ops(request_data['ops'])
+
+            def __init__(self):
+                self.ops = []
 
             def set_ops(self, ops):
                 self.ops = ops
 
-            def add_op(self, op):
-                self.ops.append(op)
+            def add_op_create_replicated_pool(self, name, **kwargs):
+                self.ops.append(dict(op='create-pool', name=name, **kwargs))
 
         self.CephBrokerRq.side_effect = FakeCephBrokerRq
+        crmc = ceph_rbd_mirror.CephRBDMirrorCharm()
+        rq = FakeCephBrokerRq()
+        rq.set_ops([{'op': 'create-pool', 'name': 'apool'}])
+        pools = {
+            'cpool': {'parameters': {'pg_num': '42', 'size': '3'},
+                      'quota': {'max_bytes': '1024', 'max_objects': None}},
+            'bpool': {'parameters': {}, 'quota': {}},
+        }
+        self.assertEqual(crmc.add_replicated_pool_ops(rq, pools), rq)
+        self.assertEqual(rq.ops, [
+            {'op': 'create-pool', 'name': 'apool'},
+            {'op': 'create-pool', 'name': 'bpool', 'replica_count': None,
+             'pg_num': None, 'app_name': 'rbd', 'max_bytes': None,
+             'max_objects': None},
+            {'op': 'create-pool', 'name': 'cpool', 'replica_count': 3,
+             'pg_num': 42, 'app_name': 'rbd', 'max_bytes': 1024,
+             'max_objects': None},
+        ])
+        rq = crmc.add_replicated_pool_ops(None, {'bpool': pools['bpool']})
+        self.assertEqual([op['name'] for op in rq.ops], ['bpool'])
 
-        brq1_data = json.dumps({
-            'api-version': 1,
-            'request-id': 'broker_rq1',
-            'ops': [
-                {
-                    'op': 'create-pool',
-                    'name': 'pool-rq0',
-                    'app-name': 'rbd-pool',
-                    'rbd-mirroring-mode': 'pool'
-                },
-            ]
-        })
-        brq2_data = json.dumps({
-            'api-version': 1,
-            'request-id': 'broker_rq2',
-            'ops': [
-                {
-                    'op': 'create-pool',
-                    'name': 'pool-rq1',
-                    'app-name': 'rbd-image',
-                    'rbd-mirroring-mode': 'image'
-                },
-            ]
-        })
-
-        brq1 = self.CephBrokerRq(raw_request_data=brq1_data)
-        brq2 = self.CephBrokerRq(raw_request_data=brq2_data)
-        broker_requests = [brq1, brq2, None]
+    def test_broker_request_pool_index(self):
+        rq_local = mock.MagicMock()
+        rq_local.api_version = 1
+        rq_local.ops = [
+            {'op': 'create-pool', 'name': 'apool'},
+            {'op': 'create-pool', 'name': 'bpool',
+             'rbd-mirroring-mode': 'image'},
+            {'op': 'set-key-permissions', 'name': 'cpool'},
+        ]
+        rq_remote = mock.MagicMock()
+        rq_remote.api_version = 1
+        rq_remote.ops = [
+            {'op': 'create-pool', 'name': 'bpool'},
+            {'op': 'create-pool', 'name': 'dpool',
+             'rbd-mirroring-mode': 'image'},
+        ]
         crmc = ceph_rbd_mirror.CephRBDMirrorCharm()
-        rq0 = crmc.pool_mirroring_mode('pool-rq0', broker_requests)
-        self.assertEqual('pool', rq0)
-        rq1 = crmc.pool_mirroring_mode('pool-rq1', broker_requests)
-        self.assertEqual('image', rq1)
+        self.assertDictEqual(
+            crmc.broker_request_pool_index(
+                [('local', rq_local), ('remote', rq_remote),
+                 ('other', None)]),
+            {
+                'apool': {'mode': 'pool', 'origin': 'local'},
+                'bpool': {'mode': 'image', 'origin': 'local'},
+                'dpool': {'mode': 'image', 'origin': 'remote'},
+            })
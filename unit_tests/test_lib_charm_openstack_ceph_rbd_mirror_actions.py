@@ -0,0 +1,266 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from unittest import mock
+
+import charms_openstack.test_utils as test_utils
+
+import charm.openstack.ceph_rbd_mirror_actions as rbd_actions
+
+
+class TestCephRBDMirrorActionHelpers(test_utils.PatchHelper):
+
+    def setUp(self):
+        super().setUp()
+        self.results_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.results_dir)
+        self.patch_object(rbd_actions, 'ACTION_RESULTS_DIR',
+                          new=self.results_dir)
+        self.patch_object(rbd_actions.ch_core.hookenv, 'action_uuid')
+        self.action_uuid.return_value = 'auuid'
+
+    def _read_results(self, action_name):
+        with open(os.path.join(self.results_dir,
+                               '{}-auuid.jsonl'.format(action_name))) as f:
+            return [json.loads(line) for line in f]
+
+    def test_action_results(self):
+        self.patch_object(rbd_actions.ch_core.hookenv, 'action_set')
+        with rbd_actions.ActionResults('status') as results:
+            results.add('bpool', 'bstatus')
+            results.add('apool', 'astatus')
+            results.action_set({'total': 2}, sort=True)
+        self.action_set.assert_called_once_with({
+            'output': 'apool: astatus\nbpool: bstatus',
+            'results-file': os.path.join(self.results_dir,
+                                         'status-auuid.jsonl'),
+            'count': 2,
+            'total': 2,
+        })
+        self.assertEqual(self._read_results('status'), [
+            {'key': 'bpool', 'value': 'bstatus'},
+            {'key': 'apool', 'value': 'astatus'},
+        ])
+        self.patch_object(rbd_actions, 'MAX_INLINE_OUTPUT', new=60)
+        with rbd_actions.ActionResults('status') as results:
+            results.add('apool', {'health': 'OK'})
+            self.assertEqual(results.output(as_json=True),
+                             '{"apool": {"health": "OK"}}')
+            results.add('bpool', {'health': 'OK'})
+            self.assertTrue(results.truncated)
+            self.assertIn('2 results too large', results.output())
+        self.assertEqual(len(self._read_results('status')), 2)
+
+    def test_prune_action_results(self):
+        now = time.time()
+        for n in range(5):
+            path = os.path.join(self.results_dir, 'status-{}.jsonl'.format(n))
+            with open(path, 'w'):
+                pass
+            os.utime(path, (now - n * 10, now - n * 10))
+        other = os.path.join(self.results_dir, 'README')
+        with open(other, 'w'):
+            pass
+        rbd_actions.prune_action_results(keep=3, max_age=25)
+        self.assertEqual(sorted(os.listdir(self.results_dir)),
+                         ['README', 'status-0.jsonl', 'status-1.jsonl',
+                          'status-2.jsonl'])
+        rbd_actions.prune_action_results(keep=3, max_age=15)
+        self.assertEqual(sorted(os.listdir(self.results_dir)),
+                         ['README', 'status-0.jsonl', 'status-1.jsonl'])
+        self.patch_object(rbd_actions, 'MAX_ACTION_RESULTS', new=2)
+        with rbd_actions.ActionResults('status'):
+            pass
+        self.assertEqual(sorted(os.listdir(self.results_dir)),
+                         ['README', 'status-0.jsonl', 'status-auuid.jsonl'])
+
+    def test_get_page(self):
+        self.patch_object(rbd_actions.ch_core.hookenv, 'action_get')
+        self.action_get.side_effect = [None, None]
+        self.assertEqual(rbd_actions.get_page(['c', 'a', 'b']),
+                         (['a', 'b', 'c'], 3))
+        self.action_get.side_effect = [1, 1]
+        self.assertEqual(rbd_actions.get_page(['c', 'a', 'b']), (['b'], 3))
+        self.action_get.side_effect = [2, None]
+        self.assertEqual(rbd_actions.get_page(['c', 'a', 'b']), (['c'], 3))
+
+    def test_status(self):
+        self.patch_object(rbd_actions.ch_core.hookenv, 'action_get')
+        self.patch_object(rbd_actions.ch_core.hookenv, 'action_set')
+        self.patch_object(rbd_actions.ch_core.hookenv, 'action_fail')
+        self.patch_object(rbd_actions.ch_core.unitdata, 'kv')
+        self.patch_object(rbd_actions.backend, 'local_ceph_id')
+        self.patch_object(rbd_actions.subprocess, 'check_output')
+        self.patch_object(rbd_actions.sharding, 'local_shard')
+        self.local_shard.side_effect = lambda pools: pools
+        self.local_ceph_id.return_value = 'acephid'
+        self.kv.return_value.get.return_value = None
+        self.action_get.side_effect = [None]
+        rbd_actions.status(['status'])
+        self.kv.return_value.get.assert_called_once_with(
+            'ceph-rbd-mirror.eligible-pools')
+        self.assertTrue(self.action_fail.called)
+        self.assertFalse(self.check_output.called)
+        self.kv.return_value.get.return_value = ['apool', 'bpool']
+        self.check_output.return_value = '{"summary": {"health": "OK"}}'
+        self.action_get.side_effect = [None, 1, 1, False, 'json']
+        rbd_actions.status(['status'])
+        self.local_shard.assert_called_once_with(['apool', 'bpool'])
+        self.check_output.assert_called_once_with(
+            ['rbd', '--id', 'acephid', 'mirror', 'pool', 'status',
+             '--format', 'json', 'bpool'],
+            stderr=subprocess.STDOUT,
+            universal_newlines=True, timeout=60)
+        self.assertEqual(
+            json.loads(self.action_set.call_args[0][0]['output']),
+            {'bpool': {'summary': {'health': 'OK'}}})
+        self.assertEqual(self.action_set.call_args[0][0]['total'], 2)
+        self.action_get.assert_has_calls([
+            mock.call('pools'),
+            mock.call('offset'),
+            mock.call('limit'),
+            mock.call('verbose'),
+            mock.call('format'),
+        ])
+        self.check_output.reset_mock()
+        self.check_output.return_value = 'health: OK\n'
+        self.action_get.side_effect = ['cpool', None, None, True, None]
+        rbd_actions.status(['status'])
+        self.check_output.assert_called_once_with(
+            ['rbd', '--id', 'acephid', 'mirror', 'pool', 'status',
+             '--verbose', 'cpool'],
+            stderr=subprocess.STDOUT,
+            universal_newlines=True, timeout=60)
+        self.assertEqual(self.action_set.call_args[0][0]['output'],
+                         'cpool: health: OK')
+
+    def test_hook_stats(self):
+        self.patch_object(rbd_actions.ch_core.hookenv, 'action_get')
+        self.patch_object(rbd_actions.ch_core.hookenv, 'action_set')
+        self.patch_object(rbd_actions.backend, 'read_hook_stats')
+        self.action_get.return_value = 5
+        self.read_hook_stats.return_value = [{'hook': 'update-status'}]
+        rbd_actions.hook_stats(['hook-stats'])
+        self.read_hook_stats.assert_called_once_with(5)
+        self.action_set.assert_called_once_with(
+            {'output': '[{"hook": "update-status"}]'})
+
+    def test_lag_estimates(self):
+        self.assertEqual(rbd_actions.lag_estimates({
+            'draining': [(0, 100), (5, 80), (10, 60)],
+            'growing': [(0, 10), (10, 20)],
+            'synced': [(0, 5), (10, 0)],
+            'same time': [(10, 5), (10, 5)],
+        }), {
+            'draining': {'entries-behind': 60, 'drain-rate': 4.0,
+                         'eta': 15.0},
+            'growing': {'entries-behind': 20, 'drain-rate': -1.0,
+                        'eta': None},
+            'synced': {'entries-behind': 0, 'drain-rate': 0.5, 'eta': 0.0},
+            'same time': {'entries-behind': 5, 'drain-rate': 0.0,
+                          'eta': None},
+        })
+
+    def test_readiness(self):
+        self.patch_object(rbd_actions.ch_core.hookenv, 'action_get')
+        self.patch_object(rbd_actions.ch_core.hookenv, 'action_set')
+        self.patch_object(rbd_actions.ch_core.hookenv, 'action_fail')
+        self.patch_object(rbd_actions.ch_core.hookenv, 'log')
+        self.patch_object(rbd_actions.ch_core.unitdata, 'kv')
+        self.patch_object(rbd_actions.backend, 'local_ceph_id')
+        self.patch_object(rbd_actions.backend, 'CLIBackend')
+        self.patch_object(rbd_actions.time, 'time')
+        self.patch_object(rbd_actions.time, 'sleep')
+        self.local_ceph_id.return_value = 'acephid'
+        params = {'endpoint': 'ceph-remote', 'samples': 2, 'interval': 10,
+                  'max-time-to-sync': 60, 'top': 10, 'concurrency': 1}
+        self.action_get.side_effect = params.get
+        self.kv.return_value.get.return_value = None
+        rbd_actions.readiness(['readiness'])
+        self.assertTrue(self.action_fail.called)
+        self.assertFalse(self.CLIBackend.called)
+
+        def _image(name, behind, state='up+replaying'):
+            description = 'replaying'
+            if behind is not None:
+                description += ', ' + json.dumps(
+                    {'entries_behind_primary': behind})
+            return {'name': name, 'state': state,
+                    'description': description}
+
+        samples = {
+            'apool': [
+                {'images': [_image('fast', 100), _image('snap', None)]},
+                {'images': [_image('fast', 20), _image('snap', None)]},
+            ],
+            'bpool': [
+                {'images': [_image('slow', 100), _image('synced', 0)]},
+                {'images': [_image('slow', 90), _image('synced', 0)]},
+            ],
+            'cpool': [subprocess.CalledProcessError(1, 'rbd'),
+                      {'images': []}],
+        }
+
+        def _mirror_pool_status(pool, verbose=False, cluster=None):
+            self.assertTrue(verbose)
+            self.assertEqual(cluster, 'remote')
+            result = samples[pool].pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        cli = self.CLIBackend.return_value
+        cli.mirror_pool_status.side_effect = _mirror_pool_status
+        self.time.side_effect = [0, 0, 0, 10, 10, 10, 10]
+        self.kv.return_value.get.return_value = ['cpool', 'bpool', 'apool']
+        rbd_actions.readiness(['readiness'])
+        self.CLIBackend.assert_called_once_with('acephid')
+        self.sleep.assert_called_once_with(10)
+        results = self.action_set.call_args[0][0]
+        self.assertEqual(json.loads(results['output']), {
+            'apool': {'images': 1, 'unmeasured-images': 1,
+                      'error-images': [], 'entries-behind': 20,
+                      'eta': 2.5},
+            'bpool': {'images': 2, 'unmeasured-images': 0,
+                      'error-images': [], 'entries-behind': 90,
+                      'eta': 90.0},
+            'cpool': {'error': 'mirror status unavailable'},
+        })
+        self.assertEqual(json.loads(results['worst-images']), [
+            {'pool': 'bpool', 'image': 'slow', 'entries-behind': 90,
+             'drain-rate': 1.0, 'eta': 90.0},
+            {'pool': 'apool', 'image': 'fast', 'entries-behind': 20,
+             'drain-rate': 8.0, 'eta': 2.5},
+        ])
+        self.assertEqual(results['eta'], '90.0')
+        self.assertEqual(results['failed-pools'], 1)
+        self.assertFalse(results['time-to-sync-met'])
+
+        # met when every image is estimated to catch up in time
+        samples['apool'] = [
+            {'images': [_image('fast', 100)]},
+            {'images': [_image('fast', 20)]},
+        ]
+        self.time.side_effect = [0, 10, 10]
+        params['pools'] = 'apool'
+        rbd_actions.readiness(['readiness'])
+        results = self.action_set.call_args[0][0]
+        self.assertEqual(results['eta'], '2.5')
+        self.assertTrue(results['time-to-sync-met'])
@@ -0,0 +1,776 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import datetime
+import errno
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+
+import charms_openstack.test_utils as test_utils
+
+import charm.openstack.ceph_rbd_mirror as ceph_rbd_mirror
+import charm.openstack.ceph_rbd_mirror_backend as backend
+
+
+class FakeBackend(backend.CephBackend):
+    """In-memory backend keeping pools and images in dictionaries."""
+
+    name = 'fake'
+
+    def __init__(self, ceph_id='fakeid', pools=None):
+        super().__init__(ceph_id)
+        self.pools = pools or {}
+        self.calls = collections.Counter()
+
+    def _pool(self, pool, cluster=None):
+        return self.pools[(cluster, pool)]
+
+    def mirror_pool_info(self, pool, cluster=None):
+        self.calls['info'] += 1
+        pool = self._pool(pool, cluster=cluster)
+        return {'mode': pool['mode'], 'peers': list(pool['peers'])}
+
+    def mirror_pool_status(self, pool, verbose=False, cluster=None):
+        self.calls['status'] += 1
+        pool = self._pool(pool, cluster=cluster)
+        states = collections.Counter(
+            image['state'].split('+')[1]
+            for image in pool['images'].values()
+            if image['mirroring'] != 'disabled')
+        result = {
+            'summary': {
+                'health': backend.mirror_pool_health(states),
+                'states': dict(states),
+            },
+        }
+        if verbose:
+            result['images'] = [
+                {'name': name, 'state': image['state'], 'description': ''}
+                for name, image in pool['images'].items()
+                if image['mirroring'] != 'disabled']
+        return result
+
+    def mirror_pool_enable(self, pool, mode, cluster=None):
+        self.calls['enable'] += 1
+        self._pool(pool, cluster=cluster)['mode'] = mode
+
+    def mirror_pool_peer_add(self, pool, peer, cluster=None):
+        self.calls['peer_add'] += 1
+        self._pool(pool, cluster=cluster)['peers'].append(
+            {'client_name': peer.split('@')[0],
+             'cluster_name': peer.split('@')[1]})
+
+    def image_list(self, pool, cluster=None):
+        self.calls['ls'] += 1
+        return list(self._pool(pool, cluster=cluster)['images'])
+
+    def image_info(self, pool, image, cluster=None):
+        self.calls['image_info'] += 1
+        image_data = self._pool(pool, cluster=cluster)['images'][image]
+        return {'name': image,
+                'mirroring': {'state': image_data['mirroring']}}
+
+    def image_resync(self, pool, image, cluster=None):
+        self.calls['resync'] += 1
+        return 'Flagged image for resync from primary'
+
+    def mirror_image_enable(self, pool, image, mode, cluster=None):
+        self.calls['image_enable'] += 1
+        self._pool(pool, cluster=cluster)['images'][image][
+            'mirroring'] = 'enabled'
+
+    def mirror_snapshot_schedule_list(self, pool, cluster=None):
+        return [{'interval': interval, 'start_time': ''}
+                for interval in self._pool(
+                    pool, cluster=cluster).get('schedules', [])]
+
+    def mirror_snapshot_schedule_add(self, pool, interval, cluster=None):
+        self._pool(pool, cluster=cluster).setdefault(
+            'schedules', []).append(interval)
+
+    def mirror_snapshot_schedule_remove(self, pool, interval, cluster=None):
+        self._pool(pool, cluster=cluster)['schedules'].remove(interval)
+
+
+def fake_pool(mode='disabled', peers=None, images=None):
+    return {'mode': mode, 'peers': peers or [], 'images': images or {}}
+
+
+class TestCephRBDMirrorCharmFakeBackend(test_utils.PatchHelper):
+
+    def setUp(self):
+        super().setUp()
+        self.patch_release(ceph_rbd_mirror.CephRBDMirrorCharm.release)
+        self.patch_object(ceph_rbd_mirror.socket, 'gethostname')
+        self.gethostname.return_value = 'ahostname'
+        self.backend = FakeBackend(pools={
+            (None, 'apool'): fake_pool(),
+            (None, 'bpool'): fake_pool(images={
+                'imagea': {'mirroring': 'enabled', 'state': 'up+stopped'},
+                'imageb': {'mirroring': 'enabled', 'state': 'up+error'},
+                'imagec': {'mirroring': 'disabled', 'state': ''},
+            }),
+        })
+        self.crmc = ceph_rbd_mirror.CephRBDMirrorCharm(
+            config={'status-concurrency': 2, 'status-timeout': 0})
+        self.crmc._backend = self.backend
+
+    def test_mirror_pool_configure(self):
+        self.assertFalse(self.crmc.mirror_pool_enabled('apool'))
+        self.assertFalse(self.crmc.mirror_pool_has_peers('apool'))
+        self.assertEqual(self.crmc._mirror_pool_configure('apool', 'image'),
+                         ['enable', 'peer-add'])
+        self.assertTrue(self.crmc.mirror_pool_enabled('apool', 'image'))
+        self.assertTrue(self.crmc.mirror_pool_has_peers('apool'))
+        self.assertEqual(self.backend.calls['info'], 2)
+
+    def test_mirrored_images(self):
+        self.assertEqual(self.crmc.mirrored_images('bpool'),
+                         {'imagea': 'stopped', 'imageb': 'error'})
+        self.assertEqual(self.crmc.mirrored_images('bpool', states={'error'}),
+                         {'imageb': 'error'})
+        self.assertEqual(self.backend.calls['status'], 1)
+        self.assertEqual(self.backend.calls['image_info'], 0)
+
+    def test_mirror_pools_summary(self):
+        stats = self.crmc.mirror_pools_summary(['bpool'])
+        self.assertEqual(stats['pool_health'], {'ERROR': 1})
+        self.assertEqual(stats['image_states'],
+                         {'stopped': 1, 'error': 1})
+        self.assertEqual(stats['pools'], {'bpool': {
+            'health': 'ERROR', 'states': {'stopped': 1, 'error': 1}}})
+        self.assertNotIn('images', self.crmc.mirror_pool_status('bpool'))
+        self.assertEqual(
+            len(self.crmc.mirror_pool_status('bpool', verbose=True)[
+                'images']), 2)
+        self.assertEqual(self.backend.calls['status'], 2)
+
+
+class TestBackend(test_utils.PatchHelper):
+
+    def test_mirror_pool_health(self):
+        self.assertEqual(
+            backend.mirror_pool_health({'replaying': 2, 'stopped': 1}),
+            'OK')
+        self.assertEqual(
+            backend.mirror_pool_health({'replaying': 2, 'syncing': 1}),
+            'WARNING')
+        self.assertEqual(
+            backend.mirror_pool_health({'syncing': 1, 'error': 1}),
+            'ERROR')
+        self.assertEqual(
+            backend.mirror_pool_health({'error': 0}), 'OK')
+
+    def test_image_replay_status(self):
+        self.assertEqual(
+            backend.image_replay_status({
+                'description': 'replaying, {"entries_behind_primary":3}',
+                'last_update': '2026-01-02 03:04:05',
+            }), {
+                'entries_behind_primary': 3,
+                'last_update': backend.time.mktime(
+                    (2026, 1, 2, 3, 4, 5, 0, 0, -1)),
+            })
+        self.assertEqual(
+            backend.image_replay_status({
+                'description': 'local image is primary',
+                'last_update': 'garbage',
+            }), {'entries_behind_primary': None, 'last_update': None})
+        self.assertEqual(
+            backend.image_replay_status({'description': 'replaying, {bad'}),
+            {'entries_behind_primary': None, 'last_update': None})
+
+    def test_image_in_sync(self):
+        self.assertTrue(backend.image_in_sync({
+            'state': 'up+unknown',
+            'description': 'remote image demoted'}))
+        self.assertTrue(backend.image_in_sync({
+            'state': 'up+replaying',
+            'description': 'replaying, {"entries_behind_primary":0}'}))
+        self.assertFalse(backend.image_in_sync({
+            'state': 'up+replaying',
+            'description': 'replaying, {"entries_behind_primary":3}'}))
+        # already primary, e.g. after a failed over promotion
+        self.assertTrue(backend.image_in_sync({
+            'state': 'up+stopped',
+            'description': 'local image is primary'}))
+        self.assertFalse(backend.image_in_sync({
+            'state': 'up+stopped', 'description': 'stopped'}))
+        self.assertFalse(backend.image_in_sync({
+            'state': 'up+replaying', 'description': 'replaying, {bad'}))
+        self.assertTrue(backend.image_in_sync({
+            'state': 'up+replaying',
+            'description': 'replaying, {"local_snapshot_timestamp":5,'
+                           '"remote_snapshot_timestamp":5,'
+                           '"replay_state":"idle"}'}))
+        self.assertFalse(backend.image_in_sync({
+            'state': 'up+replaying',
+            'description': 'replaying, {"local_snapshot_timestamp":4,'
+                           '"remote_snapshot_timestamp":5,'
+                           '"replay_state":"syncing"}'}))
+
+    def test_image_can_sync(self):
+        self.assertTrue(backend.image_can_sync({
+            'state': 'up+replaying',
+            'description': 'replaying, {"entries_behind_primary":3}'}))
+        self.assertTrue(backend.image_can_sync({
+            'state': 'up+syncing', 'description': 'bootstrapping'}))
+        self.assertTrue(backend.image_can_sync({
+            'state': 'up+stopped',
+            'description': 'local image is primary'}))
+        self.assertFalse(backend.image_can_sync({
+            'state': 'up+stopped', 'description': 'stopped'}))
+        self.assertFalse(backend.image_can_sync({
+            'state': 'up+error', 'description': 'split-brain'}))
+        self.assertFalse(backend.image_can_sync({
+            'state': 'down+replaying', 'description': 'replaying'}))
+
+    def test_daemon_mirror_status(self):
+        self.patch_object(backend.os.path, 'exists')
+        self.patch_object(backend.subprocess, 'check_output')
+        self.patch_object(backend, 'call_stats')
+        self.patch_object(backend.ch_core.hookenv, 'log')
+        self.exists.return_value = False
+        self.assertIsNone(backend.daemon_mirror_status('acephid'))
+        self.assertFalse(self.check_output.called)
+        self.exists.return_value = True
+        self.check_output.return_value = '{"pool_replayers": []}'
+        self.assertEqual(backend.daemon_mirror_status('acephid'),
+                         {'pool_replayers': []})
+        self.check_output.assert_called_once_with(
+            ['ceph', '--admin-daemon',
+             '/var/run/ceph/ceph-client.acephid.asok',
+             'rbd', 'mirror', 'status'],
+            universal_newlines=True, timeout=60)
+        self.check_output.side_effect = subprocess.CalledProcessError(
+            22, 'ceph')
+        self.assertIsNone(backend.daemon_mirror_status('acephid'))
+        self.check_output.side_effect = None
+        self.check_output.return_value = 'garbage'
+        self.assertIsNone(backend.daemon_mirror_status('acephid'))
+
+    def test_daemon_pools_status(self):
+        self.assertEqual(backend.daemon_pools_status({
+            'pool_replayers': [{
+                'pool': 'apool',
+                'instance_id': '4151',
+                'leader_instance_id': '4151',
+                'leader': True,
+                'instances': [],
+                'image_replayers': [
+                    {'name': 'apool/imagea', 'state': 'Replaying'},
+                    {'name': 'apool/imageb', 'state': 'Replaying'},
+                ],
+            }, {
+                'pool': 'bpool',
+                'instance_id': '4151',
+                'leader_instance_id': '4151',
+                'leader': True,
+                'instances': ['4151'],
+                'image_replayers': [
+                    {'name': 'bpool/imagea', 'state': 'Starting'},
+                    {'name': 'bpool/imageb', 'state': 'Bogus'},
+                ],
+            }, {
+                # images are shared with the daemon of another unit
+                'pool': 'cpool',
+                'instance_id': '4151',
+                'leader_instance_id': '4151',
+                'leader': True,
+                'instances': ['4152'],
+                'image_replayers': [],
+            }, {
+                'pool': 'dpool',
+                'instance_id': '4151',
+                'leader_instance_id': '4152',
+                'leader': False,
+                'image_replayers': [],
+            }, {
+                # stopped may be in error, left to the cluster query
+                'pool': 'epool',
+                'instance_id': '4151',
+                'leader_instance_id': '4151',
+                'leader': True,
+                'instances': [],
+                'image_replayers': [
+                    {'name': 'epool/imagea', 'state': 'Replaying'},
+                    {'name': 'epool/imageb', 'state': 'Stopped'},
+                ],
+            }],
+        }), {
+            'apool': {'summary': {
+                'health': 'OK',
+                'states': {'replaying': 2}}},
+            'bpool': {'summary': {
+                'health': 'WARNING',
+                'states': {'starting_replay': 1, 'unknown': 1}}},
+        })
+        self.assertEqual(backend.daemon_pools_status({}), {})
+
+    def test_get_backend(self):
+        self.patch_object(backend, 'LibradosBackend')
+        self.patch_object(backend, 'load_bindings')
+        self.LibradosBackend.name = 'librados'
+        self.load_bindings.return_value = False
+        self.assertIsInstance(backend.get_backend('aid', 'librados'),
+                              backend.CLIBackend)
+        self.assertIsInstance(backend.get_backend('aid'),
+                              backend.CLIBackend)
+        self.load_bindings.return_value = True
+        self.patch_object(backend.atexit, 'register')
+        self.assertEqual(backend.get_backend('aid', 'librados'),
+                         self.LibradosBackend())
+        self.register.assert_called_once_with(self.LibradosBackend().close)
+
+    def test_load_bindings(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        for name in ('rados', 'rbd'):
+            with open(os.path.join(tmpdir, name + '.py'), 'w') as f:
+                f.write('class Error(Exception):\n    pass\n')
+        self.patch_object(backend, 'rados', new=None)
+        self.patch_object(backend, 'rbd', new=None)
+        self.patch_object(backend, 'CEPH_ERRORS', new=())
+        self.patch_object(backend, 'BINDINGS_PATH',
+                          new=os.path.join(tmpdir, 'missing'))
+        with mock.patch.dict(sys.modules):
+            sys.modules.pop('rados', None)
+            sys.modules.pop('rbd', None)
+            self.assertFalse(backend.load_bindings())
+            self.assertIsNone(backend.rados)
+            self.patch_object(backend, 'BINDINGS_PATH', new=tmpdir)
+            self.assertTrue(backend.load_bindings())
+            self.assertEqual(backend.CEPH_ERRORS,
+                             (backend.rados.Error, backend.rbd.Error))
+            # only the bindings are imported from the system path
+            self.assertNotIn(tmpdir, sys.path)
+            self.assertTrue(backend.load_bindings())
+            self.assertEqual(len(backend.CEPH_ERRORS), 2)
+
+    def test_backend_interface(self):
+        class IncompleteBackend(backend.CephBackend):
+
+            def mirror_pool_info(self, pool, cluster=None):
+                return {}
+
+        with self.assertRaises(TypeError):
+            IncompleteBackend('aid')
+        self.assertEqual(FakeBackend(pools={}).ceph_id, 'fakeid')
+
+
+class TestCallStats(test_utils.PatchHelper):
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.stats_file = os.path.join(self.tmpdir, 'hook-stats.jsonl')
+        self.patch_object(backend, 'HOOK_STATS_FILE', new=self.stats_file)
+        self.patch_object(backend.ch_core.hookenv, 'atexit')
+        self.patch_object(backend.ch_core.hookenv, 'hook_name')
+        self.hook_name.return_value = 'update-status'
+        self.patch_object(backend.time, 'time')
+        self.time.side_effect = [0, 1, 10, 13, 20, 20.5, 100]
+        self.target = backend.CallStats()
+
+    def test_percentile(self):
+        self.assertEqual(backend.percentile([], 0.5), 0.0)
+        self.assertEqual(backend.percentile([1, 2, 3, 4], 0.5), 2)
+        self.assertEqual(backend.percentile(list(range(1, 101)), 0.95), 95)
+
+    def test_measure(self):
+        with self.target.measure('pool status', 'apool') as call:
+            call['output_size'] = 42
+        with self.assertRaises(subprocess.CalledProcessError):
+            with self.target.measure('pool status', 'bpool'):
+                raise subprocess.CalledProcessError(2, 'rbd')
+        with self.target.measure('pool info', 'apool'):
+            pass
+        self.atexit.assert_called_once_with(self.target.flush)
+        self.assertEqual(
+            [call['status'] for call in self.target.calls], [0, 2, 0])
+        self.assertEqual(self.target.summary(), {
+            'pool info': {'count': 1, 'errors': 0, 'output_bytes': 0,
+                          'total': 0.5, 'p50': 0.5, 'p95': 0.5, 'max': 0.5},
+            'pool status': {'count': 2, 'errors': 1, 'output_bytes': 42,
+                            'total': 4.0, 'p50': 1.0, 'p95': 3.0,
+                            'max': 3.0},
+        })
+
+    def test_flush(self):
+        self.target.flush()
+        self.assertFalse(os.path.exists(self.stats_file))
+        with self.target.measure('pool info', 'apool'):
+            pass
+        self.target.flush()
+        self.assertEqual(self.target.calls, [])
+        self.assertEqual(backend.read_hook_stats(10), [{
+            'timestamp': 10,
+            'hook': 'update-status',
+            'summary': {'pool info': {
+                'count': 1, 'errors': 0, 'output_bytes': 0,
+                'total': 1.0, 'p50': 1.0, 'p95': 1.0, 'max': 1.0}},
+        }])
+
+    def test_flush_rotate(self):
+        self.patch_object(backend, 'HOOK_STATS_MAX_BYTES', new=0)
+        with open(self.stats_file, 'w') as f:
+            f.write(json.dumps({'hook': 'install'}) + '\n')
+        with self.target.measure('pool info', 'apool'):
+            pass
+        self.target.flush()
+        self.assertTrue(os.path.exists(self.stats_file + '.1'))
+        self.assertEqual(
+            [entry['hook'] for entry in backend.read_hook_stats(10)],
+            ['install', 'update-status'])
+        self.assertEqual(
+            [entry['hook'] for entry in backend.read_hook_stats(1)],
+            ['update-status'])
+
+
+class TestCommandRunner(test_utils.PatchHelper):
+
+    def setUp(self):
+        super().setUp()
+        self.patch_object(backend.ch_core.hookenv, 'atexit')
+        self.patch_object(backend.ch_core.unitdata, 'kv')
+        self.patch_object(backend.time, 'sleep')
+        self.patch_object(backend, 'call_stats')
+        self.kv.return_value.get.return_value = None
+        self.target = backend.CommandRunner()
+        self.func = mock.MagicMock()
+
+    def test_parse_command_timeouts(self):
+        self.assertEqual(backend.parse_command_timeouts(None), {})
+        self.assertEqual(
+            backend.parse_command_timeouts(
+                'pool status verbose=300, image  list = 120,'),
+            {'pool status verbose': 300, 'image list': 120})
+        for value in ('pool status', 'pool status=0', '=10',
+                      'pool status=ten'):
+            with self.assertRaises(ValueError):
+                backend.parse_command_timeouts(value)
+
+    def test_configure(self):
+        self.target.configure({
+            'ceph-command-timeout': 30,
+            'ceph-command-timeouts': 'image list=90',
+            'ceph-command-retries': 0,
+            'ceph-circuit-breaker-cooldown': 600,
+        })
+        self.assertEqual(self.target.timeout_for('pool info'), 30)
+        self.assertEqual(self.target.timeout_for('image list'), 90)
+        self.assertEqual(self.target.timeout_for('pool promote'), 300)
+        self.assertEqual(self.target.retries, 0)
+        self.assertEqual(self.target.breaker.cooldown, 600)
+        self.kv.return_value.get.assert_called_once_with(
+            'ceph-rbd-mirror.circuit-breaker')
+        self.atexit.assert_called_once_with(self.target.breaker.save)
+        self.target.configure({'ceph-command-timeout': 0,
+                               'ceph-command-timeouts': 'bogus'})
+        self.assertEqual(self.target.timeout_for('pool info'), None)
+        self.assertEqual(self.target.timeouts, backend.COMMAND_TIMEOUTS)
+        self.assertEqual(self.target.retries, 2)
+        self.atexit.assert_called_once_with(self.target.breaker.save)
+
+    def test_run_retries(self):
+        self.func.side_effect = [
+            subprocess.CalledProcessError(errno.EAGAIN, 'rbd'),
+            subprocess.TimeoutExpired('rbd', 60),
+            'output',
+        ]
+        self.assertEqual(
+            self.target.run(self.func, ['rbd'], 'pool info', 'apool',
+                            universal_newlines=True),
+            'output')
+        self.func.assert_called_with(['rbd'], universal_newlines=True,
+                                     timeout=60)
+        self.assertEqual(self.func.call_count, 3)
+        self.assertEqual(self.sleep.call_count, 2)
+        for (delay,), _ in self.sleep.call_args_list:
+            self.assertTrue(0 <= delay <= backend.RETRY_MAX_BACKOFF)
+        # a timeout followed by a success resets the breaker
+        self.assertEqual(self.target.breaker.open_circuits(), {})
+        self.func.reset_mock()
+        self.func.side_effect = subprocess.CalledProcessError(
+            errno.ETIMEDOUT, 'rbd')
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.target.run(self.func, ['rbd'], 'pool info', 'apool')
+        self.assertEqual(self.func.call_count, 3)
+        # rbd timing out on its own counts towards the circuit breaker
+        self.assertEqual(list(self.target.breaker.open_circuits()), ['ceph'])
+        self.target.breaker.record_success('ceph')
+        # deterministic failures are neither retried nor counted
+        self.func.reset_mock()
+        self.sleep.reset_mock()
+        self.func.side_effect = subprocess.CalledProcessError(
+            errno.ENOENT, 'rbd')
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.target.run(self.func, ['rbd'], 'pool info', 'apool')
+        self.func.assert_called_once_with(['rbd'], timeout=60)
+        self.assertFalse(self.sleep.called)
+        self.assertEqual(self.target.breaker.open_circuits(), {})
+
+    def test_run_no_retry(self):
+        self.func.side_effect = subprocess.TimeoutExpired('rbd', 300)
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self.target.run(self.func, ['rbd'], 'pool promote', 'apool',
+                            timeout=None)
+        self.func.assert_called_once_with(['rbd'], timeout=300)
+        self.assertFalse(self.sleep.called)
+        self.func.reset_mock()
+        self.func.side_effect = None
+        self.target.run(self.func, ['rbd'], 'pool promote', 'apool',
+                        timeout=backend.NO_TIMEOUT)
+        self.func.assert_called_once_with(['rbd'], timeout=None)
+
+    def test_run_deadline(self):
+        self.patch_object(backend.time, 'time')
+        self.time.return_value = 1000
+        self.func.return_value = 'output'
+        with backend.deadline(1010):
+            with backend.deadline(1020):
+                self.target.run(self.func, ['rbd'], 'pool info', 'apool')
+        self.func.assert_called_once_with(['rbd'], timeout=10)
+        self.func.reset_mock()
+        self.target.run(self.func, ['rbd'], 'pool info', 'apool')
+        self.func.assert_called_once_with(['rbd'], timeout=60)
+        # past the deadline commands are not started and not retried
+        self.func.reset_mock()
+        with backend.deadline(990):
+            with self.assertRaises(backend.DeadlineExceeded):
+                self.target.run(self.func, ['rbd'], 'pool info', 'apool')
+        self.assertFalse(self.func.called)
+        self.func.side_effect = subprocess.TimeoutExpired('rbd', 10)
+        with backend.deadline(1010):
+            with self.assertRaises(backend.DeadlineExceeded):
+                self.target.run(self.func, ['rbd'], 'pool info', 'apool')
+        self.func.assert_called_once_with(['rbd'], timeout=10)
+        self.assertFalse(self.sleep.called)
+        # timing out on its own is not mistaken for the deadline
+        self.func.reset_mock()
+        with backend.deadline(1100):
+            with self.assertRaises(subprocess.TimeoutExpired) as cm:
+                self.target.run(self.func, ['rbd'], 'pool info', 'apool')
+        self.assertNotIsInstance(cm.exception, backend.DeadlineExceeded)
+
+    def test_circuit_breaker(self):
+        self.patch_object(backend.time, 'time')
+        self.time.return_value = 1000
+        self.func.side_effect = subprocess.TimeoutExpired('rbd', 60)
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self.target.run(self.func, ['rbd'], 'pool status', 'apool',
+                            cluster='remote')
+        self.assertEqual(self.func.call_count, 3)
+        self.assertEqual(self.target.breaker.open_circuits(),
+                         {'remote': 300})
+        self.func.reset_mock()
+        with self.assertRaises(backend.CircuitOpenError):
+            self.target.run(self.func, ['rbd'], 'pool status', 'apool',
+                            cluster='remote')
+        self.assertFalse(self.func.called)
+        # other clusters are not affected
+        self.func.side_effect = None
+        self.func.return_value = 'output'
+        self.target.run(self.func, ['rbd'], 'pool status', 'apool')
+        self.target.breaker.save()
+        self.kv.return_value.set.assert_called_once_with(
+            'ceph-rbd-mirror.circuit-breaker',
+            {'remote': {'failures': 3, 'open_until': 1300}})
+        # another timeout of the probe after the cool-down opens it again
+        self.time.return_value = 1300
+        self.func.side_effect = subprocess.TimeoutExpired('rbd', 60)
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self.target.run(self.func, ['rbd'], 'pool enable', 'apool',
+                            cluster='remote')
+        self.assertEqual(self.target.breaker.open_circuits(),
+                         {'remote': 300})
+        # state is loaded by subsequent hooks, a success closes it
+        self.kv.return_value.get.return_value = {
+            'remote': {'failures': 4, 'open_until': 1000}}
+        self.target.breaker.load()
+        self.func.side_effect = None
+        self.target.run(self.func, ['rbd'], 'pool status', 'apool',
+                        cluster='remote')
+        self.assertEqual(self.target.breaker.open_circuits(), {})
+        self.target.breaker.save()
+        self.kv.return_value.set.assert_called_with(
+            'ceph-rbd-mirror.circuit-breaker', {})
+
+
+class TestCLIBackend(test_utils.PatchHelper):
+
+    def setUp(self):
+        super().setUp()
+        self.patch_object(backend.subprocess, 'check_output')
+        self.patch_object(backend.subprocess, 'check_call')
+        self.patch_object(backend, 'runner', new=backend.CommandRunner())
+        self.target = backend.CLIBackend('acephid')
+
+    def test_mirror_pool_status(self):
+        self.check_output.return_value = '{}'
+        self.target.mirror_pool_status('apool')
+        self.check_output.assert_called_once_with(
+            ['rbd', '--id', 'acephid', 'mirror', 'pool', 'status',
+             '--format', 'json', 'apool'],
+            universal_newlines=True, timeout=60)
+        self.check_output.reset_mock()
+        self.target.mirror_pool_status('apool', verbose=True,
+                                       cluster='remote')
+        self.check_output.assert_called_once_with(
+            ['rbd', '--id', 'acephid', '--cluster', 'remote', 'mirror',
+             'pool', 'status', '--format', 'json', '--verbose', 'apool'],
+            universal_newlines=True, timeout=120)
+
+    def test_mirror_pool_enable(self):
+        self.target.mirror_pool_enable('apool', 'pool')
+        self.target.mirror_pool_peer_add('apool', 'client.acephid@remote')
+        self.check_call.assert_has_calls([
+            mock.call(['rbd', '--id', 'acephid', 'mirror', 'pool', 'enable',
+                       'apool', 'pool'], timeout=60),
+            mock.call(['rbd', '--id', 'acephid', 'mirror', 'pool', 'peer',
+                       'add', 'apool', 'client.acephid@remote'], timeout=60),
+        ])
+
+    def test_image_resync(self):
+        self.check_output.side_effect = [
+            json.dumps(['imagea']),
+            'Flagged image for resync from primary\n',
+        ]
+        self.assertEqual(self.target.image_list('apool'), ['imagea'])
+        self.assertEqual(self.target.image_resync('apool', 'imagea'),
+                         'Flagged image for resync from primary')
+        self.check_output.assert_has_calls([
+            mock.call(['rbd', '--id', 'acephid', '--format', 'json',
+                       '-p', 'apool', 'ls'], universal_newlines=True,
+                      timeout=60),
+            mock.call(['rbd', '--id', 'acephid', 'mirror', 'image', 'resync',
+                       'apool/imagea'], universal_newlines=True, timeout=60),
+        ])
+
+
+class TestCLIBackendSnapshot(test_utils.PatchHelper):
+
+    def setUp(self):
+        super().setUp()
+        self.patch_object(backend.subprocess, 'check_output')
+        self.patch_object(backend.subprocess, 'check_call')
+        self.patch_object(backend, 'runner', new=backend.CommandRunner())
+        self.target = backend.CLIBackend('acephid')
+
+    def test_mirror_image_enable(self):
+        self.target.mirror_image_enable('apool', 'imagea', 'snapshot')
+        self.check_call.assert_called_once_with(
+            ['rbd', '--id', 'acephid', 'mirror', 'image', 'enable',
+             'apool/imagea', 'snapshot'], timeout=60)
+
+    def test_mirror_snapshot_schedule(self):
+        self.check_output.return_value = (
+            '[{"interval":"1h","start_time":""}]')
+        self.assertEqual(self.target.mirror_snapshot_schedule_list('apool'),
+                         [{'interval': '1h', 'start_time': ''}])
+        self.check_output.assert_called_once_with(
+            ['rbd', '--id', 'acephid', 'mirror', 'snapshot', 'schedule',
+             'ls', '--pool', 'apool', '--format', 'json'],
+            universal_newlines=True, timeout=60)
+        self.check_output.return_value = '\n'
+        self.assertEqual(self.target.mirror_snapshot_schedule_list('apool'),
+                         [])
+        self.target.mirror_snapshot_schedule_add('apool', '15m')
+        self.target.mirror_snapshot_schedule_remove('apool', '1h')
+        self.check_call.assert_has_calls([
+            mock.call(['rbd', '--id', 'acephid', 'mirror', 'snapshot',
+                       'schedule', 'add', '--pool', 'apool', '15m'],
+                      timeout=60),
+            mock.call(['rbd', '--id', 'acephid', 'mirror', 'snapshot',
+                       'schedule', 'remove', '--pool', 'apool', '1h'],
+                      timeout=60),
+        ])
+
+
+class TestLibradosBackend(test_utils.PatchHelper):
+
+    def setUp(self):
+        super().setUp()
+        self.patch_object(backend, 'rados')
+        self.patch_object(backend, 'rbd')
+        self.patch_object(backend, 'runner', new=backend.CommandRunner())
+        self.target = backend.LibradosBackend('acephid')
+        self.ioctx = (self.rados.Rados.return_value
+                      .open_ioctx.return_value.__enter__.return_value)
+
+    def test_connection_reused(self):
+        self.rbd.RBD().mirror_mode_get.return_value = 2
+        self.rbd.RBD().mirror_peer_list.return_value = [
+            {'uuid': 'auuid', 'client_name': 'client.acephid'}]
+        self.assertEqual(
+            self.target.mirror_pool_info('apool'),
+            {'mode': 'pool',
+             'peers': [{'uuid': 'auuid', 'client_name': 'client.acephid'}]})
+        self.target.mirror_pool_info('bpool')
+        conf = {'client_mount_timeout': '60',
+                'rados_mon_op_timeout': '60',
+                'rados_osd_op_timeout': '60'}
+        self.rados.Rados.assert_called_once_with(
+            rados_id='acephid', clustername='ceph',
+            conffile='/etc/ceph/ceph.conf', conf=conf)
+        self.target.mirror_pool_info('apool', cluster='remote')
+        self.rados.Rados.assert_called_with(
+            rados_id='acephid', clustername='remote',
+            conffile='/etc/ceph/remote.conf', conf=conf)
+        self.assertEqual(self.rados.Rados().connect.call_count, 2)
+        self.target.close()
+        self.assertEqual(self.rados.Rados().shutdown.call_count, 2)
+
+    def test_mirror_pool_status(self):
+        self.rbd.RBD().mirror_image_status_summary.return_value = [
+            (4, 1), (6, 1)]
+        self.rbd.RBD().mirror_image_status_list.return_value = [{
+            'name': 'imagea',
+            'info': {'global_id': 'aglobalid'},
+            'state': 4,
+            'up': True,
+            'description': 'replaying',
+            'last_update': datetime.datetime(2026, 1, 2, 3, 4, 5),
+        }]
+        self.assertNotIn('images', self.target.mirror_pool_status('apool'))
+        self.assertFalse(self.rbd.RBD().mirror_image_status_list.called)
+        self.assertEqual(self.target.mirror_pool_status(
+            'apool', verbose=True), {
+            'summary': {
+                'health': 'OK',
+                'states': {'replaying': 1, 'stopped': 1},
+            },
+            'images': [{
+                'name': 'imagea',
+                'global_id': 'aglobalid',
+                'state': 'up+replaying',
+                'description': 'replaying',
+                'last_update': '2026-01-02 03:04:05',
+            }],
+        })
+
+    def test_mirror_pool_enable(self):
+        self.target.mirror_pool_enable('apool', 'image')
+        self.rbd.RBD().mirror_mode_set.assert_called_once_with(
+            self.ioctx, 1)
+        self.target.mirror_pool_peer_add('apool', 'client.acephid@remote')
+        self.rbd.RBD().mirror_peer_add.assert_called_once_with(
+            self.ioctx, 'remote', 'client.acephid')
@@ -0,0 +1,113 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+
+import charms_openstack.test_utils as test_utils
+
+import charm.openstack.ceph_rbd_mirror_metrics as metrics
+
+
+class TestMetrics(test_utils.PatchHelper):
+
+    def test_sample(self):
+        self.assertEqual(metrics.sample('ametric', 1), 'ametric 1')
+        self.assertEqual(
+            metrics.sample('ametric', 2, pool='apool', image='a"b\\c\n'),
+            'ametric{image="a\\"b\\\\c\\n",pool="apool"} 2')
+
+    def test_format_metrics(self):
+        self.patch_object(metrics.backend, 'image_replay_status')
+        self.image_replay_status.side_effect = [
+            {'entries_behind_primary': 3, 'last_update': 1000.0},
+            {'entries_behind_primary': None, 'last_update': None},
+        ]
+        text = metrics.format_metrics({
+            'apool': {
+                'summary': {
+                    'health': 'WARNING',
+                    'states': {'replaying': 1, 'syncing': 1},
+                },
+                'images': [{'name': 'imagea'}, {'name': 'imageb'}],
+            },
+        }, ['bpool'], 1.23456, 2000.5)
+        self.assertEqual(text.split('\n'), [
+            '# HELP ceph_rbd_mirror_pool_status_success Whether mirror '
+            'status of the pool was retrieved.',
+            '# TYPE ceph_rbd_mirror_pool_status_success gauge',
+            'ceph_rbd_mirror_pool_status_success{pool="bpool"} 0',
+            'ceph_rbd_mirror_pool_status_success{pool="apool"} 1',
+            '# HELP ceph_rbd_mirror_pool_health Mirror pool health, 0 for '
+            'OK, 1 for WARNING and 2 for ERROR.',
+            '# TYPE ceph_rbd_mirror_pool_health gauge',
+            'ceph_rbd_mirror_pool_health{pool="apool"} 1',
+            '# HELP ceph_rbd_mirror_pool_images Number of mirrored images '
+            'in the pool by state.',
+            '# TYPE ceph_rbd_mirror_pool_images gauge',
+            'ceph_rbd_mirror_pool_images{pool="apool",state="replaying"} 1',
+            'ceph_rbd_mirror_pool_images{pool="apool",state="syncing"} 1',
+            '# HELP ceph_rbd_mirror_image_entries_behind_primary Number of '
+            'journal entries the image replay is behind the primary.',
+            '# TYPE ceph_rbd_mirror_image_entries_behind_primary gauge',
+            'ceph_rbd_mirror_image_entries_behind_primary{image="imagea",'
+            'pool="apool"} 3',
+            '# HELP ceph_rbd_mirror_image_last_update_timestamp_seconds Time '
+            'the mirror daemon last updated the image status.',
+            '# TYPE ceph_rbd_mirror_image_last_update_timestamp_seconds '
+            'gauge',
+            'ceph_rbd_mirror_image_last_update_timestamp_seconds{'
+            'image="imagea",pool="apool"} 1000',
+            '# HELP ceph_rbd_mirror_exporter_duration_seconds Time taken to '
+            'collect the metrics.',
+            '# TYPE ceph_rbd_mirror_exporter_duration_seconds gauge',
+            'ceph_rbd_mirror_exporter_duration_seconds 1.235',
+            '# HELP ceph_rbd_mirror_exporter_last_run_timestamp_seconds Time '
+            'the metrics were collected.',
+            '# TYPE ceph_rbd_mirror_exporter_last_run_timestamp_seconds '
+            'gauge',
+            'ceph_rbd_mirror_exporter_last_run_timestamp_seconds 2000',
+            '',
+        ])
+
+    def test_write_textfile(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        directory = os.path.join(tmpdir, 'textfile')
+        path = metrics.write_textfile(directory, 'ametric 1\n')
+        self.assertEqual(path, os.path.join(directory, 'ceph_rbd_mirror.prom'))
+        metrics.write_textfile(directory, 'ametric 2\n')
+        with open(path) as f:
+            self.assertEqual(f.read(), 'ametric 2\n')
+        self.assertEqual(os.listdir(directory), ['ceph_rbd_mirror.prom'])
+
+    def test_replace_file(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'adir', 'afile.json')
+        metrics.replace_file(path, '{}')
+        metrics.replace_file(path, '{"a": 1}', perms=0o600)
+        with open(path) as f:
+            self.assertEqual(f.read(), '{"a": 1}')
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+        self.assertEqual(os.listdir(os.path.dirname(path)), ['afile.json'])
+        # the previous content survives a failed write
+        self.patch_object(metrics.os, 'replace')
+        self.replace.side_effect = OSError('No space left on device')
+        with self.assertRaises(OSError):
+            metrics.replace_file(path, '{"a": 2}')
+        with open(path) as f:
+            self.assertEqual(f.read(), '{"a": 1}')
+        self.assertEqual(os.listdir(os.path.dirname(path)), ['afile.json'])
@@ -0,0 +1,69 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import charms_openstack.test_utils as test_utils
+
+import charm.openstack.ceph_rbd_mirror_sharding as sharding
+
+
+class TestSharding(test_utils.PatchHelper):
+
+    def test_hash_ring(self):
+        self.assertIsNone(sharding.HashRing([]).get('apool'))
+        pools = ['pool{}'.format(i) for i in range(1000)]
+        units = ['ceph-rbd-mirror/{}'.format(i) for i in range(4)]
+        ring = sharding.HashRing(units)
+        assignment = ring.assign(pools)
+        self.assertEqual(sorted(assignment), units)
+        self.assertEqual(sum(len(p) for p in assignment.values()), 1000)
+        for unit_pools in assignment.values():
+            self.assertTrue(150 < len(unit_pools) < 350)
+        # the assignment does not depend on the order of the units
+        self.assertEqual(
+            sharding.HashRing(reversed(units)).assign(pools), assignment)
+        # removing a unit only moves the pools of that unit
+        smaller = sharding.HashRing(units[1:])
+        for pool in pools:
+            if ring.get(pool) != units[0]:
+                self.assertEqual(smaller.get(pool), ring.get(pool))
+        # adding a unit only moves pools to that unit
+        larger = sharding.HashRing(units + ['ceph-rbd-mirror/4'])
+        moved = [pool for pool in pools if larger.get(pool) != ring.get(pool)]
+        self.assertTrue(moved)
+        self.assertEqual(set(larger.get(pool) for pool in moved),
+                         set(['ceph-rbd-mirror/4']))
+
+    def test_local_shard(self):
+        self.patch_object(sharding.ch_core.hookenv, 'leader_get')
+        self.patch_object(sharding.ch_core.hookenv, 'is_leader')
+        self.patch_object(sharding.ch_core.hookenv, 'local_unit')
+        self.leader_get.return_value = None
+        self.is_leader.return_value = True
+        self.assertEqual(sharding.local_shard(['apool', 'bpool']),
+                         ['apool', 'bpool'])
+        self.is_leader.return_value = False
+        self.assertEqual(sharding.local_shard(['apool', 'bpool']), [])
+        self.leader_get.assert_called_with('pool-shard-units')
+        units = ['ceph-rbd-mirror/0', 'ceph-rbd-mirror/1']
+        self.leader_get.return_value = (
+            '["ceph-rbd-mirror/0", "ceph-rbd-mirror/1"]')
+        pools = ['pool{}'.format(i) for i in range(20)]
+        shards = []
+        for unit in units:
+            self.local_unit.return_value = unit
+            shards.append(sharding.local_shard(pools))
+        self.assertTrue(shards[0] and shards[1])
+        self.assertEqual(sorted(shards[0] + shards[1]), sorted(pools))
+        self.local_unit.return_value = 'ceph-rbd-mirror/2'
+        self.assertEqual(sharding.local_shard(pools), [])
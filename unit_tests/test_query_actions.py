@@ -0,0 +1,46 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest import mock
+import sys
+
+sys.modules['charms.layer'] = mock.MagicMock()
+import actions.query_actions as query_actions
+
+import charms_openstack.test_utils as test_utils
+
+
+class TestQueryActions(test_utils.PatchHelper):
+
+    def test_main(self):
+        self.patch_object(query_actions.rbd_actions, 'QUERY_ACTIONS')
+        self.patch_object(query_actions.ch_core.hookenv, 'action_fail')
+        self.patch_object(query_actions.ch_core.hookenv, '_run_atexit')
+        args = ['/non-existent/path/to/charm/binary/status']
+        function = mock.MagicMock()
+        self.QUERY_ACTIONS.__getitem__.return_value = function
+        query_actions.main(args)
+        function.assert_called_once_with(args)
+        self.QUERY_ACTIONS.__getitem__.side_effect = KeyError
+        self.assertEqual(query_actions.main(args),
+                         'Action status is undefined')
+        self.QUERY_ACTIONS.__getitem__.side_effect = None
+        function.side_effect = Exception('random exception')
+        query_actions.main(args)
+        self.action_fail.assert_called_once_with('random exception')
+        self.assertEqual(self._run_atexit.call_count, 2)
+
+    def test_no_reactive_bootstrap(self):
+        self.assertNotIn('reactive', vars(query_actions))
+        self.assertNotIn('charms_openstack', vars(query_actions))